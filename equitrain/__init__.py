@@ -1,9 +1,13 @@
 from .argparser import (
     ArgumentError,
+    get_args_parser_migrate,
     get_args_parser_predict,
     get_args_parser_preprocess,
     get_args_parser_train,
 )
+from .migrate import (
+    migrate,
+)
 from .model import (
     get_model,
 )
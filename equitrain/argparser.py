@@ -12,6 +12,20 @@ def str2bool(value):
         raise argparse.ArgumentTypeError('Boolean value expected.')
 
 
+def str2bytes(value):
+    """Parse a number of bytes with an optional binary suffix, e.g. `512M` or `4G`."""
+    if isinstance(value, int):
+        return value
+    suffixes = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    value = value.strip().upper().removesuffix('B')
+    try:
+        if value and value[-1] in suffixes:
+            return int(float(value[:-1]) * suffixes[value[-1]])
+        return int(float(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Number of bytes expected, got {value}.')
+
+
 def add_common_file_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
     parser.add_argument('--train-file', help='Training data', type=str, default=None)
     parser.add_argument('--valid-file', help='Validation data', type=str, default=None)
@@ -44,6 +58,75 @@ def add_common_data_args(parser: argparse.ArgumentParser) -> argparse.ArgumentPa
         action='store_true',
         default=False,
     )
+    parser.add_argument(
+        '--sampler',
+        help='Batch sampler [random (default), budget, bucketed]. The budget sampler packs structures into batches filling --batch-max-nodes/--batch-max-edges, the bucketed sampler draws batches of structures with similar sizes',
+        choices=['random', 'budget', 'bucketed'],
+        type=str,
+        default='random',
+    )
+    parser.add_argument(
+        '--compact-graphs',
+        help='Send compact graphs from data loading workers to the main process, where one-hot node attributes and position aliases are computed on first access',
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--neighbor-list-engine',
+        help='Engine for computing neighbor lists [matscipy (default), cell-list, brute-force]. The cell-list engine is implemented in NumPy, the brute-force engine has the least overhead for tiny systems',
+        choices=['matscipy', 'cell-list', 'brute-force'],
+        type=str,
+        default='matscipy',
+    )
+    parser.add_argument(
+        '--batched-neighbors',
+        help='Compute neighbor lists for whole batches on the device of the model instead of per structure in data loading workers',
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--shared-memory-store',
+        help='Load structures and neighbor lists from a store in node-local shared memory, which is built once per node and read by all processes and data loading workers',
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--shared-memory-dir',
+        help='Directory of shared memory stores, defaults to /dev/shm',
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        '--graph-cache-size',
+        help='Cache graphs in memory across epochs with the given budget in bytes per process (e.g. 4G), which is split between data loading workers. Disabled by default',
+        type=str2bytes,
+        default=None,
+    )
+    parser.add_argument(
+        '--hdf5-cache-size',
+        help='Size of the chunk cache of each HDF5 dataset in bytes (e.g. 64M, default: 1M)',
+        type=str2bytes,
+        default=None,
+    )
+    parser.add_argument(
+        '--hdf5-page-buffer-size',
+        help='Size of the page buffer in bytes for HDF5 files created with --hdf5-page-size',
+        type=str2bytes,
+        default=None,
+    )
+    parser.add_argument(
+        '--hdf5-swmr',
+        help='Open HDF5 files in single-writer multiple-reader mode, i.e. while another process appends to them',
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--workers-start-method',
+        help='Start method of data loading workers [fork, spawn, forkserver] (default: platform default)',
+        choices=['fork', 'spawn', 'forkserver'],
+        type=str,
+        default=None,
+    )
     parser.add_argument(
         '--dtype',
         help='Set default dtype [float16, float32, float64]',
@@ -63,6 +146,41 @@ def add_common_data_args(parser: argparse.ArgumentParser) -> argparse.ArgumentPa
     return parser
 
 
+def add_hdf5_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument(
+        '--hdf5-chunk-size',
+        help='Number of rows per chunk of HDF5 datasets (default: chosen by h5py)',
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        '--hdf5-compression',
+        help='Compression filter for HDF5 datasets [none (default), gzip, lzf]',
+        choices=['none', 'gzip', 'lzf'],
+        type=str,
+        default='none',
+    )
+    parser.add_argument(
+        '--hdf5-compression-level',
+        help='Compression level of the gzip filter [0-9]',
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        '--hdf5-shuffle',
+        help='Apply the shuffle filter before compression',
+        action='store_true',
+        default=False,
+    )
+    parser.add_argument(
+        '--hdf5-page-size',
+        help='Create HDF5 files with paged aggregation of file space with the given page size in bytes (e.g. 64K), which enables the page buffer when reading',
+        type=str2bytes,
+        default=None,
+    )
+    return parser
+
+
 def add_model_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
     parser.add_argument('--model', help='Path to a model file', type=str, default=None)
     parser.add_argument(
@@ -205,6 +323,7 @@ def get_args_parser(script_type: str) -> argparse.ArgumentParser:
     if script_type == 'preprocess':
         add_common_file_args(parser)
         add_common_data_args(parser)
+        add_hdf5_args(parser)
         parser.add_argument(
             '--valid-fraction',
             help='Fraction of training set for validation',
@@ -217,6 +336,12 @@ def get_args_parser(script_type: str) -> argparse.ArgumentParser:
             action='store_true',
             default=False,
         )
+        parser.add_argument(
+            '--compute-neighbors',
+            help='Compute neighbor lists for the cutoff radius and store them in the HDF5 files',
+            action='store_true',
+            default=False,
+        )
         parser.add_argument(
             '--atomic-numbers', help='List of atomic numbers', type=str, default=None
         )
@@ -226,6 +351,18 @@ def get_args_parser(script_type: str) -> argparse.ArgumentParser:
             type=str,
             default='average',
         )
+        parser.add_argument(
+            '--atomic-energies-ridge',
+            help='L2 regularization of isolated atom energies fitted with --atomic-energies average (default: 0)',
+            type=float,
+            default=0.0,
+        )
+        parser.add_argument(
+            '--atomic-energies-max-n',
+            help='Fit isolated atom energies with --atomic-energies average to this number of training structures drawn at random with --seed. All structures are used by default',
+            type=int,
+            default=None,
+        )
         parser.add_argument(
             '--r-max', help='Cutoff radius for graphs', type=float, default=4.5
         )
@@ -247,6 +384,25 @@ def get_args_parser(script_type: str) -> argparse.ArgumentParser:
             type=str,
             default='stress',
         )
+        parser.add_argument(
+            '--preprocess-workers',
+            help='Number of processes that parse xyz files, which are split into ranges of frames (default: 1)',
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            '--append',
+            help='Append xyz files to existing HDF5 files instead of skipping them. Files are identified by their contents and only added once. Statistics are updated from sums stored in the train file',
+            action='store_true',
+            default=False,
+        )
+        parser.add_argument(
+            '--xyz-reader',
+            help='Parser of extxyz files, where the fast parser leaves frames outside of the common subset of the format to ASE (default: fast)',
+            type=str,
+            choices=['fast', 'ase'],
+            default='fast',
+        )
 
     elif script_type == 'train':
         add_common_file_args(parser)
@@ -329,6 +485,38 @@ def get_args_parser(script_type: str) -> argparse.ArgumentParser:
             '--tqdm', help='Show TQDM status bar', action='store_true', default=False
         )
 
+    elif script_type == 'migrate':
+        add_hdf5_args(parser)
+        parser.add_argument(
+            '--input-file',
+            help='Equitrain data file to migrate',
+            type=str,
+            default=None,
+        )
+        parser.add_argument(
+            '--output-file', help='Migrated equitrain data file', type=str, default=None
+        )
+        parser.add_argument(
+            '--format-version',
+            help='Format version of the migrated data file (default: 2)',
+            choices=[1, 2],
+            type=int,
+            default=2,
+        )
+        parser.add_argument(
+            '--output-format',
+            help='Write an HDF5 data file or a directory of memory-mapped NumPy shards (default: hdf5)',
+            choices=['hdf5', 'npy'],
+            type=str,
+            default='hdf5',
+        )
+        parser.add_argument(
+            '--npy-shard-size',
+            help='Number of structures per shard of NumPy datasets, a single shard by default',
+            type=int,
+            default=None,
+        )
+
     elif script_type == 'predict':
         add_common_file_args(parser)
         add_common_data_args(parser)
@@ -363,6 +551,10 @@ def get_args_parser_predict() -> argparse.ArgumentParser:
     return get_args_parser('predict')
 
 
+def get_args_parser_migrate() -> argparse.ArgumentParser:
+    return get_args_parser('migrate')
+
+
 def check_args_complete(args: argparse.ArgumentParser, script_type: str):
     expected_args = set(vars(get_args_parser(script_type).parse_args([])))
     # Get the actual arguments from the Namespace
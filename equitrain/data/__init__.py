@@ -5,6 +5,7 @@ from .configuration import (
     Configuration,
 )
 from .statistics import (
+    StatisticsAccumulator,
     compute_atomic_numbers,
     compute_average_atomic_energies,
     compute_statistics,
@@ -1,6 +1,9 @@
 import ast
 from collections.abc import Iterable
 
+import numpy as np
+import torch
+
 
 class AtomicNumberTable(list):
     def __init__(self, zs: list):
@@ -25,3 +28,82 @@ class AtomicNumberTable(list):
             raise ValueError(
                 f'Observed atom type {atomic_number} that is not listed in the atomic numbers table.'
             )
+
+    def __getstate__(self):
+        # Cached lookups are rebuilt on demand, possibly on different devices
+        return {}
+
+    @property
+    def lookup(self) -> np.ndarray:
+        """Dense array mapping atomic numbers to indices, -1 for unknown elements."""
+        # The table is a list and might be modified, rebuild the lookup if so
+        zs = tuple(self)
+        if self.__dict__.get('_lookup_zs') != zs:
+            lookup = np.full(max(zs, default=0) + 1, -1, dtype=np.int64)
+            lookup[list(zs)] = np.arange(len(zs))
+
+            self._lookup_zs = zs
+            self._lookup = lookup
+            self._lookup_tensors = {}
+
+        return self._lookup
+
+    def _lookup_tensor(self, device: torch.device) -> torch.Tensor:
+        lookup = self.lookup
+        if device not in self._lookup_tensors:
+            self._lookup_tensors[device] = torch.from_numpy(lookup).to(device)
+        return self._lookup_tensors[device]
+
+    def to_indices(
+        self, atomic_numbers: np.ndarray | torch.Tensor
+    ) -> np.ndarray | torch.Tensor:
+        """Map atomic numbers to indices in this table.
+
+        Returns an array of type int64 for NumPy inputs and a tensor of type long
+        on the same device for torch inputs.
+        """
+        if isinstance(atomic_numbers, torch.Tensor):
+            if atomic_numbers.device.type == 'cpu':
+                # NumPy has less overhead for small arrays
+                return torch.from_numpy(self.to_indices(atomic_numbers.numpy()))
+
+            lookup = self._lookup_tensor(atomic_numbers.device)
+            atomic_numbers = atomic_numbers.long()
+        else:
+            lookup = self.lookup
+            atomic_numbers = np.asarray(atomic_numbers, dtype=np.int64)
+
+        if len(atomic_numbers.reshape(-1)) == 0:
+            return lookup[atomic_numbers]
+
+        # Elements exceeding the lookup are not listed in the table
+        outside = (atomic_numbers < 0) | (atomic_numbers >= len(lookup))
+        if outside.any():
+            self._raise_unknown(atomic_numbers[outside])
+
+        indices = lookup[atomic_numbers]
+
+        if indices.min() < 0:
+            self._raise_unknown(atomic_numbers[indices < 0])
+
+        return indices
+
+    def _raise_unknown(self, unknown: np.ndarray | torch.Tensor) -> None:
+        # Raises the error for elements that are not listed
+        self.z_to_index(unknown.reshape(-1)[0].item())
+
+    def to_one_hot(self, atomic_numbers: np.ndarray | torch.Tensor) -> torch.Tensor:
+        """One-hot encoding [num_atoms, len(table)] of atomic numbers, returned as
+        a tensor of the default dtype on the device of the input."""
+        indices = self.to_indices(atomic_numbers)
+        if not isinstance(indices, torch.Tensor):
+            indices = torch.from_numpy(indices)
+
+        one_hot = torch.zeros(
+            (*indices.shape, len(self)),
+            dtype=torch.get_default_dtype(),
+            device=indices.device,
+        )
+        one_hot.scatter_(dim=-1, index=indices.unsqueeze(-1), value=1)
+
+        return one_hot
@@ -0,0 +1,182 @@
+from collections import OrderedDict
+
+import torch
+from accelerate import Accelerator
+from torch_geometric.data import Data
+
+from equitrain.logger import FileLogger
+
+# Columns of the shared counters
+HITS, MISSES, EVICTIONS, BYTES = range(4)
+
+
+def graph_nbytes(graph: Data) -> int:
+    """Number of bytes of all tensors of a graph, where shared storages are
+    counted once."""
+    storages = {}
+    for value in graph.to_dict().values():
+        if torch.is_tensor(value):
+            storage = value.untyped_storage()
+            storages[storage.data_ptr()] = storage.nbytes()
+    return sum(storages.values())
+
+
+class GraphCache(torch.utils.data.Dataset):
+    """In-memory LRU cache of the graphs returned by a dataset.
+
+    The cache of each process holds at most `max_bytes` bytes, which are split
+    evenly between its `num_workers` DataLoader workers. Indices are assigned to
+    shards, one for each worker of each process, and every worker only caches the
+    indices of its own shard, so that no graph is cached twice. Use
+    `ShardedBatchSampler` to send the indices of a shard to the worker that
+    caches them.
+
+    Hits, misses, evictions and the size of the cache of each worker are counted
+    in shared memory, such that they can be logged by the main process. Cached
+    graphs are copies that own their memory, i.e. they do not keep buffers of
+    batched reads alive.
+    """
+
+    def __init__(
+        self,
+        dataset: torch.utils.data.Dataset,
+        max_bytes: int,
+        num_workers: int = 0,
+        process_index: int = 0,
+        num_processes: int = 1,
+    ):
+        self.dataset = dataset
+        self.max_bytes = max_bytes
+        self.num_workers = max(num_workers, 1)
+        self.process_index = process_index
+        self.num_shards = num_processes * self.num_workers
+
+        self.counters = torch.zeros(
+            (self.num_workers, 4), dtype=torch.int64
+        ).share_memory_()
+        self.counters_logged = torch.zeros(4, dtype=torch.int64)
+
+        self.graphs = OrderedDict()
+        self.nbytes = 0
+
+    def __getattr__(self, name):
+        # Forward attributes such as the dataset index to the wrapped dataset
+        if name == 'dataset':
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    @property
+    def worker_id(self) -> int:
+        worker_info = torch.utils.data.get_worker_info()
+        return worker_info.id if worker_info is not None else 0
+
+    @property
+    def shard(self) -> int:
+        return self.process_index * self.num_workers + self.worker_id
+
+    def owns(self, index: int) -> bool:
+        """Whether the current worker caches the given index."""
+        return index % self.num_shards == self.shard
+
+    def __getstate__(self):
+        # Workers start with an empty cache
+        d = self.__dict__.copy()
+        d['graphs'] = OrderedDict()
+        d['nbytes'] = 0
+        return d
+
+    def __getitem__(self, index):
+        return self.__getitems__([index])[0]
+
+    def __getitems__(self, indices: list[int]):
+        counters = self.counters[self.worker_id]
+
+        graphs = []
+        for index in indices:
+            entry = self.graphs.get(index)
+            if entry is not None:
+                self.graphs.move_to_end(index)
+                entry = entry[0]
+            graphs.append(entry)
+
+        missing = [index for index, graph in zip(indices, graphs) if graph is None]
+
+        counters[HITS] += len(indices) - len(missing)
+        counters[MISSES] += len(missing)
+
+        if len(missing) == 0:
+            return graphs
+
+        # Graphs that are not cached are read with a single call
+        if hasattr(self.dataset, '__getitems__'):
+            loaded = dict(zip(missing, self.dataset.__getitems__(missing)))
+        else:
+            loaded = {index: self.dataset[index] for index in missing}
+
+        for index, graph in loaded.items():
+            if self.owns(index):
+                self._insert(index, graph)
+
+        counters[BYTES] = self.nbytes
+
+        return [
+            loaded[index] if graph is None else graph
+            for index, graph in zip(indices, graphs)
+        ]
+
+    def _insert(self, index: int, graph: Data) -> None:
+        max_bytes = self.max_bytes // self.num_workers
+
+        graph = graph.clone()
+        nbytes = graph_nbytes(graph)
+
+        if nbytes > max_bytes:
+            return
+
+        while self.nbytes + nbytes > max_bytes:
+            _, (_, evicted_nbytes) = self.graphs.popitem(last=False)
+            self.nbytes -= evicted_nbytes
+            self.counters[self.worker_id, EVICTIONS] += 1
+
+        self.graphs[index] = (graph, nbytes)
+        self.nbytes += nbytes
+
+    def log(self, logger: FileLogger, accelerator: Accelerator, epoch: int, name: str):
+        """Log hits, misses and evictions since the last call and the size of the
+        cache summed over all processes, which is a collective operation that must
+        be called on all processes."""
+        counters = self.counters.sum(dim=0)
+        if accelerator is not None and accelerator.num_processes > 1:
+            counters = accelerator.reduce(counters.to(accelerator.device), 'sum')
+            counters = counters.cpu()
+
+        delta = counters - self.counters_logged
+        self.counters_logged = counters.clone()
+
+        requests = int(delta[HITS] + delta[MISSES])
+        if requests == 0:
+            return
+
+        logger.log(
+            1,
+            f'Epoch [{epoch:>4}] -- Graph cache ({name}): '
+            f'hits={int(delta[HITS])}, misses={int(delta[MISSES])}, '
+            f'hit rate={100 * int(delta[HITS]) / requests:.1f}%, '
+            f'evictions={int(delta[EVICTIONS])}, '
+            f'size={int(counters[BYTES]) / 2**20:.1f}MiB',
+        )
+
+
+def get_graph_cache(data_loader) -> GraphCache:
+    """Find the graph cache of a (possibly wrapped) data loader."""
+    if data_loader is None:
+        return None
+
+    dataset = getattr(data_loader, 'dataset', None)
+    if isinstance(dataset, GraphCache):
+        return dataset
+
+    return None
@@ -1,4 +1,20 @@
 from .dataset import (
     HDF5Dataset,
     HDF5GraphDataset,
+    migrate_hdf5,
+)
+from .index import (
+    DatasetIndex,
+    compute_index,
+)
+from .neighbors import (
+    HDF5NeighborLists,
+    compute_neighbor_lists,
+)
+from .sources import (
+    HDF5Sources,
+    file_digest,
+)
+from .writer import (
+    BufferedWriter,
 )
@@ -1,3 +1,5 @@
+import os
+from collections.abc import Iterable
 from pathlib import Path
 
 import h5py
@@ -8,23 +10,175 @@ from equitrain.data import AtomicNumberTable
 from equitrain.data.configuration import CachedCalc
 from equitrain.data.graphs import AtomsToGraphs
 
+from .index import DatasetIndex
+from .neighbors import HDF5NeighborLists
+from .utility import read_offsets, read_ranges
+from .writer import BufferedWriter
+
 
 class HDF5Dataset:
     # ! check whether this can be pushed to repo
     MAGIC_STRING = 'ZVNjaWVuY2UgRXF1aXRyYWlu'
 
-    def __init__(self, filename: Path | str, mode: str = 'r'):
-        filename = Path(filename)
+    # Version 1 stores each structure as a compound record with variable
+    # length fields, version 2 stores all fields column-wise where per-atom
+    # arrays are concatenated and indexed by `offsets` (CSR layout)
+    FORMAT_VERSION = 2
+
+    # Per-atom columns of the version 2 layout
+    ATOM_COLUMNS = {
+        'atomic_numbers': (np.int32, ()),
+        'positions': (np.float64, (3,)),
+        'forces': (np.float64, (3,)),
+    }
+    # Per-structure columns of the version 2 layout
+    STRUCTURE_COLUMNS = {
+        'cell': (np.float64, (3, 3)),
+        'pbc': (np.bool_, (3,)),
+        'energy': (np.float64, ()),
+        'stress': (np.float64, (6,)),
+        'virials': (np.float64, (3, 3)),
+        'dipole': (np.float64, (3,)),
+        'energy_weight': (np.float32, ()),
+        'forces_weight': (np.float32, ()),
+        'stress_weight': (np.float32, ()),
+        'virials_weight': (np.float32, ()),
+        'dipole_weight': (np.float32, ()),
+    }
+
+    def __init__(
+        self,
+        filename: Path | str,
+        mode: str = 'r',
+        *,
+        format_version: int = FORMAT_VERSION,
+        chunk_size: int = None,
+        compression: str = None,
+        compression_level: int = None,
+        shuffle: bool = False,
+        page_size: int = None,
+        rdcc_nbytes: int = None,
+        page_buf_size: int = None,
+        swmr: bool = False,
+    ):
+        """Open an equitrain data file or create a new one.
+
+        The chunking and compression options only apply when a new file is
+        created. `chunk_size` is the number of rows per chunk along the first
+        dimension of each dataset, i.e. structures or atoms. Chunk sizes are
+        chosen by h5py if not specified. New files are created with paged file
+        space aggregation if a `page_size` in bytes is given.
+
+        The remaining options are passed to h5py whenever the file is opened:
+        `rdcc_nbytes` is the size of the chunk cache of each dataset in bytes,
+        `page_buf_size` the size of the page buffer for files created with a
+        `page_size`, and `swmr` reads a file while another process appends to it.
+
+        The file handle belongs to the process that opened it. Other processes,
+        i.e. DataLoader workers started by fork or spawn, reopen the file on first
+        access.
+        """
+        self.filename = Path(filename)
+
+        if compression == 'none':
+            compression = None
+
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.compression_level = compression_level
+        self.shuffle = shuffle
+
+        # Options of h5py.File, which apply whenever the file is opened
+        self.driver_options = {}
+        if rdcc_nbytes is not None:
+            self.driver_options['rdcc_nbytes'] = rdcc_nbytes
+        if page_buf_size is not None:
+            self.driver_options['page_buf_size'] = page_buf_size
+        if swmr:
+            self.driver_options['swmr'] = True
 
-        if filename.exists():
-            self.file = h5py.File(filename, mode)
+        self._index = None
+
+        if self.filename.exists() and mode != 'w':
+            self._file = h5py.File(self.filename, mode, **self.driver_options)
+            self._pid = os.getpid()
             self.check_magic()
+            self.format_version = self.read_format_version()
+            self.open_columns()
         else:
-            self.file = h5py.File(filename, mode)
+            if format_version not in (1, 2):
+                raise ValueError(f'Invalid HDF5 format version: {format_version}')
+
+            create_options = {}
+            if page_size is not None:
+                create_options = dict(fs_strategy='page', fs_page_size=page_size)
+
+            self._file = h5py.File(
+                self.filename, mode, **create_options, **self.driver_options
+            )
+            self._pid = os.getpid()
+            self.format_version = format_version
             self.write_magic()
             self.create_dataset()
+            self.open_columns()
+
+        # Reopening must not truncate or create the file again
+        self.mode = 'r' if mode == 'r' else 'r+'
+
+    @property
+    def file(self) -> h5py.File:
+        """The h5py file, which is reopened if it was opened by another process."""
+        self.ensure_open()
+        return self._file
+
+    @property
+    def columns(self) -> dict[str, h5py.Dataset] | None:
+        """Datasets of the version 2 layout, None for version 1 files."""
+        self.ensure_open()
+        return self._columns
+
+    def ensure_open(self):
+        """Reopen the file if it is closed or was opened by another process."""
+        if self._file is None or self._pid != os.getpid():
+            self.reopen()
+
+    def reopen(self):
+        """Open the file in the current process.
+
+        Handles inherited from a parent process are dropped instead of being
+        used, since HDF5 does not support sharing open files between processes.
+        """
+        self._file = h5py.File(self.filename, self.mode, **self.driver_options)
+        self._pid = os.getpid()
+        self.open_columns()
+
+    def open_columns(self):
+        # Looking up datasets by name is expensive in h5py, keep
+        # references to all columns of the version 2 layout
+        if self.format_version == 1:
+            self._columns = None
+        else:
+            self._columns = {
+                name: self._file[name]
+                for name in ['offsets', *self.ATOM_COLUMNS, *self.STRUCTURE_COLUMNS]
+            }
+
+    def dataset_options(self, shape: tuple = ()) -> dict:
+        """Chunking and compression options for a new dataset with rows of `shape`."""
+        return dict(
+            chunks=(self.chunk_size, *shape) if self.chunk_size is not None else True,
+            compression=self.compression,
+            compression_opts=self.compression_level,
+            shuffle=self.shuffle,
+        )
 
     def create_dataset(self):
+        if self.format_version == 1:
+            self._create_dataset_v1()
+        else:
+            self._create_dataset_v2()
+
+    def _create_dataset_v1(self):
         atom_dtype = np.dtype(
             [
                 ('atomic_numbers', h5py.special_dtype(vlen=np.int32)),
@@ -43,13 +197,32 @@ class HDF5Dataset:
                 ('dipole_weight', np.float32),
             ]
         )
-        # There are some parameters that should be accessible through
-        # command-line options, i.e. chunking and compression
         self.file.create_dataset(
             'atoms',
             shape=(0,),  # Initially empty
             maxshape=(None,),  # Extendable along the first dimension
             dtype=atom_dtype,
+            **self.dataset_options(),
+        )
+
+    def _create_dataset_v2(self):
+        for name, (dtype, shape) in (
+            self.ATOM_COLUMNS | self.STRUCTURE_COLUMNS
+        ).items():
+            self.file.create_dataset(
+                name,
+                shape=(0, *shape),
+                maxshape=(None, *shape),
+                dtype=dtype,
+                **self.dataset_options(shape),
+            )
+        # Offsets of each structure into the per-atom columns, the last entry
+        # always holds the total number of atoms
+        self.file.create_dataset(
+            'offsets',
+            data=np.zeros(1, dtype=np.int64),
+            maxshape=(None,),
+            **self.dataset_options(),
         )
 
     def open(self, filename: Path | str, mode: str = 'r'):
@@ -58,7 +231,9 @@ class HDF5Dataset:
 
     def close(self):
         """Manually close the dataset file."""
-        self.file.close()
+        if self._file is not None and self._pid == os.getpid():
+            self._file.close()
+        self._file = None
 
     def __enter__(self):
         """Enter the runtime context."""
@@ -78,58 +253,243 @@ class HDF5Dataset:
 
     def __getstate__(self):
         d = dict(self.__dict__)
-        # An opened h5py.File cannot be pickled, so we must exclude it from the state
-        d['file'] = None
+        # An opened h5py.File cannot be pickled, so we must exclude it from the
+        # state. The file is reopened on first access after unpickling
+        d['_file'] = None
+        d['_columns'] = None
+        d['_index'] = None
         return d
 
     def __len__(self):
-        if 'atoms' not in self.file:
-            raise RuntimeError("Dataset 'atoms' does not exist")
-        return self.file['atoms'].shape[0]
+        if self.format_version == 1:
+            if 'atoms' not in self.file:
+                raise RuntimeError("Dataset 'atoms' does not exist")
+            return self.file['atoms'].shape[0]
+        else:
+            return self.columns['offsets'].shape[0] - 1
 
     def __getitem__(self, i: int) -> Atoms:
-        entry = self.file['atoms'][i]
-        num_atoms = len(entry['positions']) // 3
-        atoms = Atoms(
-            numbers=entry['atomic_numbers'],
-            positions=entry['positions'].reshape((num_atoms, 3)),
-            cell=entry['cell'],
-            pbc=entry['pbc'],
-        )
-        atoms.calc = CachedCalc(
-            entry['energy'], entry['forces'].reshape((num_atoms, 3)), entry['stress']
-        )
-        atoms.info['virials'] = entry['virials']
-        atoms.info['dipole'] = entry['dipole']
-        atoms.info['energy_weight'] = entry['energy_weight']
-        atoms.info['forces_weight'] = entry['forces_weight']
-        atoms.info['stress_weight'] = entry['stress_weight']
-        atoms.info['virials_weight'] = entry['virials_weight']
-        atoms.info['dipole_weight'] = entry['dipole_weight']
-        return atoms
+        return self.record_to_atoms(self.read_record(i))
 
     def __setitem__(self, i: int, atoms: Atoms) -> None:
+        self.write_record(i, self.atoms_to_record(atoms))
+
+    @property
+    def index(self) -> DatasetIndex:
+        """Per-structure metadata stored in the file, None if it was not computed."""
+        if self._index is None:
+            self._index = DatasetIndex.load(self.file)
+
+            if self._index is not None:
+                self._index.validate(len(self))
+
+        return self._index
+
+    def writer(self, buffer_size: int = 4096) -> BufferedWriter:
+        """Return a writer that appends structures in large chunks."""
+        return BufferedWriter(self, buffer_size=buffer_size)
+
+    def extend(self, atoms_iterable: Iterable[Atoms], buffer_size: int = 4096) -> int:
+        """Append all structures from an iterable and return the number appended."""
+        with self.writer(buffer_size=buffer_size) as writer:
+            n = len(writer)
+            for atoms in atoms_iterable:
+                writer.append(atoms)
+
+            return len(writer) - n
+
+    def read_record(self, i: int) -> dict[str, np.ndarray]:
+        """Read the raw fields of structure `i` as a dictionary of numpy arrays."""
+        if self.format_version == 1:
+            return self._read_record_v1(i)
+        else:
+            return self._read_record_v2(i)
+
+    def read_records(
+        self, indices: list[int], columns: list[str] = None
+    ) -> list[dict[str, np.ndarray]]:
+        """Read the raw fields of multiple structures with a single selection per field.
+
+        Indices are sorted and deduplicated before reading, records are
+        returned in the order of `indices`. If `columns` is given, records only
+        hold these fields, and other columns are not read from version 2 files.
+        """
+        # Negative indices count from the end, the caller's array is not modified
+        indices = np.asarray(indices, dtype=np.int64)
+        indices = np.where(indices < 0, indices + len(self), indices)
+
+        unique, inverse = np.unique(indices, return_inverse=True)
+
+        if self.format_version == 1:
+            records = self._read_records_v1(unique)
+            if columns is not None:
+                records = [{name: r[name] for name in columns} for r in records]
+        else:
+            records = self._read_records_v2(unique, columns)
+
+        return [records[j] for j in inverse]
+
+    def write_record(self, i: int, record: dict[str, np.ndarray]) -> None:
+        """Write raw fields of a structure, as returned by `read_record`, at index `i`."""
+        if self.format_version == 1:
+            self._write_record_v1(i, record)
+        else:
+            self._write_record_v2(i, record)
+
+    def _read_record_v1(self, i: int) -> dict[str, np.ndarray]:
+        entry = self.file['atoms'][i]
+        num_atoms = len(entry['atomic_numbers'])
+
+        record = {name: entry[name] for name in entry.dtype.names}
+        record['positions'] = record['positions'].reshape((num_atoms, 3))
+        record['forces'] = record['forces'].reshape((num_atoms, 3))
+
+        return record
+
+    def _read_records_v1(self, indices: np.ndarray) -> list[dict[str, np.ndarray]]:
+        # h5py requires increasing indices for fancy indexing
+        entries = self.file['atoms'][indices]
+
+        records = []
+        for entry in entries:
+            num_atoms = len(entry['atomic_numbers'])
+
+            record = {name: entry[name] for name in entries.dtype.names}
+            record['positions'] = record['positions'].reshape((num_atoms, 3))
+            record['forces'] = record['forces'].reshape((num_atoms, 3))
+            records.append(record)
+
+        return records
+
+    def _write_record_v1(self, i: int, record: dict[str, np.ndarray]) -> None:
         dataset = self.file['atoms']
         # Extend dataset if necessary
         if i >= len(dataset):
             dataset.resize(i + 1, axis=0)
 
         dataset[i] = (
-            atoms.get_atomic_numbers().astype(np.int32),
-            atoms.get_positions().flatten().astype(np.float64),
-            atoms.get_cell().astype(np.float64),
-            atoms.get_pbc().astype(np.bool_),
-            np.float64(atoms.get_potential_energy()),
-            atoms.get_forces().flatten().astype(np.float64),
-            atoms.get_stress().astype(np.float64),
-            atoms.info['virials'].astype(np.float64),
-            atoms.info['dipole'].astype(np.float64),
-            np.float32(atoms.info.get('energy_weight', 1.0)),
-            np.float32(atoms.info.get('forces_weight', 1.0)),
-            np.float32(atoms.info.get('stress_weight', 1.0)),
-            np.float32(atoms.info.get('virials_weight', 1.0)),
-            np.float32(atoms.info.get('dipole_weight', 1.0)),
+            record['atomic_numbers'],
+            record['positions'].flatten(),
+            record['cell'],
+            record['pbc'],
+            record['energy'],
+            record['forces'].flatten(),
+            record['stress'],
+            record['virials'],
+            record['dipole'],
+            record['energy_weight'],
+            record['forces_weight'],
+            record['stress_weight'],
+            record['virials_weight'],
+            record['dipole_weight'],
+        )
+
+    def _read_record_v2(self, i: int) -> dict[str, np.ndarray]:
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(f'Index {i} is out of range')
+        start, end = self.columns['offsets'][i : i + 2]
+
+        record = {name: self.columns[name][start:end] for name in self.ATOM_COLUMNS}
+        record |= {name: self.columns[name][i] for name in self.STRUCTURE_COLUMNS}
+
+        return record
+
+    def _read_records_v2(
+        self, indices: np.ndarray, columns: list[str] = None
+    ) -> list[dict[str, np.ndarray]]:
+        if columns is None:
+            columns = [*self.ATOM_COLUMNS, *self.STRUCTURE_COLUMNS]
+
+        starts, ends = read_offsets(self.columns['offsets'], indices)
+        # Split points of the concatenated per-atom arrays
+        splits = np.cumsum(ends - starts)[:-1]
+
+        atom_columns = {
+            name: np.split(read_ranges(self.columns[name], starts, ends), splits)
+            for name in self.ATOM_COLUMNS
+            if name in columns
+        }
+        structure_columns = {
+            name: read_ranges(self.columns[name], indices, indices + 1)
+            for name in self.STRUCTURE_COLUMNS
+            if name in columns
+        }
+
+        return [
+            {name: column[j] for name, column in atom_columns.items()}
+            | {name: column[j] for name, column in structure_columns.items()}
+            for j in range(len(indices))
+        ]
+
+    def _write_record_v2(self, i: int, record: dict[str, np.ndarray]) -> None:
+        offsets = self.columns['offsets']
+        num_structures = offsets.shape[0] - 1
+        num_atoms = len(record['atomic_numbers'])
+
+        if i < num_structures:
+            # Structures can only be replaced in-place by structures of equal size
+            start, end = offsets[i : i + 2]
+            if end - start != num_atoms:
+                raise ValueError(
+                    f'Cannot replace structure {i} with a structure of different size'
+                )
+        elif i == num_structures:
+            start = offsets[i]
+            end = start + num_atoms
+            offsets.resize(i + 2, axis=0)
+            offsets[i + 1] = end
+            for name in self.ATOM_COLUMNS:
+                self.columns[name].resize(end, axis=0)
+            for name in self.STRUCTURE_COLUMNS:
+                self.columns[name].resize(i + 1, axis=0)
+        else:
+            raise IndexError(
+                f'Cannot write structure {i}, format version 2 only supports appending'
+            )
+
+        for name in self.ATOM_COLUMNS:
+            self.columns[name][start:end] = record[name]
+        for name in self.STRUCTURE_COLUMNS:
+            self.columns[name][i] = record[name]
+
+    @staticmethod
+    def atoms_to_record(atoms: Atoms) -> dict[str, np.ndarray]:
+        return {
+            'atomic_numbers': atoms.get_atomic_numbers().astype(np.int32),
+            'positions': atoms.get_positions().astype(np.float64),
+            'cell': atoms.get_cell().astype(np.float64),
+            'pbc': atoms.get_pbc().astype(np.bool_),
+            'energy': np.float64(atoms.get_potential_energy()),
+            'forces': atoms.get_forces().astype(np.float64),
+            'stress': atoms.get_stress().astype(np.float64),
+            'virials': atoms.info['virials'].astype(np.float64),
+            'dipole': atoms.info['dipole'].astype(np.float64),
+            'energy_weight': np.float32(atoms.info.get('energy_weight', 1.0)),
+            'forces_weight': np.float32(atoms.info.get('forces_weight', 1.0)),
+            'stress_weight': np.float32(atoms.info.get('stress_weight', 1.0)),
+            'virials_weight': np.float32(atoms.info.get('virials_weight', 1.0)),
+            'dipole_weight': np.float32(atoms.info.get('dipole_weight', 1.0)),
+        }
+
+    @staticmethod
+    def record_to_atoms(record: dict[str, np.ndarray]) -> Atoms:
+        atoms = Atoms(
+            numbers=record['atomic_numbers'],
+            positions=record['positions'],
+            cell=record['cell'],
+            pbc=record['pbc'],
         )
+        atoms.calc = CachedCalc(record['energy'], record['forces'], record['stress'])
+        atoms.info['virials'] = record['virials']
+        atoms.info['dipole'] = record['dipole']
+        atoms.info['energy_weight'] = record['energy_weight']
+        atoms.info['forces_weight'] = record['forces_weight']
+        atoms.info['stress_weight'] = record['stress_weight']
+        atoms.info['virials_weight'] = record['virials_weight']
+        atoms.info['dipole_weight'] = record['dipole_weight']
+        return atoms
 
     def check_magic(self):
         try:
@@ -143,6 +503,20 @@ class HDF5Dataset:
     def write_magic(self):
         grp = self.file.create_group('MAGIC')
         grp['MAGIC_STRING'] = write_value(self.MAGIC_STRING)
+        grp['FORMAT_VERSION'] = self.format_version
+
+    def read_format_version(self) -> int:
+        # Files written before the format was versioned do not
+        # carry a version number
+        grp = self.file['MAGIC']
+        if 'FORMAT_VERSION' not in grp:
+            return 1
+
+        format_version = int(grp['FORMAT_VERSION'][()])
+        if format_version not in (1, 2):
+            raise OSError(f'Unsupported equitrain data format version {format_version}')
+
+        return format_version
 
 
 def write_value(value):
@@ -154,30 +528,129 @@ def unpack_value(value):
     return None if str(value) == 'None' else value
 
 
+def migrate_hdf5(
+    filename_input: Path | str,
+    filename_output: Path | str,
+    format_version: int = HDF5Dataset.FORMAT_VERSION,
+    batch_size: int = 4096,
+    **kwargs,
+) -> int:
+    """Copy an equitrain data file into a new file with the given format version.
+
+    Additional keyword arguments, i.e. chunking and compression options,
+    are passed to the `HDF5Dataset` of the new file.
+    """
+    with (
+        HDF5Dataset(filename_input) as dataset_input,
+        HDF5Dataset(
+            filename_output, 'w', format_version=format_version, **kwargs
+        ) as dataset_output,
+        dataset_output.writer(buffer_size=batch_size) as writer,
+    ):
+        for start in range(0, len(dataset_input), batch_size):
+            indices = range(start, min(start + batch_size, len(dataset_input)))
+            for record in dataset_input.read_records(indices):
+                writer.append_record(record)
+
+        return len(dataset_input)
+
+
 class HDF5GraphDataset(HDF5Dataset):
     def __init__(
         self,
         filename: Path | str,
         r_max: float,
         atomic_numbers: AtomicNumberTable,
+        *,
+        compact: bool = False,
+        neighbor_list_engine: str = None,
+        r_edges: bool = True,
         **kwargs,
     ):
+        """Dataset of graphs, see `AtomsToGraphs` for the graph schema. Compact
+        graphs omit attributes that are derived on first access, which reduces the
+        data sent from DataLoader workers to the main process. Neighbors that are
+        not stored in the file are computed with the given neighbor list engine,
+        see `get_neighbor_list_engine`. Without `r_edges`, graphs are returned
+        without edges, which are computed for collated batches by `RadiusGraph`."""
+        # Required to open neighbor lists along with the file
+        self.r_max = r_max
+        self.r_edges = r_edges
+
         super().__init__(filename, mode='r', **kwargs)
 
         # TODO: Allow users to control what data is returned (i.e. forces, stress)
         self.converter = AtomsToGraphs(
             atomic_numbers,
-            r_edges=True,
+            r_edges=r_edges,
             r_energy=True,
             r_forces=True,
             r_stress=True,
             r_pbc=True,
             radius=r_max,
+            compact=compact,
+            neighbor_list_engine=neighbor_list_engine,
         )
 
+        if self.neighbor_lists is not None:
+            self.neighbor_lists.validate(len(self))
+
+    def open_columns(self):
+        super().open_columns()
+
+        # Use precomputed neighbor lists if available for this cutoff radius
+        self._neighbor_lists = None
+        if self.r_edges:
+            self._neighbor_lists = HDF5NeighborLists.open(self._file, self.r_max)
+
+    @property
+    def neighbor_lists(self) -> HDF5NeighborLists | None:
+        """Stored neighbor lists for `r_max`, None if they are computed."""
+        self.ensure_open()
+        return self._neighbor_lists
+
+    def __getstate__(self):
+        d = super().__getstate__()
+        d['_neighbor_lists'] = None
+        return d
+
     def __getitem__(self, index):
-        atoms = super().__getitem__(index)
-        graph = self.converter.convert(atoms)
+        # Graphs are built from the raw fields without an intermediate ase.Atoms
+        record = self.read_record(index)
+
+        if self.neighbor_lists is None:
+            edge_index, unit_shifts = None, None
+        else:
+            edge_index, unit_shifts = self.neighbor_lists.read([index % len(self)])[0]
+
+        graph = self.converter.convert_record(record, edge_index, unit_shifts)
         graph.idx = index
 
         return graph
+
+    def __getitems__(self, indices: list[int]):
+        """Read a batch of structures at once and convert them to graphs.
+
+        Used by the torch DataLoader to fetch all indices of a batch
+        with a single read per field.
+        """
+        records = self.read_records(indices)
+
+        if self.neighbor_lists is None:
+            neighbors = [(None, None)] * len(records)
+        else:
+            unique, inverse = np.unique(
+                np.asarray(indices, dtype=np.int64) % len(self), return_inverse=True
+            )
+            neighbors = self.neighbor_lists.read(unique)
+            neighbors = [neighbors[j] for j in inverse]
+
+        graphs = []
+        for index, record, (edge_index, unit_shifts) in zip(
+            indices, records, neighbors
+        ):
+            graph = self.converter.convert_record(record, edge_index, unit_shifts)
+            graph.idx = index
+            graphs.append(graph)
+
+        return graphs
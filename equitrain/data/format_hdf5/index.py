@@ -0,0 +1,311 @@
+import h5py
+import numpy as np
+
+from equitrain.data.graphs.neighborhood import get_neighborhood
+
+from .neighbors import HDF5NeighborLists
+
+# Number of 64-bit words of the element bitmask, covering atomic numbers 0-127
+ELEMENT_WORDS = 2
+
+
+def elements_to_mask(atomic_numbers) -> np.ndarray:
+    """Encode a set of atomic numbers as bitmask of `ELEMENT_WORDS` words."""
+    atomic_numbers = np.unique(np.asarray(atomic_numbers, dtype=np.int64))
+
+    if np.any(atomic_numbers < 0) or np.any(atomic_numbers >= 64 * ELEMENT_WORDS):
+        raise ValueError('Atomic numbers must be in the range [0, 128)')
+
+    mask = np.zeros(ELEMENT_WORDS, dtype=np.uint64)
+    np.bitwise_or.at(
+        mask,
+        atomic_numbers // 64,
+        np.left_shift(np.uint64(1), (atomic_numbers % 64).astype(np.uint64)),
+    )
+    return mask
+
+
+def mask_to_elements(mask: np.ndarray) -> list[int]:
+    """Decode a bitmask of `ELEMENT_WORDS` words into sorted atomic numbers."""
+    return [
+        64 * word + bit
+        for word in range(ELEMENT_WORDS)
+        for bit in range(64)
+        if (int(mask[word]) >> bit) & 1
+    ]
+
+
+class DatasetIndex:
+    """Per-structure metadata of a dataset held in NumPy arrays.
+
+    The index stores the number of atoms, the number of edges for the cutoff
+    radius `r_max`, a bitmask of the contained elements and the energy of each
+    structure. It allows samplers, statistics and filters to operate on all
+    structures with vectorized operations without reading or converting them.
+    Edge counts are only available if the index was computed with a cutoff
+    radius, otherwise `num_edges` and `r_max` are None.
+    """
+
+    GROUP = 'index'
+
+    def __init__(
+        self,
+        num_atoms: np.ndarray,
+        elements: np.ndarray,
+        energy: np.ndarray,
+        num_edges: np.ndarray = None,
+        r_max: float = None,
+    ):
+        self.num_atoms = np.asarray(num_atoms, dtype=np.int64)
+        self.elements = np.asarray(elements, dtype=np.uint64).reshape(-1, ELEMENT_WORDS)
+        self.energy = np.asarray(energy, dtype=np.float64)
+        self.num_edges = (
+            np.asarray(num_edges, dtype=np.int64) if num_edges is not None else None
+        )
+        self.r_max = float(r_max) if r_max is not None else None
+
+    def __len__(self):
+        return len(self.num_atoms)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(structures={len(self)}, '
+            f'atoms={self.num_atoms.sum()}, r_max={self.r_max})'
+        )
+
+    def has_edges(self, r_max: float) -> bool:
+        """Whether edge counts are available for cutoff radius `r_max`."""
+        return self.num_edges is not None and np.isclose(
+            self.r_max, r_max, rtol=1e-6, atol=0.0
+        )
+
+    def atomic_numbers(self) -> list[int]:
+        """Sorted atomic numbers of all elements occurring in the dataset."""
+        return mask_to_elements(np.bitwise_or.reduce(self.elements, axis=0))
+
+    def contains_any(self, atomic_numbers) -> np.ndarray:
+        """Boolean mask of structures containing at least one of the given elements."""
+        mask = elements_to_mask(atomic_numbers)
+        return np.any(self.elements & mask, axis=1)
+
+    def contains_only(self, atomic_numbers) -> np.ndarray:
+        """Boolean mask of structures consisting only of the given elements."""
+        mask = elements_to_mask(atomic_numbers)
+        return np.all((self.elements & ~mask) == 0, axis=1)
+
+    @classmethod
+    def load(cls, file: h5py.File) -> 'DatasetIndex':
+        """Load the index stored in `file` or return None if there is none."""
+        if cls.GROUP not in file:
+            return None
+
+        group = file[cls.GROUP]
+        r_max = group.attrs.get('r_max')
+
+        return cls(
+            num_atoms=group['num_atoms'][()],
+            elements=group['elements'][()],
+            energy=group['energy'][()],
+            num_edges=group['num_edges'][()] if 'num_edges' in group else None,
+            r_max=r_max,
+        )
+
+    def save(self, file: h5py.File) -> None:
+        """Store the index in `file`, replacing an existing one."""
+        if self.GROUP in file:
+            del file[self.GROUP]
+
+        group = file.create_group(self.GROUP)
+        group.create_dataset('num_atoms', data=self.num_atoms.astype(np.int32))
+        group.create_dataset('elements', data=self.elements)
+        group.create_dataset('energy', data=self.energy)
+
+        if self.num_edges is not None:
+            group.create_dataset('num_edges', data=self.num_edges)
+            group.attrs['r_max'] = self.r_max
+
+    @classmethod
+    def from_arrays(
+        cls,
+        num_atoms: np.ndarray,
+        atomic_numbers: np.ndarray,
+        energy: np.ndarray,
+        num_edges: np.ndarray = None,
+        r_max: float = None,
+    ) -> 'DatasetIndex':
+        """Index of structures given by their number of atoms, the concatenated
+        atomic numbers of all their atoms and their energies. Edge counts for the
+        cutoff radius `r_max` are given by `num_edges`."""
+        num_atoms = np.asarray(num_atoms, dtype=np.int64)
+        atomic_numbers = np.asarray(atomic_numbers, dtype=np.int64)
+        elements = np.zeros((len(num_atoms), ELEMENT_WORDS), dtype=np.uint64)
+
+        if np.any(atomic_numbers < 0) or np.any(atomic_numbers >= 64 * ELEMENT_WORDS):
+            raise ValueError('Atomic numbers must be in the range [0, 128)')
+
+        # Unique elements of each structure, which are set in its bitmask
+        keys = np.unique(
+            np.repeat(np.arange(len(num_atoms)), num_atoms) * 64 * ELEMENT_WORDS
+            + atomic_numbers
+        )
+        structure, z = np.divmod(keys, 64 * ELEMENT_WORDS)
+        np.bitwise_or.at(
+            elements,
+            (structure, z // 64),
+            np.left_shift(np.uint64(1), (z % 64).astype(np.uint64)),
+        )
+
+        return cls(num_atoms, elements, energy, num_edges=num_edges, r_max=r_max)
+
+    @classmethod
+    def from_records(
+        cls,
+        records: list[dict[str, np.ndarray]],
+        num_edges: np.ndarray = None,
+        r_max: float = None,
+    ) -> 'DatasetIndex':
+        """Index of structures given by their raw fields, see `read_record`, of
+        which only atomic numbers and energies are used. Edge counts for the
+        cutoff radius `r_max` are given by `num_edges`."""
+        return cls.from_arrays(
+            [len(r['atomic_numbers']) for r in records],
+            np.concatenate(
+                [np.zeros(0, dtype=np.int64)] + [r['atomic_numbers'] for r in records]
+            ),
+            np.array([r['energy'] for r in records], dtype=np.float64),
+            num_edges=num_edges,
+            r_max=r_max,
+        )
+
+    @classmethod
+    def from_dataset(
+        cls,
+        dataset,
+        r_max: float = None,
+        batch_size: int = 1024,
+        engine: str = None,
+        start: int = 0,
+    ) -> 'DatasetIndex':
+        """Compute the index of all structures in an `HDF5Dataset` or a dataset
+        with the same `read_records`, or of the structures from `start` on.
+
+        Edge counts are taken from stored neighbor lists for `r_max` if
+        available and computed for structures not covered by them. No edge
+        counts are computed if `r_max` is None.
+        """
+        num_edges = None
+        num_stored = start
+
+        if r_max is not None:
+            num_edges = np.zeros(len(dataset) - start, dtype=np.int64)
+            # Datasets of other formats, e.g. NumPy shards, have no stored
+            # neighbor lists for other cutoff radii
+            neighbor_lists = None
+            if getattr(dataset, 'file', None) is not None:
+                neighbor_lists = HDF5NeighborLists.open(dataset.file, r_max)
+
+            if neighbor_lists is not None and len(neighbor_lists) > start:
+                if len(neighbor_lists) > len(dataset):
+                    neighbor_lists.validate(len(dataset))
+
+                num_stored = len(neighbor_lists)
+                num_edges[: num_stored - start] = np.diff(
+                    neighbor_lists.edge_offsets[start:]
+                )
+
+        parts = [cls.from_records([])]
+
+        for batch_start in range(start, len(dataset), batch_size):
+            batch_end = min(batch_start + batch_size, len(dataset))
+
+            # Positions are only read for structures without stored edges
+            columns = ['atomic_numbers', 'energy']
+            if r_max is not None and batch_end > num_stored:
+                columns += ['positions', 'pbc', 'cell']
+
+            records = dataset.read_records(range(batch_start, batch_end), columns)
+
+            for i, record in enumerate(records, batch_start):
+                if i >= num_stored and r_max is not None:
+                    edge_index, _, _, _ = get_neighborhood(
+                        record['positions'],
+                        r_max,
+                        record['pbc'],
+                        record['cell'].copy(),
+                        engine=engine,
+                    )
+                    num_edges[i - start] = edge_index.shape[1]
+
+            parts.append(cls.from_records(records))
+
+        return cls(
+            np.concatenate([part.num_atoms for part in parts]),
+            np.concatenate([part.elements for part in parts]),
+            np.concatenate([part.energy for part in parts]),
+            num_edges=num_edges,
+            r_max=r_max,
+        )
+
+    def concatenate(self, *others: 'DatasetIndex') -> 'DatasetIndex':
+        """Index of the structures of this index followed by those of `others`,
+        which must have edge counts for the same cutoff radius."""
+        indices = [self, *others]
+
+        num_edges = None
+        if self.num_edges is not None:
+            num_edges = np.concatenate([index.num_edges for index in indices])
+
+        return DatasetIndex(
+            np.concatenate([index.num_atoms for index in indices]),
+            np.concatenate([index.elements for index in indices]),
+            np.concatenate([index.energy for index in indices]),
+            num_edges=num_edges,
+            r_max=self.r_max,
+        )
+
+    def validate(self, num_structures: int) -> None:
+        if len(self) != num_structures:
+            raise RuntimeError(
+                f'Dataset index covers {len(self)} structures, '
+                f'but the dataset contains {num_structures}. Please recompute it.'
+            )
+
+
+def compute_index(
+    dataset,
+    r_max: float = None,
+    batch_size: int = 1024,
+    engine: str = None,
+    append: bool = False,
+) -> DatasetIndex:
+    """Compute the index of all structures in an `HDF5Dataset` and store it in
+    the same file, which must be opened for writing.
+
+    With `append`, an existing index with edge counts for `r_max` is extended by
+    the structures appended to the dataset since it was computed.
+    """
+    index = DatasetIndex.load(dataset.file) if append else None
+
+    # Edge counts of appended structures must be for the same cutoff radius
+    if (
+        index is not None
+        and len(index) <= len(dataset)
+        and (index.has_edges(r_max) if r_max is not None else index.num_edges is None)
+    ):
+        index = index.concatenate(
+            DatasetIndex.from_dataset(
+                dataset,
+                r_max=r_max,
+                batch_size=batch_size,
+                engine=engine,
+                start=len(index),
+            )
+        )
+    else:
+        index = DatasetIndex.from_dataset(
+            dataset, r_max=r_max, batch_size=batch_size, engine=engine
+        )
+
+    index.save(dataset.file)
+
+    return index
@@ -0,0 +1,188 @@
+import h5py
+import numpy as np
+
+from equitrain.data.graphs.neighborhood import get_neighborhood
+
+from .utility import read_offsets, read_ranges, reserve
+
+
+class HDF5NeighborLists:
+    """Neighbor lists for a fixed cutoff radius stored in an equitrain data file.
+
+    Edges of all structures are concatenated and indexed by `edge_offsets`
+    (CSR layout). Each group in `neighbors` holds the neighbor lists of one
+    cutoff radius, which is stored as attribute `r_max`.
+    """
+
+    GROUP = 'neighbors'
+
+    def __init__(self, group: h5py.Group):
+        self.group = group
+        self.r_max = float(group.attrs['r_max'])
+        self.edge_offsets = group['edge_offsets']
+        self.edge_index = group['edge_index']
+        self.unit_shifts = group['unit_shifts']
+
+    def __len__(self):
+        return self.edge_offsets.shape[0] - 1
+
+    @classmethod
+    def key(cls, r_max: float) -> str:
+        return f'{cls.GROUP}/r_max={float(r_max)!r}'
+
+    @classmethod
+    def open(cls, file: h5py.File, r_max: float) -> 'HDF5NeighborLists':
+        """Open neighbor lists matching `r_max` or return None if there are none."""
+        if cls.GROUP not in file:
+            return None
+
+        for group in file[cls.GROUP].values():
+            if np.isclose(group.attrs['r_max'], r_max, rtol=1e-6, atol=0.0):
+                return cls(group)
+
+        return None
+
+    @classmethod
+    def create(
+        cls, file: h5py.File, r_max: float, dataset_options: dict = None
+    ) -> 'HDF5NeighborLists':
+        """Create empty neighbor lists for `r_max`, replacing existing ones."""
+        if dataset_options is None:
+            dataset_options = dict(chunks=True)
+
+        key = cls.key(r_max)
+        if key in file:
+            del file[key]
+
+        group = file.create_group(key)
+        group.attrs['r_max'] = float(r_max)
+        group.create_dataset(
+            'edge_offsets',
+            data=np.zeros(1, dtype=np.int64),
+            maxshape=(None,),
+            **dataset_options,
+        )
+        # Atom indices are local to each structure
+        group.create_dataset(
+            'edge_index',
+            shape=(0, 2),
+            maxshape=(None, 2),
+            dtype=np.int32,
+            **dict(dataset_options, chunks=_chunks(dataset_options, (2,))),
+        )
+        group.create_dataset(
+            'unit_shifts',
+            shape=(0, 3),
+            maxshape=(None, 3),
+            dtype=np.int8,
+            **dict(dataset_options, chunks=_chunks(dataset_options, (3,))),
+        )
+
+        return cls(group)
+
+    def validate(self, num_structures: int) -> None:
+        if len(self) != num_structures:
+            raise RuntimeError(
+                f'Neighbor lists for r_max={self.r_max} cover {len(self)} structures, '
+                f'but the dataset contains {num_structures}. Please recompute them.'
+            )
+
+    def read(self, indices: np.ndarray) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Read edge index [2, n_edges] and unit shifts [n_edges, 3] of structures.
+
+        Indices must be sorted in increasing order without duplicates.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+
+        starts, ends = read_offsets(self.edge_offsets, indices)
+        splits = np.cumsum(ends - starts)[:-1]
+
+        edge_index = np.split(read_ranges(self.edge_index, starts, ends), splits)
+        unit_shifts = np.split(read_ranges(self.unit_shifts, starts, ends), splits)
+
+        return [(e.T, s) for e, s in zip(edge_index, unit_shifts)]
+
+    def append(self, neighbors: list[tuple[np.ndarray, np.ndarray]]) -> None:
+        """Append edge index [2, n_edges] and unit shifts [n_edges, 3] of structures."""
+        if len(neighbors) == 0:
+            return
+
+        start = len(self)
+        end = start + len(neighbors)
+
+        num_edges = self.edge_offsets[start]
+        offsets = num_edges + np.cumsum(
+            [edge_index.shape[1] for edge_index, _ in neighbors], dtype=np.int64
+        )
+
+        edge_index = np.concatenate([edge_index.T for edge_index, _ in neighbors])
+        unit_shifts = np.concatenate([unit_shifts for _, unit_shifts in neighbors])
+
+        if np.any(np.abs(unit_shifts) > np.iinfo(np.int8).max):
+            raise ValueError('Unit shifts exceed the range of stored neighbor lists')
+
+        self.edge_offsets.resize(end + 1, axis=0)
+        self.edge_offsets[start + 1 : end + 1] = offsets
+
+        reserve(self.edge_index, offsets[-1])
+        reserve(self.unit_shifts, offsets[-1])
+        self.edge_index[num_edges : offsets[-1]] = edge_index
+        self.unit_shifts[num_edges : offsets[-1]] = unit_shifts
+
+    def trim(self) -> None:
+        """Trim edge datasets to their final size after appending."""
+        num_edges = self.edge_offsets[-1]
+        self.edge_index.resize(num_edges, axis=0)
+        self.unit_shifts.resize(num_edges, axis=0)
+
+
+def _chunks(dataset_options: dict, shape: tuple):
+    chunks = dataset_options.get('chunks', True)
+    if chunks is True or chunks is None:
+        return chunks
+    return (chunks[0], *shape)
+
+
+def compute_neighbor_lists(
+    dataset,
+    r_max: float,
+    batch_size: int = 1024,
+    engine: str = None,
+    append: bool = False,
+) -> HDF5NeighborLists:
+    """Compute neighbor lists of all structures in an `HDF5Dataset` and store
+    them in the same file, which must be opened for writing.
+
+    With `append`, existing neighbor lists for `r_max` are extended by the
+    structures appended to the dataset since they were computed.
+    """
+    neighbor_lists = None
+    if append:
+        neighbor_lists = HDF5NeighborLists.open(dataset.file, r_max)
+
+    if neighbor_lists is None or len(neighbor_lists) > len(dataset):
+        neighbor_lists = HDF5NeighborLists.create(
+            dataset.file, r_max, dataset_options=dataset.dataset_options()
+        )
+
+    for start in range(len(neighbor_lists), len(dataset), batch_size):
+        records = dataset.read_records(
+            range(start, min(start + batch_size, len(dataset)))
+        )
+
+        neighbors = []
+        for record in records:
+            edge_index, _, unit_shifts, _ = get_neighborhood(
+                record['positions'],
+                r_max,
+                record['pbc'],
+                record['cell'].copy(),
+                engine=engine,
+            )
+            neighbors.append((edge_index, unit_shifts))
+
+        neighbor_lists.append(neighbors)
+
+    neighbor_lists.trim()
+
+    return neighbor_lists
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import h5py
+
+
+def file_digest(filename: Path | str, block_size: int = 1 << 24) -> str:
+    """SHA-256 digest of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+class HDF5Sources:
+    """Input files whose structures were written to an equitrain data file.
+
+    Each source covers a contiguous range of structures and is identified by the
+    digest of its contents, so that a file is ingested once even if it is moved
+    or renamed. Atomic numbers and energies of isolated atoms found in a source
+    are stored as well, since isolated atoms are not written to the data file.
+    `num_structures` is the number of structures of the data file covered by
+    sources, which is updated after all structures of a source are written.
+    Structures written before sources were recorded are not covered by any source.
+    """
+
+    GROUP = 'sources'
+
+    def __init__(self, sources: list[dict] = None, num_structures: int = 0):
+        self.sources = [] if sources is None else sources
+        self.num_structures = num_structures
+
+    def __len__(self):
+        return len(self.sources)
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}(sources={len(self)}, '
+            f'structures={self.num_structures})'
+        )
+
+    def find(self, digest: str) -> dict | None:
+        """Return the source with the given digest or None if it was not ingested."""
+        for source in self.sources:
+            if source['sha256'] == digest:
+                return source
+        return None
+
+    def add(
+        self,
+        filename: Path | str,
+        digest: str,
+        start: int,
+        num_structures: int,
+        *,
+        atomic_numbers: list[int] = None,
+        atomic_energies: dict[int, float] = None,
+    ) -> None:
+        """Record a source covering structures `start` to `start + num_structures`."""
+        self.sources.append(
+            dict(
+                filename=os.path.abspath(filename),
+                sha256=digest,
+                start=int(start),
+                num_structures=int(num_structures),
+                atomic_numbers=(
+                    None if atomic_numbers is None else [int(z) for z in atomic_numbers]
+                ),
+                atomic_energies=(
+                    None
+                    if atomic_energies is None
+                    else {int(z): float(e) for z, e in atomic_energies.items()}
+                ),
+            )
+        )
+        self.num_structures = max(self.num_structures, int(start + num_structures))
+
+    def atomic_numbers(self) -> list[int]:
+        """Sorted atomic numbers found in all sources, including isolated atoms."""
+        z_set = set()
+        for source in self.sources:
+            z_set.update(source['atomic_numbers'] or [])
+
+        return sorted(z_set)
+
+    def atomic_energies(self) -> dict[int, float]:
+        """Energies of isolated atoms of all sources, later sources take precedence."""
+        atomic_energies = {}
+        for source in self.sources:
+            atomic_energies.update(source['atomic_energies'] or {})
+
+        return atomic_energies
+
+    @classmethod
+    def load(cls, file: h5py.File) -> 'HDF5Sources':
+        """Load the sources stored in `file` or return None if there are none."""
+        if cls.GROUP not in file:
+            return None
+
+        group = file[cls.GROUP]
+        sources = [json.loads(entry) for entry in group['entries'].asstr()[()]]
+        for source in sources:
+            # JSON keys are strings
+            if source['atomic_energies'] is not None:
+                source['atomic_energies'] = {
+                    int(z): e for z, e in source['atomic_energies'].items()
+                }
+
+        return cls(sources, num_structures=int(group.attrs['num_structures']))
+
+    def save(self, file: h5py.File) -> None:
+        """Store the sources in `file`, replacing existing ones."""
+        if self.GROUP in file:
+            del file[self.GROUP]
+
+        group = file.create_group(self.GROUP)
+        group.create_dataset(
+            'entries',
+            data=[json.dumps(source) for source in self.sources],
+            dtype=h5py.string_dtype(),
+        )
+        group.attrs['num_structures'] = self.num_structures
+
+    def validate(self, num_structures: int) -> None:
+        if self.num_structures != num_structures:
+            raise RuntimeError(
+                f'Sources cover {self.num_structures} structures, but the dataset '
+                f'contains {num_structures}. Appending to the file was interrupted, '
+                'please convert it again.'
+            )
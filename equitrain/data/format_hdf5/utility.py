@@ -0,0 +1,81 @@
+import h5py
+import numpy as np
+
+# Ranges spanning at most this number of bytes are read as one contiguous
+# block, which is much cheaper than building a hyperslab selection
+READ_BLOCK_BYTES = 1 << 20
+
+
+def read_ranges(
+    dataset: h5py.Dataset, starts: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    """Read rows `[starts[k], ends[k])` of a dataset with a single selection.
+
+    Ranges must be sorted in increasing order and must not overlap. Rows are
+    returned concatenated along the first axis.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    shape = dataset.shape[1:]
+    counts = ends - starts
+    total = counts.sum()
+
+    if total == 0:
+        return np.empty((0, *shape), dtype=dataset.dtype)
+
+    span = ends[-1] - starts[0]
+    if span * dataset.dtype.itemsize * np.prod(shape, dtype=int) <= READ_BLOCK_BYTES:
+        block = dataset[starts[0] : ends[-1]]
+        if span == total:
+            return block
+        # Position of each requested row within the block
+        rows = np.repeat(starts - starts[0] - np.cumsum(counts) + counts, counts)
+        return block[rows + np.arange(total)]
+
+    # Merge adjacent ranges, so that contiguous structures are
+    # selected as a single hyperslab
+    non_empty = counts > 0
+    starts = starts[non_empty]
+    ends = ends[non_empty]
+
+    block_first = np.ones(len(starts), dtype=bool)
+    block_first[1:] = starts[1:] != ends[:-1]
+    block_last = np.append(block_first[1:], True)
+
+    fspace = dataset.id.get_space()
+    fspace.select_none()
+    for start, end in zip(starts[block_first], ends[block_last]):
+        fspace.select_hyperslab(
+            (start, *(0 for _ in shape)),
+            (end - start, *shape),
+            op=h5py.h5s.SELECT_OR,
+        )
+
+    result = np.empty((total, *shape), dtype=dataset.dtype)
+    dataset.id.read(h5py.h5s.create_simple(result.shape), fspace, result)
+
+    return result
+
+
+def read_offsets(
+    offsets: h5py.Dataset, indices: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Read start and end offsets of the given rows of a CSR offsets dataset.
+
+    Indices must be sorted in increasing order without duplicates.
+    """
+    # Read offsets of all rows and their successors with a single selection
+    points = np.union1d(indices, indices + 1)
+    values = read_ranges(offsets, points, points + 1)
+
+    starts = values[np.searchsorted(points, indices)]
+    ends = values[np.searchsorted(points, indices + 1)]
+
+    return starts, ends
+
+
+def reserve(dataset: h5py.Dataset, size: int) -> None:
+    """Grow a resizable dataset geometrically to hold at least `size` rows."""
+    if dataset.shape[0] < size:
+        dataset.resize(max(size, 2 * dataset.shape[0]), axis=0)
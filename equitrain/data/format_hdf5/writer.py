@@ -0,0 +1,115 @@
+import h5py
+import numpy as np
+from ase import Atoms
+
+from .utility import reserve
+
+
+class BufferedWriter:
+    """Append structures to an `HDF5Dataset` in large chunks.
+
+    Structures are collected in memory and written with a single write per
+    field once `buffer_size` structures are buffered. Datasets grow
+    geometrically while writing and are trimmed to their final size when
+    the writer is closed, so the file must not be read before closing.
+    """
+
+    def __init__(self, dataset, buffer_size: int = 4096):
+        self.dataset = dataset
+        self.buffer_size = buffer_size
+        self.records = []
+
+        self.num_structures = len(dataset)
+
+        if dataset.format_version == 1:
+            self.num_atoms = None
+        else:
+            self.num_atoms = int(dataset.columns['offsets'][self.num_structures])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.num_structures + len(self.records)
+
+    def append(self, atoms: Atoms) -> None:
+        self.append_record(self.dataset.atoms_to_record(atoms))
+
+    def append_record(self, record: dict[str, np.ndarray]) -> None:
+        self.records.append(record)
+
+        if len(self.records) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered structures to the file."""
+        if len(self.records) == 0:
+            return
+
+        if self.dataset.format_version == 1:
+            self._flush_v1()
+        else:
+            self._flush_v2()
+
+        self.num_structures += len(self.records)
+        self.records = []
+
+    def close(self) -> None:
+        """Flush remaining structures and trim datasets to their final size."""
+        self.flush()
+
+        if self.dataset.format_version == 1:
+            self.dataset.file['atoms'].resize(self.num_structures, axis=0)
+        else:
+            columns = self.dataset.columns
+            columns['offsets'].resize(self.num_structures + 1, axis=0)
+            for name in self.dataset.ATOM_COLUMNS:
+                columns[name].resize(self.num_atoms, axis=0)
+            for name in self.dataset.STRUCTURE_COLUMNS:
+                columns[name].resize(self.num_structures, axis=0)
+
+    def _flush_v1(self):
+        dataset = self.dataset.file['atoms']
+
+        entries = np.empty(len(self.records), dtype=dataset.dtype)
+        for name in dataset.dtype.names:
+            if h5py.check_vlen_dtype(dataset.dtype[name]) is not None:
+                for j, record in enumerate(self.records):
+                    entries[name][j] = record[name].flatten()
+            else:
+                entries[name] = np.stack([record[name] for record in self.records])
+
+        start = self.num_structures
+        end = start + len(self.records)
+
+        reserve(dataset, end)
+        dataset[start:end] = entries
+
+    def _flush_v2(self):
+        columns = self.dataset.columns
+
+        start = self.num_structures
+        end = start + len(self.records)
+
+        sizes = [len(record['atomic_numbers']) for record in self.records]
+        offsets = self.num_atoms + np.cumsum(sizes, dtype=np.int64)
+
+        reserve(columns['offsets'], end + 1)
+        columns['offsets'][start + 1 : end + 1] = offsets
+
+        for name in self.dataset.ATOM_COLUMNS:
+            reserve(columns[name], offsets[-1])
+            columns[name][self.num_atoms : offsets[-1]] = np.concatenate(
+                [record[name] for record in self.records]
+            )
+
+        for name in self.dataset.STRUCTURE_COLUMNS:
+            reserve(columns[name], end)
+            columns[name][start:end] = np.stack(
+                [record[name] for record in self.records]
+            )
+
+        self.num_atoms = int(offsets[-1])
@@ -0,0 +1,10 @@
+from .dataset import (
+    NumpyDataset,
+    NumpyGraphDataset,
+    convert_to_npy,
+    migrate_npy,
+    open_dataset,
+)
+from .writer import (
+    NumpyWriter,
+)
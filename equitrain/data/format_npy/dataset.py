@@ -0,0 +1,341 @@
+import json
+from pathlib import Path
+
+import numpy as np
+from ase import Atoms
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_hdf5 import DatasetIndex, HDF5Dataset, HDF5NeighborLists
+from equitrain.data.format_hdf5.index import ELEMENT_WORDS
+from equitrain.data.graphs import AtomsToGraphs
+from equitrain.data.graphs.neighborhood import get_neighborhood
+
+from .writer import (
+    ATOM_COLUMNS,
+    EDGE_COLUMNS,
+    FORMAT,
+    FORMAT_VERSION,
+    META,
+    OFFSET_COLUMNS,
+    STRUCTURE_COLUMNS,
+    NumpyWriter,
+)
+
+
+class NumpyShard:
+    """Columns of a shard mapped into memory, see `NumpyDataset`."""
+
+    def __init__(self, path: Path, has_edges: bool):
+        columns = OFFSET_COLUMNS | ATOM_COLUMNS | STRUCTURE_COLUMNS
+        if has_edges:
+            columns |= EDGE_COLUMNS
+        else:
+            columns.pop('edge_offsets')
+
+        # Copy-on-write mappings return writable arrays without modifying files
+        self.arrays = {
+            name: np.load(path / f'{name}.npy', mmap_mode='c') for name in columns
+        }
+
+    def __len__(self):
+        return len(self.arrays['offsets']) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def read_record(self, i: int) -> dict[str, np.ndarray]:
+        start, end = self.arrays['offsets'][i : i + 2]
+
+        record = {name: self.arrays[name][start:end] for name in ATOM_COLUMNS}
+        record |= {name: self.arrays[name][i] for name in STRUCTURE_COLUMNS}
+
+        return record
+
+    def read_neighbors(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.arrays['edge_offsets'][i : i + 2]
+
+        edge_index = self.arrays['edge_index'][start:end].T
+        unit_shifts = self.arrays['unit_shifts'][start:end]
+
+        return edge_index, unit_shifts
+
+
+class NumpyDataset:
+    """Dataset of structures stored as NumPy arrays in a directory of shards.
+
+    Each shard is a subdirectory with one `.npy` file per column, where per-atom
+    columns (`positions.npy`, `forces.npy`, ...) are concatenated and indexed by
+    `offsets.npy`, and per-structure columns (`energy.npy`, `cell.npy`, ...) hold
+    one row per structure, as in version 2 HDF5 files. Shards may additionally
+    hold neighbor lists for the cutoff radius `r_max`, which are indexed by
+    `edge_offsets.npy`. The file `meta.json` lists all shards.
+
+    Columns are memory-mapped, such that reading a structure returns views of
+    the mapped files without copies and without locks. Unlike h5py files,
+    datasets can be used from forked and spawned processes, where pickling a
+    dataset maps the same files again instead of copying their contents.
+    """
+
+    META = META
+
+    def __init__(self, path: Path | str):
+        self.path = Path(path)
+
+        with open(self.path / META) as f:
+            self.meta = json.load(f)
+
+        if self.meta.get('format') != FORMAT:
+            raise OSError(f'{self.path} is not an equitrain NumPy dataset')
+        if self.meta['format_version'] != FORMAT_VERSION:
+            raise OSError(
+                f'Unsupported equitrain NumPy format version {self.meta["format_version"]}'
+            )
+
+        self.r_max = self.meta['r_max']
+
+        self._index = None
+        self._open_shards()
+
+    def _open_shards(self) -> None:
+        self.shards = [
+            NumpyShard(self.path / shard['path'], has_edges=self.r_max is not None)
+            for shard in self.meta['shards']
+        ]
+        # Index of the first structure of each shard
+        self.shard_offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __getstate__(self):
+        # Files are mapped again instead of pickling their contents
+        d = dict(self.__dict__)
+        d['shards'] = None
+        d['_index'] = None
+        return d
+
+    def __setstate__(self, d):
+        self.__dict__.update(d)
+        self._open_shards()
+
+    def close(self):
+        """Mapped files are closed once all arrays are released."""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return int(self.shard_offsets[-1])
+
+    def __getitem__(self, i: int) -> Atoms:
+        return HDF5Dataset.record_to_atoms(self.read_record(i))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of all mapped arrays in bytes."""
+        return sum(shard.nbytes for shard in self.shards)
+
+    def _locate(self, i: int) -> tuple[NumpyShard, int]:
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(f'Index {i} is out of range')
+
+        k = int(np.searchsorted(self.shard_offsets, i, side='right')) - 1
+
+        return self.shards[k], i - int(self.shard_offsets[k])
+
+    def read_record(self, i: int) -> dict[str, np.ndarray]:
+        """Views of the raw fields of structure `i`, as returned by
+        `HDF5Dataset.read_record`."""
+        shard, j = self._locate(int(i))
+        return shard.read_record(j)
+
+    def read_records(
+        self, indices: list[int], columns: list[str] = None
+    ) -> list[dict[str, np.ndarray]]:
+        records = [self.read_record(i) for i in indices]
+        if columns is not None:
+            records = [{name: r[name] for name in columns} for r in records]
+        return records
+
+    def has_neighbors(self, r_max: float) -> bool:
+        """Whether neighbor lists are stored for cutoff radius `r_max`."""
+        return self.r_max is not None and np.isclose(
+            self.r_max, r_max, rtol=1e-6, atol=0.0
+        )
+
+    def read_neighbors(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        """Views of the stored edge index [2, n_edges] and unit shifts
+        [n_edges, 3] of structure `i`."""
+        shard, j = self._locate(int(i))
+        return shard.read_neighbors(j)
+
+    @property
+    def index(self) -> DatasetIndex:
+        """Per-structure metadata computed from the mapped arrays."""
+        if self._index is None:
+            self._index = self.compute_index()
+        return self._index
+
+    def compute_index(self) -> DatasetIndex:
+        """Index of all structures, which is computed for one shard at a time."""
+        if len(self.shards) == 0:
+            return DatasetIndex(
+                np.zeros(0), np.zeros((0, ELEMENT_WORDS)), np.zeros(0), r_max=None
+            )
+
+        indices = [
+            DatasetIndex.from_arrays(
+                np.diff(shard.arrays['offsets']),
+                shard.arrays['atomic_numbers'],
+                shard.arrays['energy'],
+                num_edges=(
+                    np.diff(shard.arrays['edge_offsets'])
+                    if self.r_max is not None
+                    else None
+                ),
+                r_max=self.r_max,
+            )
+            for shard in self.shards
+        ]
+
+        return indices[0].concatenate(*indices[1:])
+
+
+class NumpyGraphDataset(NumpyDataset):
+    def __init__(
+        self,
+        path: Path | str,
+        r_max: float,
+        atomic_numbers: AtomicNumberTable,
+        *,
+        compact: bool = False,
+        neighbor_list_engine: str = None,
+        r_edges: bool = True,
+    ):
+        """Dataset of graphs with the same schema and options as
+        `HDF5GraphDataset`. Stored neighbor lists are used if they match the
+        cutoff radius. Tensors share memory with the mapped arrays where data
+        types agree."""
+        super().__init__(path)
+
+        self.r_edges = r_edges
+        self.converter = AtomsToGraphs(
+            atomic_numbers,
+            r_edges=r_edges,
+            r_energy=True,
+            r_forces=True,
+            r_stress=True,
+            r_pbc=True,
+            radius=r_max,
+            compact=compact,
+            neighbor_list_engine=neighbor_list_engine,
+        )
+        self.use_neighbors = r_edges and self.has_neighbors(r_max)
+
+    def __getitem__(self, index):
+        record = self.read_record(index)
+
+        if self.use_neighbors:
+            edge_index, unit_shifts = self.read_neighbors(index)
+        else:
+            edge_index, unit_shifts = None, None
+
+        graph = self.converter.convert_record(record, edge_index, unit_shifts)
+        graph.idx = index
+
+        return graph
+
+    def __getitems__(self, indices: list[int]):
+        # Records are views of mapped arrays, there is nothing to gain from
+        # reading a batch at once
+        return [self[index] for index in indices]
+
+
+def convert_to_npy(
+    dataset: HDF5Dataset | NumpyDataset,
+    path: Path | str,
+    *,
+    r_max: float = None,
+    shard_size: int = None,
+    batch_size: int = 4096,
+    engine: str = None,
+) -> int:
+    """Write all structures of a dataset to a new NumPy dataset in `path`.
+
+    If `r_max` is given, neighbor lists for this cutoff radius are included,
+    which are copied from the source dataset if available and computed with the
+    given neighbor list engine otherwise.
+    """
+    neighbor_lists = None
+    if r_max is not None and isinstance(dataset, HDF5Dataset):
+        neighbor_lists = HDF5NeighborLists.open(dataset.file, r_max)
+        if neighbor_lists is not None:
+            neighbor_lists.validate(len(dataset))
+
+    with NumpyWriter(
+        path, shard_size=shard_size, r_max=r_max, buffer_size=batch_size
+    ) as writer:
+        for start in range(0, len(dataset), batch_size):
+            indices = np.arange(start, min(start + batch_size, len(dataset)))
+            records = dataset.read_records(indices)
+
+            if r_max is None:
+                neighbors = [(None, None)] * len(records)
+            elif neighbor_lists is not None:
+                neighbors = neighbor_lists.read(indices)
+            elif isinstance(dataset, NumpyDataset) and dataset.has_neighbors(r_max):
+                neighbors = [dataset.read_neighbors(i) for i in indices]
+            else:
+                neighbors = []
+                for record in records:
+                    edge_index, _, unit_shifts, _ = get_neighborhood(
+                        record['positions'],
+                        r_max,
+                        record['pbc'],
+                        record['cell'].copy(),
+                        engine=engine,
+                    )
+                    neighbors.append((edge_index, unit_shifts))
+
+            for record, (edge_index, unit_shifts) in zip(records, neighbors):
+                writer.append_record(record, edge_index, unit_shifts)
+
+        return len(writer)
+
+
+def migrate_npy(
+    filename_input: Path | str,
+    path_output: Path | str,
+    shard_size: int = None,
+    batch_size: int = 4096,
+) -> int:
+    """Copy an equitrain HDF5 data file into a new NumPy dataset.
+
+    Neighbor lists stored in the data file are copied if they exist for a
+    single cutoff radius.
+    """
+    with HDF5Dataset(filename_input) as dataset:
+        r_max = None
+        if HDF5NeighborLists.GROUP in dataset.file:
+            groups = list(dataset.file[HDF5NeighborLists.GROUP].values())
+            if len(groups) == 1:
+                r_max = float(groups[0].attrs['r_max'])
+
+        return convert_to_npy(
+            dataset,
+            path_output,
+            r_max=r_max,
+            shard_size=shard_size,
+            batch_size=batch_size,
+        )
+
+
+def open_dataset(filename: Path | str) -> HDF5Dataset | NumpyDataset:
+    """Open an HDF5 data file or a directory holding a NumPy dataset."""
+    if Path(filename).is_dir():
+        return NumpyDataset(filename)
+    return HDF5Dataset(filename)
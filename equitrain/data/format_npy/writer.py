@@ -0,0 +1,212 @@
+import json
+import shutil
+from pathlib import Path
+
+import numpy as np
+from ase import Atoms
+
+from equitrain.data.format_hdf5 import HDF5Dataset
+
+# Columns of each shard, per-atom and per-structure columns are the same
+# as in version 2 HDF5 files
+ATOM_COLUMNS = HDF5Dataset.ATOM_COLUMNS
+STRUCTURE_COLUMNS = HDF5Dataset.STRUCTURE_COLUMNS
+EDGE_COLUMNS = {
+    # Atom indices are local to each structure
+    'edge_index': (np.int32, (2,)),
+    'unit_shifts': (np.int8, (3,)),
+}
+OFFSET_COLUMNS = {
+    'offsets': (np.int64, ()),
+    'edge_offsets': (np.int64, ()),
+}
+
+META = 'meta.json'
+FORMAT = 'equitrain-npy'
+FORMAT_VERSION = 1
+
+
+class NumpyWriter:
+    """Write structures to a new directory of NumPy shards, see `NumpyDataset`.
+
+    Structures are collected in memory and appended with a single write per
+    column once `buffer_size` structures are buffered. Columns are written as raw
+    files, which are converted to `.npy` files when a shard holds `shard_size`
+    structures or when the writer is closed. The dataset must not be read before
+    the writer is closed. If `r_max` is given, neighbor lists for this cutoff
+    radius must be passed for every structure.
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        shard_size: int = None,
+        r_max: float = None,
+        buffer_size: int = 4096,
+    ):
+        self.path = Path(path)
+        self.shard_size = shard_size
+        self.r_max = r_max
+        self.buffer_size = buffer_size
+
+        self.columns = OFFSET_COLUMNS | ATOM_COLUMNS | STRUCTURE_COLUMNS
+        if r_max is None:
+            del self.columns['edge_offsets']
+        else:
+            self.columns |= EDGE_COLUMNS
+
+        self.path.mkdir(parents=True, exist_ok=False)
+
+        self.shards = []
+        self.records = []
+        self.neighbors = []
+        self.files = None
+        self.num_structures = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.num_structures + len(self.records)
+
+    def append(self, atoms: Atoms, edge_index=None, unit_shifts=None) -> None:
+        self.append_record(HDF5Dataset.atoms_to_record(atoms), edge_index, unit_shifts)
+
+    def append_record(
+        self,
+        record: dict[str, np.ndarray],
+        edge_index: np.ndarray = None,
+        unit_shifts: np.ndarray = None,
+    ) -> None:
+        """Append raw fields of a structure, as returned by `read_record`, with
+        the edge index [2, n_edges] and unit shifts [n_edges, 3] for `r_max`."""
+        if self.r_max is not None:
+            if edge_index is None:
+                raise ValueError(f'Neighbor lists for r_max={self.r_max} are required')
+            self.neighbors.append((edge_index, unit_shifts))
+
+        self.records.append(record)
+
+        shard_full = (
+            self.shard_size is not None
+            and self.shard_structures + len(self.records) >= self.shard_size
+        )
+        if len(self.records) >= self.buffer_size or shard_full:
+            self.flush()
+
+        if shard_full:
+            self._close_shard()
+
+    @property
+    def shard_structures(self) -> int:
+        """Number of structures written to the current shard."""
+        return self.num_structures - sum(self.shards)
+
+    def flush(self) -> None:
+        """Write all buffered structures to the current shard."""
+        if len(self.records) == 0:
+            return
+
+        if self.files is None:
+            self._open_shard()
+
+        records, neighbors = self.records, self.neighbors
+
+        for name, (dtype, shape) in ATOM_COLUMNS.items():
+            self._write(
+                name,
+                np.concatenate([np.reshape(r[name], (-1, *shape)) for r in records]),
+            )
+        for name, (dtype, shape) in STRUCTURE_COLUMNS.items():
+            self._write(name, np.stack([r[name] for r in records]))
+
+        offsets = np.cumsum([len(r['atomic_numbers']) for r in records])
+        self._write('offsets', self.num_atoms + offsets)
+        self.num_atoms += int(offsets[-1])
+
+        if self.r_max is not None:
+            unit_shifts = np.concatenate([s for _, s in neighbors]).reshape(-1, 3)
+            if np.any(np.abs(unit_shifts) > np.iinfo(np.int8).max):
+                raise ValueError(
+                    'Unit shifts exceed the range of stored neighbor lists'
+                )
+
+            self._write(
+                'edge_index', np.concatenate([e.T for e, _ in neighbors]).reshape(-1, 2)
+            )
+            self._write('unit_shifts', unit_shifts)
+
+            edge_offsets = np.cumsum([e.shape[1] for e, _ in neighbors])
+            self._write('edge_offsets', self.num_edges + edge_offsets)
+            self.num_edges += int(edge_offsets[-1])
+
+        self.num_structures += len(records)
+        self.records = []
+        self.neighbors = []
+
+    def _write(self, name: str, array: np.ndarray) -> None:
+        dtype, _ = self.columns[name]
+        self.files[name].write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+    def _open_shard(self) -> None:
+        shard_path = self.path / f'shard-{len(self.shards):05d}'
+        shard_path.mkdir()
+
+        self.files = {
+            name: open(shard_path / f'{name}.raw', 'wb', buffering=1 << 20)
+            for name in self.columns
+        }
+        self.num_atoms = 0
+        self.num_edges = 0
+
+        # Offsets start with zero
+        self._write('offsets', np.zeros(1))
+        if self.r_max is not None:
+            self._write('edge_offsets', np.zeros(1))
+
+    def _close_shard(self) -> None:
+        if self.files is None:
+            return
+
+        shard_path = self.path / f'shard-{len(self.shards):05d}'
+
+        for name, file in self.files.items():
+            file.close()
+
+            # Prepend the header of the final .npy file
+            dtype, shape = self.columns[name]
+            filename = shard_path / f'{name}.raw'
+            row_bytes = np.dtype(dtype).itemsize * int(np.prod(shape, dtype=int))
+            header = {
+                'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                'fortran_order': False,
+                'shape': (filename.stat().st_size // row_bytes, *shape),
+            }
+            with open(shard_path / f'{name}.npy', 'wb') as f, open(filename, 'rb') as g:
+                np.lib.format.write_array_header_1_0(f, header)
+                shutil.copyfileobj(g, f, 1 << 24)
+            filename.unlink()
+
+        self.files = None
+        self.shards.append(self.shard_structures)
+
+    def close(self) -> None:
+        """Write all buffered structures and the metadata of the dataset."""
+        self.flush()
+        self._close_shard()
+
+        meta = {
+            'format': FORMAT,
+            'format_version': FORMAT_VERSION,
+            'num_structures': self.num_structures,
+            'shards': [
+                {'path': f'shard-{i:05d}', 'num_structures': n}
+                for i, n in enumerate(self.shards)
+            ],
+            'r_max': self.r_max,
+        }
+        with open(self.path / META, 'w') as f:
+            json.dump(meta, f, indent=2)
@@ -0,0 +1,5 @@
+from .store import (
+    SharedGraphDataset,
+    SharedGraphStore,
+    open_shared_store,
+)
@@ -0,0 +1,226 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from accelerate import Accelerator
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_npy import (
+    NumpyDataset,
+    NumpyGraphDataset,
+    convert_to_npy,
+    open_dataset,
+)
+from equitrain.data.format_npy.writer import FORMAT_VERSION
+
+
+class SharedGraphStore(NumpyDataset):
+    """Structures and neighbor lists of a data file held as a `NumpyDataset` in
+    node-local shared memory.
+
+    The store is a directory on a memory-backed file system, e.g. `/dev/shm`,
+    whose flat arrays all processes of a node map into their address space.
+    Reading a structure returns views of the mapped arrays, i.e. data is never
+    copied between processes. Mappings are copy-on-write, such that arrays can
+    be modified locally without affecting other processes.
+
+    Stores are built once with `open_or_build` and are kept until they are
+    removed, so that later runs on the same node can attach to them.
+    """
+
+    @staticmethod
+    def get_source(filename: Path | str) -> dict:
+        """Resolved path, size and modification time of a data file, which
+        identify the version of the file a store was built from."""
+        filename = Path(filename).resolve()
+        # NumPy datasets are modified by rewriting their metadata
+        stat = (filename / NumpyDataset.META if filename.is_dir() else filename).stat()
+
+        return dict(
+            filename=str(filename), size=stat.st_size, mtime_ns=stat.st_mtime_ns
+        )
+
+    @staticmethod
+    def get_root(root: Path | str = None) -> Path:
+        if root is None:
+            root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        return Path(root)
+
+    @classmethod
+    def get_path(
+        cls, filename: Path | str, r_max: float, root: Path | str = None
+    ) -> Path:
+        """Directory of the store of a data file and cutoff radius, which changes
+        whenever the data file is modified."""
+        source = cls.get_source(filename)
+        key = (
+            f'{source["filename"]}:{source["size"]}:{source["mtime_ns"]}:'
+            f'{float(r_max)!r}:{FORMAT_VERSION}'
+        )
+
+        return (
+            cls.get_root(root)
+            / f'equitrain-{Path(filename).stem}-{hashlib.sha1(key.encode()).hexdigest()[:16]}'
+        )
+
+    @classmethod
+    def open_or_build(
+        cls,
+        filename: Path | str,
+        r_max: float,
+        root: Path | str = None,
+        *,
+        build: bool = True,
+        batch_size: int = 1024,
+        engine: str = None,
+    ) -> 'SharedGraphStore':
+        """Attach to the store of a data file or build it if it does not exist.
+
+        An exclusive lock on a file next to the store serializes all processes of
+        a node, so that the store is built only once and no process attaches to an
+        incomplete store. If `build` is False, a missing store is an error.
+        Before a store is built, stores of earlier versions of the data file are
+        removed, see `remove_stale`.
+        """
+        path = cls.get_path(filename, r_max, root)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with open(path.parent / f'{path.name}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if not (path / cls.META).exists():
+                if not build:
+                    raise RuntimeError(
+                        f'Shared memory store {path} of {filename} does not exist'
+                    )
+
+                # The lock file records the version of the data file, by which
+                # stale stores and incomplete builds are found later
+                lock.truncate(0)
+                json.dump(cls.get_source(filename), lock)
+                lock.flush()
+
+                cls.remove_stale(filename, root)
+                cls.build(filename, path, r_max, batch_size=batch_size, engine=engine)
+
+        return cls(path)
+
+    @classmethod
+    def remove_stale(cls, filename: Path | str, root: Path | str = None) -> list[Path]:
+        """Remove stores of earlier versions of a data file for all cutoff radii,
+        including their lock files and incomplete builds, and return their paths.
+
+        Stores are identified by the source recorded in their lock file. Stores
+        whose lock is held by another process, e.g. while it is built, are kept.
+        """
+        source = cls.get_source(filename)
+
+        removed = []
+        for lock_path in cls.get_root(root).glob(
+            f'equitrain-{Path(filename).stem}-*.lock'
+        ):
+            try:
+                with open(lock_path) as f:
+                    source_lock = json.load(f)
+            except (OSError, ValueError):
+                # Stores of other versions of equitrain or being created
+                continue
+
+            if (
+                not isinstance(source_lock, dict)
+                or source_lock.get('filename') != source['filename']
+            ):
+                continue
+            if source_lock == source:
+                continue
+
+            path = lock_path.with_suffix('')
+            with open(lock_path, 'a') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+
+                shutil.rmtree(path, ignore_errors=True)
+                shutil.rmtree(path.with_name(f'{path.name}.tmp'), ignore_errors=True)
+                lock_path.unlink(missing_ok=True)
+
+            removed.append(path)
+
+        return removed
+
+    @classmethod
+    def build(
+        cls,
+        filename: Path | str,
+        path: Path | str,
+        r_max: float,
+        batch_size: int = 1024,
+        engine: str = None,
+    ) -> None:
+        """Write the store of a data file to directory `path`.
+
+        Neighbor lists stored in the data file are used if available for `r_max`
+        and computed with the given engine otherwise. The store is written to a
+        temporary directory, which is renamed once it is complete.
+        """
+        path = Path(path)
+        path_tmp = path.with_name(f'{path.name}.tmp')
+        shutil.rmtree(path_tmp, ignore_errors=True)
+
+        with open_dataset(filename) as dataset:
+            convert_to_npy(
+                dataset, path_tmp, r_max=r_max, batch_size=batch_size, engine=engine
+            )
+
+        os.rename(path_tmp, path)
+
+
+class SharedGraphDataset(NumpyGraphDataset):
+    def __init__(
+        self,
+        store: SharedGraphStore,
+        r_max: float,
+        atomic_numbers: AtomicNumberTable,
+        compact: bool = False,
+        r_edges: bool = True,
+    ):
+        """Dataset of graphs read from a `SharedGraphStore`, which returns the same
+        graphs as `HDF5GraphDataset`. Tensors of graphs share memory with the
+        store where data types agree."""
+        if not store.has_neighbors(r_max):
+            raise ValueError(
+                f'Shared memory store was built for r_max={store.r_max}, '
+                f'but r_max={r_max} was requested'
+            )
+
+        super().__init__(
+            store.path, r_max, atomic_numbers, compact=compact, r_edges=r_edges
+        )
+
+
+def open_shared_store(
+    filename: Path | str,
+    r_max: float,
+    accelerator: Accelerator = None,
+    root: Path | str = None,
+    engine: str = None,
+) -> SharedGraphStore:
+    """Attach all processes of a node to the store of a data file, which is built
+    by the local main process if it does not exist yet."""
+    if accelerator is None:
+        return SharedGraphStore.open_or_build(filename, r_max, root, engine=engine)
+
+    # Other processes attach after the local main process has built the store
+    with accelerator.local_main_process_first():
+        return SharedGraphStore.open_or_build(
+            filename,
+            r_max,
+            root,
+            build=accelerator.is_local_main_process,
+            engine=engine,
+        )
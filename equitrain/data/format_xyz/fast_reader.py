@@ -0,0 +1,402 @@
+import io
+import json
+import re
+
+import ase.data
+import ase.io
+import numpy as np
+from ase.io.extxyz import (
+    REV_PROPERTY_NAME_MAP,
+    SPECIAL_3_3_KEYS,
+    UNPROCESSED_KEYS,
+    all_properties,
+    per_config_properties,
+)
+
+from equitrain.data import Configuration
+
+# Plain or double-quoted values of the comment line, other delimiters,
+# escape sequences and keys without values are left to ASE
+_KEY_VALUE = re.compile(
+    r'\s*([^\s="\'{}\[\]\\]+)=(?:"([^"\\]*)"|([^\s="\'{}\[\]\\]+))(?=\s|$)'
+)
+_VALUE_PARTS = re.compile(r'[^\s,]+')
+_BOOLS = {
+    'T': True,
+    'F': False,
+    'true': True,
+    'false': False,
+    'True': True,
+    'False': False,
+    'TRUE': True,
+    'FALSE': False,
+}
+_DEFAULT_PROPERTIES = 'species:S:1:pos:R:3'
+# Per-atom properties with a special meaning for ase.Atoms
+_SPECIAL_PROPERTIES = {
+    'numbers',
+    'symbols',
+    'positions',
+    'initial_charges',
+    'move_mask',
+}
+
+
+class _Unsupported(Exception):
+    """A frame uses a part of the extxyz format that is left to ASE."""
+
+
+class _Frame:
+    def __init__(self, num_atoms: int, comment: bytes, info: dict, lines: list):
+        self.num_atoms = num_atoms
+        self.comment = comment
+        self.info = info
+        self.lines = lines
+
+    def to_atoms(self) -> ase.Atoms:
+        text = b'\n'.join([str(self.num_atoms).encode(), self.comment, *self.lines])
+        return ase.io.read(io.StringIO(text.decode()), format='extxyz')
+
+
+def read_extxyz(
+    text: bytes,
+    *,
+    energy_key: str = 'energy',
+    forces_key: str = 'forces',
+    stress_key: str = 'stress',
+    virials_key: str = 'virials',
+    dipole_key: str = 'dipole',
+    charges_key: str = 'charges',
+):
+    """Iterate over the frames of extxyz data, which are returned as
+    `Configuration` if they are read by the fast path and as `ase.Atoms` otherwise.
+
+    The fast path covers frames with species, positions and further real or
+    integer columns, whose comment line holds plain or double-quoted values.
+    Columns of consecutive frames with the same properties are converted by NumPy
+    at once. The result is the same as `Configuration.from_atoms` with the given
+    keys for frames read by ASE. Frames with a single atom, such as isolated
+    atoms, and all other frames are read by ASE.
+    """
+    keys = dict(
+        energy_key=energy_key,
+        forces_key=forces_key,
+        stress_key=stress_key,
+        virials_key=virials_key,
+        dipole_key=dipole_key,
+        charges_key=charges_key,
+    )
+
+    lines = text.split(b'\n')
+
+    # Consecutive frames with the same properties
+    group = []
+    group_properties = None
+
+    i = 0
+    while i < len(lines):
+        header = lines[i].strip()
+        # Like ASE, stop at the first empty line
+        if not header:
+            break
+
+        num_atoms = int(header) if header.isdigit() else None
+        end = i + 2 + (num_atoms or 0)
+
+        if num_atoms is None or (
+            end < len(lines) and lines[end].lstrip().startswith(b'VEC')
+        ):
+            # Invalid headers and cell vectors are left to ASE,
+            # which reads all remaining frames
+            yield from _convert(group, group_properties, keys)
+            remainder = b'\n'.join(lines[i:]).decode()
+            yield from ase.io.iread(io.StringIO(remainder), index=':', format='extxyz')
+            return
+
+        frame = _Frame(
+            num_atoms, b''.join(lines[i + 1 : i + 2]), {}, lines[i + 2 : end]
+        )
+        i = end
+
+        try:
+            if num_atoms < 2 or len(frame.lines) < num_atoms:
+                raise _Unsupported('frame')
+
+            frame.info = _parse_comment(frame.comment.decode())
+            properties = frame.info.pop('Properties', _DEFAULT_PROPERTIES)
+            if not isinstance(properties, str):
+                raise _Unsupported('Properties')
+
+        except (_Unsupported, UnicodeDecodeError):
+            yield from _convert(group, group_properties, keys)
+            group, group_properties = [], None
+
+            yield frame.to_atoms()
+            continue
+
+        if properties != group_properties:
+            yield from _convert(group, group_properties, keys)
+            group, group_properties = [], properties
+
+        group.append(frame)
+
+    yield from _convert(group, group_properties, keys)
+
+
+def _parse_value(key: str, value: str):
+    """Convert a value of the comment line like `ase.io.extxyz.key_val_str_to_dict`."""
+    if key.lower() in UNPROCESSED_KEYS:
+        return value
+
+    parts = _VALUE_PARTS.findall(value)
+    try:
+        try:
+            number = np.array(parts, dtype=int)
+        except (ValueError, OverflowError):
+            number = np.array(parts, dtype=float)
+        value = number[0] if len(number) == 1 else number
+    except (ValueError, OverflowError):
+        pass
+
+    if key in SPECIAL_3_3_KEYS:
+        if not isinstance(value, np.ndarray) or value.shape != (9,):
+            raise _Unsupported(key)
+        value = value.reshape((3, 3), order='F')
+
+    if isinstance(value, str):
+        if all(part in _BOOLS for part in parts):
+            bools = [_BOOLS[part] for part in parts]
+            value = bools[0] if len(bools) == 1 else bools
+        elif value.startswith('_JSON '):
+            try:
+                data = json.loads(value.replace('_JSON ', '', 1))
+            except ValueError as e:
+                raise _Unsupported(key) from e
+            value = np.array(data)
+            if value.dtype.kind not in ['i', 'f', 'b']:
+                value = data
+
+    return value
+
+
+def _parse_comment(line: str) -> dict:
+    info = {}
+
+    line = line.strip()
+    position = 0
+    while position < len(line):
+        match = _KEY_VALUE.match(line, position)
+        if match is None:
+            raise _Unsupported(line)
+
+        key, quoted, plain = match.groups()
+        info[key] = _parse_value(key, quoted if quoted is not None else plain)
+        position = match.end()
+
+    return info
+
+
+def _parse_properties(properties: str) -> list[tuple[str, str, int]]:
+    """Names, types and number of columns of per-atom properties."""
+    fields = properties.split(':')
+    if len(fields) % 3 != 0:
+        raise _Unsupported(properties)
+
+    columns = []
+    for name, kind, num_columns in zip(fields[::3], fields[1::3], fields[2::3]):
+        if (name, kind, num_columns) not in (('species', 'S', '1'), ('pos', 'R', '3')):
+            # Other strings, logicals and columns with a special meaning
+            if kind not in ('R', 'I'):
+                raise _Unsupported(properties)
+            if REV_PROPERTY_NAME_MAP.get(name, name) in _SPECIAL_PROPERTIES:
+                raise _Unsupported(properties)
+        if not num_columns.isdigit() or int(num_columns) < 1:
+            raise _Unsupported(properties)
+
+        columns.append((name, kind, int(num_columns)))
+
+    names = [REV_PROPERTY_NAME_MAP.get(name, name) for name, _, _ in columns]
+    if 'symbols' not in names or 'positions' not in names:
+        raise _Unsupported(properties)
+    if len(set(names)) != len(names):
+        raise _Unsupported(properties)
+
+    return columns
+
+
+def _convert(group: list[_Frame], properties: str, keys: dict):
+    """Convert the columns of frames with the same properties at once."""
+    if len(group) == 0:
+        return
+
+    try:
+        columns = _parse_properties(properties)
+        num_columns = sum(n for _, _, n in columns)
+        num_atoms = sum(frame.num_atoms for frame in group)
+
+        tokens = []
+        for frame in group:
+            frame_tokens = b' '.join(frame.lines).split()
+            if len(frame_tokens) != frame.num_atoms * num_columns:
+                raise _Unsupported('columns')
+            tokens.extend(frame_tokens)
+
+        tokens = np.array(tokens).reshape(num_atoms, num_columns)
+
+        arrays = {}
+        start = 0
+        for name, kind, n in columns:
+            column = tokens[:, start : start + n]
+            start += n
+
+            if kind == 'S':
+                symbols, inverse = np.unique(column[:, 0], return_inverse=True)
+                # ASE capitalizes symbols
+                numbers = np.array(
+                    [ase.data.atomic_numbers[s.decode().capitalize()] for s in symbols]
+                )
+                arrays['symbols'] = numbers[inverse.reshape(-1)]
+            else:
+                column = column.astype(np.float64 if kind == 'R' else np.int32)
+                arrays[REV_PROPERTY_NAME_MAP.get(name, name)] = (
+                    column[:, 0] if n == 1 else column
+                )
+
+    except (_Unsupported, KeyError, ValueError, UnicodeDecodeError):
+        # ASE reads exotic or malformed frames and reports errors
+        for frame in group:
+            yield frame.to_atoms()
+        return
+
+    offset = 0
+    for frame in group:
+        frame_arrays = {
+            name: array[offset : offset + frame.num_atoms]
+            for name, array in arrays.items()
+        }
+        offset += frame.num_atoms
+
+        try:
+            yield _to_configuration(frame.info.copy(), frame_arrays, **keys)
+        except _Unsupported:
+            yield frame.to_atoms()
+
+
+def _to_configuration(
+    info: dict,
+    arrays: dict,
+    *,
+    energy_key: str,
+    forces_key: str,
+    stress_key: str,
+    virials_key: str,
+    dipole_key: str,
+    charges_key: str,
+) -> Configuration:
+    """Same as `Configuration.from_atoms` for the atoms read by ASE, where
+    `info` is the parsed comment line and `arrays` holds the columns."""
+    atomic_numbers = arrays.pop('symbols')
+    positions = arrays.pop('positions')
+
+    # Lattice implies periodic boundary conditions, see `ase.io.extxyz`
+    value = info.pop('pbc', 'Lattice' in info)
+    if not isinstance(value, bool) and not (
+        isinstance(value, list)
+        and len(value) == 3
+        and all(isinstance(p, bool) for p in value)
+    ):
+        raise _Unsupported('pbc')
+    pbc = np.zeros(3, dtype=bool)
+    pbc[:] = value
+
+    cell = np.zeros((3, 3))
+    if 'Lattice' in info:
+        cell = info.pop('Lattice').T.astype(np.float64)
+
+    # Standard properties are moved to a SinglePointCalculator
+    results = {}
+    atoms_arrays = {'numbers': atomic_numbers, 'positions': positions}
+    for name, array in arrays.items():
+        if name in all_properties:
+            results[name] = array.astype(np.float64)
+        else:
+            atoms_arrays[name] = array
+
+    for key in list(info):
+        if key in per_config_properties:
+            value = info.pop(key)
+            if key == 'stress' and np.shape(value) == (3, 3):
+                value = value[[0, 1, 2, 1, 0, 0], [0, 1, 2, 2, 2, 1]]
+            if key not in ('energy', 'magmom', 'free_energy'):
+                try:
+                    value = np.array(value, dtype=np.float64)
+                except (TypeError, ValueError) as e:
+                    raise _Unsupported(key) from e
+            results[key] = value
+
+    num_atoms = len(atomic_numbers)
+
+    if energy_key == 'energy':
+        energy = results.get('energy')
+        if not isinstance(energy, (np.integer, np.floating)):
+            raise _Unsupported('energy')
+    else:
+        energy = info.get(energy_key, None)
+
+    if forces_key == 'forces':
+        forces = results.get('forces')
+        if forces is None or forces.shape != (num_atoms, 3):
+            raise _Unsupported('forces')
+    else:
+        forces = atoms_arrays.get(forces_key, None)
+
+    if stress_key == 'stress':
+        stress = results.get('stress')
+        if stress is None or stress.shape != (6,):
+            raise _Unsupported('stress')
+    else:
+        stress = info.get(stress_key, None)
+
+    virials = info.get(virials_key, None)
+    dipole = info.get(dipole_key, None)
+    charges = atoms_arrays.get(charges_key, np.zeros(num_atoms))
+
+    energy_weight = 1.0
+    forces_weight = 1.0
+    stress_weight = 1.0
+    virials_weight = 1.0
+    dipole_weight = 1.0
+
+    if energy is None:
+        energy = 0.0
+        energy_weight = 0.0
+    if forces is None:
+        forces = np.zeros((num_atoms, 3))
+        forces_weight = 0.0
+    if stress is None:
+        stress = np.zeros(6)
+        stress_weight = 0.0
+    if virials is None:
+        virials = np.zeros((3, 3))
+        virials_weight = 0.0
+    if dipole is None:
+        dipole = np.zeros(3)
+        dipole_weight = 0.0
+
+    return Configuration(
+        atomic_numbers=atomic_numbers,
+        positions=positions,
+        energy=energy,
+        forces=forces,
+        stress=stress,
+        virials=virials,
+        dipole=dipole,
+        charges=charges,
+        pbc=tuple(pbc),
+        cell=cell,
+        energy_weight=energy_weight,
+        forces_weight=forces_weight,
+        stress_weight=stress_weight,
+        virials_weight=virials_weight,
+        dipole_weight=dipole_weight,
+    )
@@ -1,14 +1,28 @@
+import collections
+import functools
+import io
+import itertools
 import logging
+import multiprocessing
+import os
 
 import ase.io
+import numpy as np
+from ase.io.formats import filetype
 
-from equitrain.data import AtomicNumberTable, Configuration
+from equitrain.data import AtomicNumberTable, Configuration, StatisticsAccumulator
+from equitrain.data.format_hdf5 import HDF5Dataset
+from equitrain.data.format_xyz.fast_reader import read_extxyz
+from equitrain.data.graphs.neighborhood import get_neighborhood
+
+_RANGE_SIZE = 1 << 25
 
 
 class XYZReader:
     def __init__(
         self,
         filename: str,
+        *,
         energy_key: str = 'energy',
         forces_key: str = 'forces',
         stress_key: str = 'stress',
@@ -17,7 +31,13 @@ class XYZReader:
         charges_key: str = 'charges',
         extract_atomic_numbers: bool = False,
         extract_atomic_energies: bool = False,
+        statistics: StatisticsAccumulator = None,
+        fast: bool = True,
     ):
+        """Reader of xyz files. Structures returned by `records` are added to
+        `statistics` if given, isolated atoms used for E0s are not. Extxyz files
+        are parsed by `read_extxyz` if `fast` is set, which leaves frames outside
+        of the common subset of the format to ASE."""
         self.filename = filename
         self.energy_key = energy_key
         self.forces_key = forces_key
@@ -29,11 +49,57 @@ class XYZReader:
         self.atomic_energies = {}
         self.extract_atomic_numbers = extract_atomic_numbers
         self.extract_atomic_energies = extract_atomic_energies
+        self.statistics = statistics
+        self.fast = fast
 
     def __iter__(self):
         self.atomic_energies = {}
 
-        for i, atoms in enumerate(ase.io.iread(self.filename, index=':')):
+        if self.fast and filetype(self.filename) == 'extxyz':
+            # Read in ranges to bound memory
+            num_ranges = -(-os.path.getsize(self.filename) // _RANGE_SIZE)
+            atoms_iterable = (
+                atoms
+                for byte_range in split_xyz(self.filename, num_ranges)
+                for atoms in self.read(byte_range)
+            )
+        else:
+            atoms_iterable = ase.io.iread(self.filename, index=':')
+
+        yield from self.convert(atoms_iterable)
+
+    def read(self, byte_range: tuple[int, int]):
+        """Iterate over the frames of a byte range of an extxyz file."""
+        start, end = byte_range
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            text = f.read(end - start)
+
+        if not self.fast:
+            return ase.io.iread(io.StringIO(text.decode()), index=':', format='extxyz')
+
+        return read_extxyz(
+            text,
+            energy_key=self.energy_key,
+            forces_key=self.forces_key,
+            stress_key=self.stress_key,
+            virials_key=self.virials_key,
+            dipole_key=self.dipole_key,
+            charges_key=self.charges_key,
+        )
+
+    def convert(self, atoms_iterable):
+        """Convert frames read by ASE or configurations of the fast reader
+        to atoms with the fixed keys of `Configuration.to_atoms`."""
+        for i, atoms in enumerate(atoms_iterable):
+            if isinstance(atoms, Configuration):
+                # The fast reader leaves isolated atoms to ASE
+                if self.extract_atomic_numbers:
+                    self.z_set.update([int(z) for z in atoms.atomic_numbers])
+
+                yield atoms.to_atoms()
+                continue
+
             if self.extract_atomic_numbers:
                 self.z_set.update([int(z) for z in atoms.get_atomic_numbers()])
 
@@ -57,11 +123,122 @@ class XYZReader:
 
                 yield atoms
 
+    def records(self, workers: int = 1, range_size: int = _RANGE_SIZE):
+        """Iterate over the raw fields of all structures, see `HDF5Dataset.read_record`.
+
+        With multiple workers, the file is split into byte ranges of about
+        `range_size` bytes at frame boundaries, which are parsed in a process pool,
+        at most `2 * workers` ranges ahead of the consumer.
+        Records are returned in the order of the file and atomic numbers and
+        energies of isolated atoms are merged in this order, i.e. the result
+        does not depend on the number of workers. Only extxyz files are split,
+        other formats are read by a single process.
+        """
+        for record, _ in self.records_with_neighbors(
+            None, workers=workers, range_size=range_size
+        ):
+            yield record
+
+    def records_with_neighbors(
+        self,
+        r_max: float,
+        engine: str = None,
+        workers: int = 1,
+        range_size: int = _RANGE_SIZE,
+    ):
+        """Iterate over pairs of records, see `records`, and their edge index
+        [2, n_edges] and unit shifts [n_edges, 3] for the cutoff radius `r_max`,
+        which are None if `r_max` is None.
+
+        Neighbors are searched once per structure, by the workers reading it,
+        and are added to `statistics` if it is accumulated for the same cutoff
+        radius.
+        """
+        if workers > 1 and filetype(self.filename) != 'extxyz':
+            logging.warning(
+                f'Cannot split {self.filename} into ranges, which requires '
+                'the extxyz format. Reading with a single process'
+            )
+            workers = 1
+
+        if workers <= 1:
+            for atoms in self:
+                yield self._to_record(atoms, r_max, engine)
+            return
+
+        self.atomic_energies = {}
+
+        num_ranges = max(workers, -(-os.path.getsize(self.filename) // range_size))
+        ranges = iter(split_xyz(self.filename, num_ranges))
+
+        read_range = functools.partial(self._read_range, r_max=r_max, engine=engine)
+
+        with multiprocessing.Pool(workers) as pool:
+            # At most two ranges per worker are parsed ahead of the consumer,
+            # which bounds memory if records are written more slowly than they
+            # are parsed. Results are returned in the order of ranges
+            results = collections.deque(
+                pool.apply_async(read_range, (byte_range,))
+                for byte_range in itertools.islice(ranges, 2 * workers)
+            )
+            while results:
+                records, z_set, atomic_energies, statistics = results.popleft().get()
+
+                byte_range = next(ranges, None)
+                if byte_range is not None:
+                    results.append(pool.apply_async(read_range, (byte_range,)))
+
+                self.z_set.update(z_set)
+                self.atomic_energies.update(atomic_energies)
+                if self.statistics is not None:
+                    self.statistics.merge(statistics)
+
+                yield from records
+
+    def _to_record(self, atoms, r_max: float, engine: str):
+        record = HDF5Dataset.atoms_to_record(atoms)
+
+        neighbors = (None, None)
+        if r_max is not None:
+            edge_index, _, unit_shifts, _ = get_neighborhood(
+                record['positions'],
+                r_max,
+                record['pbc'],
+                record['cell'].copy(),
+                engine=engine,
+            )
+            neighbors = (edge_index, unit_shifts)
+
+        if self.statistics is not None:
+            # The accumulator searches neighbors itself for another cutoff radius
+            same_r_max = r_max is not None and self.statistics.r_max == r_max
+            self.statistics.update(record, neighbors[0] if same_r_max else None)
+
+        return record, neighbors
+
+    def _read_range(self, byte_range: tuple[int, int], r_max: float, engine: str):
+        # Runs on a copy of the reader in a worker, which only reports
+        # atomic numbers, energies and statistics found in its range
+        self.z_set = set()
+        self.atomic_energies = {}
+        if self.statistics is not None:
+            self.statistics = StatisticsAccumulator(
+                r_max=self.statistics.r_max, engine=self.statistics.engine
+            )
+
+        records = [
+            self._to_record(atoms, r_max, engine)
+            for atoms in self.convert(self.read(byte_range))
+        ]
+
+        return records, self.z_set, self.atomic_energies, self.statistics
+
     def update_atomic_energies(self, atoms, i):
         if self.energy_key in atoms.info.keys():
-            self.atomic_energies[atoms.get_atomic_numbers()[0]] = atoms.info[
-                self.energy_key
-            ]
+            # Plain Python types, which are written to statistics.json
+            self.atomic_energies[int(atoms.get_atomic_numbers()[0])] = float(
+                atoms.info[self.energy_key]
+            )
         else:
             logging.warning(
                 f"Configuration '{i}' is marked as 'IsolatedAtom' "
@@ -71,3 +248,61 @@ class XYZReader:
     @property
     def atomic_numbers(self):
         return AtomicNumberTable(sorted(list(self.z_set)))
+
+
+def _atom_count(line: bytes) -> int | None:
+    """Number of atoms if `line` is the first line of a frame."""
+    fields = line.split()
+    if len(fields) == 1 and fields[0].isdigit():
+        return int(fields[0])
+    return None
+
+
+def _find_frame(f, offset: int) -> int:
+    """Offset of the first frame in an extxyz file that starts at or after `offset`.
+
+    Frames start with a line holding only the number of atoms. A candidate line
+    is accepted if the line after the frame it announces starts a frame as well
+    or is the end of the file, which rules out comment lines.
+    """
+    f.seek(max(offset - 1, 0))
+    # Move to the start of the next line unless `offset` is at the start of one
+    if offset > 0 and f.read(1) != b'\n':
+        f.readline()
+
+    while True:
+        position = f.tell()
+        line = f.readline()
+        if not line:
+            return position
+
+        num_atoms = _atom_count(line)
+        if num_atoms is not None:
+            # Skip the comment line and all atoms
+            lines = [f.readline() for _ in range(num_atoms + 1)]
+            if lines[-1]:
+                line = f.readline()
+                if not line.strip() or _atom_count(line) is not None:
+                    return position
+
+            f.seek(position)
+            f.readline()
+
+
+def split_xyz(filename: str, num_ranges: int) -> list[tuple[int, int]]:
+    """Split an extxyz file into at most `num_ranges` byte ranges of about equal
+    size, which start at frame boundaries."""
+    size = os.path.getsize(filename)
+
+    offsets = [0]
+    with open(filename, 'rb') as f:
+        for offset in np.linspace(0, size, num_ranges + 1, dtype=np.int64)[1:-1]:
+            offset = _find_frame(f, max(int(offset), offsets[-1]))
+            if offset >= size:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+
+    offsets.append(size)
+
+    return list(zip(offsets[:-1], offsets[1:]))
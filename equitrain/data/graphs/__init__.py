@@ -1,5 +1,24 @@
 from .atoms_to_graphs import AtomsToGraphs
+from .neighbor_list import (
+    NEIGHBOR_LIST_ENGINES,
+    BruteForceNeighborList,
+    CellListNeighborList,
+    MatscipyNeighborList,
+    NeighborListEngine,
+    VerletNeighborList,
+    get_neighbor_list_engine,
+)
+from .radius_graph import RadiusGraph, get_neighborhood_batch
 
 __all__ = [
     'AtomsToGraphs',
+    'NEIGHBOR_LIST_ENGINES',
+    'BruteForceNeighborList',
+    'CellListNeighborList',
+    'MatscipyNeighborList',
+    'NeighborListEngine',
+    'RadiusGraph',
+    'VerletNeighborList',
+    'get_neighbor_list_engine',
+    'get_neighborhood_batch',
 ]
@@ -1,10 +1,69 @@
 import numpy as np
 import torch
+from ase.stress import voigt_6_to_full_3x3_stress
 from torch_geometric.data import Data
 
-from equitrain.data.utility import atomic_numbers_to_indices, to_one_hot
+from equitrain.data.atomic import AtomicNumberTable
+from equitrain.data.utility import to_one_hot
 
-from .neighborhood import get_neighborhood
+from .neighborhood import get_neighborhood, get_neighborhood_cell
+
+
+def _as_tensor(array: np.ndarray, dtype: torch.dtype) -> torch.Tensor:
+    """Convert an array to a tensor, which shares memory with the array if it
+    already has the requested dtype and is copied exactly once otherwise."""
+    return torch.from_numpy(np.ascontiguousarray(array)).to(dtype)
+
+
+class CompactGraph(Data):
+    """Graph that omits attributes which can be derived from others, reducing the
+    amount of data sent from DataLoader workers to the main process.
+
+    Instead of the one-hot encoding `node_attrs`, the graph stores the integer
+    element indices `node_indices` and the number of elements `num_elements`.
+    The attributes `positions` (alias of `pos`), `node_attrs` and `tags` are
+    materialized on first access, i.e. after a batch was collated and received
+    by the main process, or after it was moved to the device. Tags are only
+    stored if given and are zero otherwise. Batches of compact graphs inherit
+    this behaviour.
+    """
+
+    LAZY_KEYS = ('positions', 'node_attrs', 'tags')
+
+    def __getattr__(self, key: str):
+        if key in CompactGraph.LAZY_KEYS and '_store' in self.__dict__:
+            self._materialize(key)
+        return super().__getattr__(key)
+
+    def __getitem__(self, key):
+        if isinstance(key, str) and key in CompactGraph.LAZY_KEYS:
+            self._materialize(key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key: str) -> bool:
+        if key in CompactGraph.LAZY_KEYS:
+            return 'pos' in self._store
+        return super().__contains__(key)
+
+    def _materialize(self, key: str) -> None:
+        store = self._store
+
+        if key in store or 'pos' not in store:
+            return
+
+        if key == 'positions':
+            store.positions = store.pos
+        elif key == 'node_attrs':
+            num_elements = store.num_elements
+            if torch.is_tensor(num_elements):
+                num_elements = int(num_elements.max())
+            store.node_attrs = to_one_hot(
+                store.node_indices.long().unsqueeze(-1), num_classes=num_elements
+            )
+        elif key == 'tags':
+            store.tags = torch.zeros(
+                store.pos.shape[0], dtype=store.pos.dtype, device=store.pos.device
+            )
 
 
 class AtomsToGraphs:
@@ -12,6 +71,7 @@ class AtomsToGraphs:
         self,
         atomic_numbers,
         radius=6,
+        *,
         r_energy=False,
         r_forces=False,
         r_stress=False,
@@ -19,7 +79,12 @@ class AtomsToGraphs:
         r_edges=False,
         r_fixed=False,
         r_pbc=False,
+        compact=False,
+        neighbor_list_engine=None,
     ):
+        if not isinstance(atomic_numbers, AtomicNumberTable):
+            atomic_numbers = AtomicNumberTable(atomic_numbers)
+
         self.atomic_numbers = atomic_numbers
         self.radius = radius
         self.r_energy = r_energy
@@ -29,11 +94,21 @@ class AtomsToGraphs:
         self.r_fixed = r_fixed
         self.r_edges = r_edges
         self.r_pbc = r_pbc
+        self.compact = compact
+        self.neighbor_list_engine = neighbor_list_engine
 
-    def _get_neighbors(self, atoms):
-        return get_neighborhood(
-            atoms.get_positions(), self.radius, atoms.pbc, np.array(atoms.get_cell())
-        )
+    def _get_neighbors(self, positions, cell, pbc, edge_index=None, unit_shifts=None):
+        if edge_index is None:
+            return get_neighborhood(
+                positions, self.radius, pbc, cell, engine=self.neighbor_list_engine
+            )
+
+        # Use precomputed neighbors, which requires the same cell
+        # as used by get_neighborhood
+        _, cell = get_neighborhood_cell(positions, self.radius, pbc, cell)
+        shifts = np.dot(unit_shifts, cell)
+
+        return edge_index, shifts, unit_shifts, cell
 
     def convert(
         self,
@@ -49,75 +124,190 @@ class AtomsToGraphs:
             and optionally, energy, forces, distances, edges, and periodic boundary conditions.
         """
 
-        # set the atomic numbers, positions, and cell
-        atomic_numbers = torch.tensor(atoms.get_atomic_numbers())
-        positions = torch.tensor(atoms.get_positions(), dtype=torch.get_default_dtype())
-        cell = torch.tensor(
-            np.array(atoms.get_cell()), dtype=torch.get_default_dtype()
-        ).view(1, 3, 3)
-        natoms = positions.shape[0]
-        # initialized to torch.zeros(natoms) if tags missing.
-        # https://wiki.fysik.dtu.dk/ase/_modules/ase/atoms.html#Atoms.get_tags
-        tags = torch.Tensor(atoms.get_tags())
-
-        indices = atomic_numbers_to_indices(atomic_numbers, self.atomic_numbers)
-        node_attrs = to_one_hot(
-            torch.tensor(indices, dtype=torch.long).unsqueeze(-1),
-            num_classes=len(self.atomic_numbers),
+        fixed = None
+        if self.r_fixed and hasattr(atoms, 'constraints'):
+            from ase.constraints import FixAtoms
+
+            fixed = [
+                constraint.index
+                for constraint in atoms.constraints
+                if isinstance(constraint, FixAtoms)
+            ]
+
+        return self.convert_arrays(
+            atomic_numbers=atoms.get_atomic_numbers(),
+            positions=atoms.get_positions(),
+            cell=np.array(atoms.get_cell()),
+            pbc=atoms.pbc,
+            tags=atoms.get_tags(),
+            energy=(
+                atoms.get_potential_energy(apply_constraint=False)
+                if self.r_energy
+                else None
+            ),
+            forces=atoms.get_forces(apply_constraint=False) if self.r_forces else None,
+            stress=(
+                atoms.get_stress(voigt=False, apply_constraint=False)
+                if self.r_stress
+                else None
+            ),
+            fixed=fixed,
         )
 
-        # put the minimum data in torch geometric data object
-        data = Data(
-            cell=cell,
-            cell_volume=atoms.cell.volume,
-            # atomic positions are sometimes expected as `pos`, or `positions`
-            pos=positions,
-            positions=positions,
-            # atomic numbers represented as one hot encoding
-            node_attrs=node_attrs,
-            # plain atomic numbers
-            atomic_numbers=atomic_numbers,
-            natoms=natoms,
-            tags=tags,
+    def convert_record(
+        self,
+        record: dict[str, np.ndarray],
+        edge_index: np.ndarray = None,
+        unit_shifts: np.ndarray = None,
+    ):
+        """Convert the raw fields of a structure as stored in equitrain data files,
+        i.e. as returned by `HDF5Dataset.read_record`, to a graph.
+
+        This avoids the construction of an intermediate `ase.Atoms` object. Tensors
+        share memory with the arrays of the record where data types agree.
+
+        Returns:
+            data (torch_geometric.data.Data): Same graph as returned by `convert`.
+        """
+        return self.convert_arrays(
+            atomic_numbers=record['atomic_numbers'],
+            positions=record['positions'],
+            cell=record['cell'],
+            pbc=record['pbc'],
+            energy=record['energy'] if self.r_energy else None,
+            forces=record['forces'] if self.r_forces else None,
+            stress=(
+                voigt_6_to_full_3x3_stress(record['stress']) if self.r_stress else None
+            ),
+            edge_index=edge_index,
+            unit_shifts=unit_shifts,
         )
 
-        # optionally include other properties
+    def convert_arrays(
+        self,
+        atomic_numbers: np.ndarray,
+        positions: np.ndarray,
+        cell: np.ndarray,
+        pbc: np.ndarray,
+        *,
+        tags: np.ndarray = None,
+        energy: float = None,
+        forces: np.ndarray = None,
+        stress: np.ndarray = None,
+        fixed: list[np.ndarray] = None,
+        edge_index: np.ndarray = None,
+        unit_shifts: np.ndarray = None,
+    ):
+        """Convert the raw arrays of a single atomic structure to a graph.
+
+        Args:
+            atomic_numbers (np.ndarray): Atomic numbers [num_atoms].
+            positions (np.ndarray): Atomic positions [num_atoms, 3].
+            cell (np.ndarray): Unit cell [3, 3].
+            pbc (np.ndarray): Periodic boundary conditions [3].
+            tags (np.ndarray): Optional atom tags [num_atoms], zero if missing.
+            energy (float): Potential energy, required if `r_energy` is set.
+            forces (np.ndarray): Forces [num_atoms, 3], required if `r_forces` is set.
+            stress (np.ndarray): Full stress tensor [3, 3], required if `r_stress` is set.
+            fixed (list[np.ndarray]): Indices of fixed atoms.
+            edge_index (np.ndarray): Precomputed edge index [2, n_edges] for `radius`.
+            unit_shifts (np.ndarray): Precomputed unit shifts [n_edges, 3] for `radius`.
+
+        Returns:
+            data (torch_geometric.data.Data): Same graph as returned by `convert`.
+        """
+
+        # keep a numpy copy of positions and cell for computing neighbors
+        positions_array = np.asarray(positions, dtype=np.float64)
+        cell_array = np.array(cell, dtype=np.float64)
+
+        dtype = torch.get_default_dtype()
+
+        # set the atomic numbers and positions
+        atomic_numbers = _as_tensor(atomic_numbers, torch.long)
+        positions = _as_tensor(positions_array, dtype)
+        natoms = positions.shape[0]
+        cell_volume = abs(np.linalg.det(cell_array))
+
+        # the cell is extended in non-periodic directions when computing neighbors,
+        # in which case the extended cell is stored
         if self.r_edges:
-            edge_index, shifts, unit_shifts, cell = self._get_neighbors(atoms)
+            edge_index, shifts, unit_shifts, cell = self._get_neighbors(
+                positions_array, cell_array, pbc, edge_index, unit_shifts
+            )
 
             if cell is None:
                 cell = 3 * [0.0, 0.0, 0.0]
 
-            data.edge_index = torch.tensor(edge_index, dtype=torch.long)
-            data.shifts = torch.tensor(shifts, dtype=torch.get_default_dtype())
-            data.unit_shifts = torch.tensor(
-                unit_shifts, dtype=torch.get_default_dtype()
+            cell = torch.tensor(cell, dtype=dtype)
+        else:
+            cell = torch.tensor(cell_array, dtype=dtype).view(1, 3, 3)
+
+        indices = self.atomic_numbers.to_indices(atomic_numbers)
+
+        if self.compact:
+            # node attributes, aliases and tags are materialized on first access
+            data = CompactGraph(
+                cell=cell,
+                cell_volume=cell_volume,
+                pos=positions,
+                node_indices=indices.to(torch.int16),
+                num_elements=len(self.atomic_numbers),
+                atomic_numbers=atomic_numbers,
+                natoms=natoms,
+            )
+            if tags is not None:
+                data.tags = _as_tensor(tags, dtype)
+        else:
+            # initialized to torch.zeros(natoms) if tags missing.
+            # https://wiki.fysik.dtu.dk/ase/_modules/ase/atoms.html#Atoms.get_tags
+            if tags is None:
+                tags = torch.zeros(natoms, dtype=dtype)
+            else:
+                tags = _as_tensor(tags, dtype)
+
+            node_attrs = to_one_hot(
+                indices.unsqueeze(-1), num_classes=len(self.atomic_numbers)
             )
-            data.cell = torch.tensor(cell, dtype=torch.get_default_dtype())
+
+            # put the minimum data in torch geometric data object
+            data = Data(
+                cell=cell,
+                cell_volume=cell_volume,
+                # atomic positions are sometimes expected as `pos`, or `positions`
+                pos=positions,
+                positions=positions,
+                # atomic numbers represented as one hot encoding
+                node_attrs=node_attrs,
+                # plain atomic numbers
+                atomic_numbers=atomic_numbers,
+                natoms=natoms,
+                tags=tags,
+            )
+
+        # optionally include other properties
+        if self.r_edges:
+            data.edge_index = _as_tensor(edge_index, torch.long)
+            data.shifts = _as_tensor(shifts, dtype)
+            data.unit_shifts = _as_tensor(unit_shifts, dtype)
 
         if self.r_energy:
-            energy = atoms.get_potential_energy(apply_constraint=False)
-            data.y = torch.tensor(energy, dtype=torch.get_default_dtype())
+            data.y = torch.tensor(energy, dtype=dtype)
 
         if self.r_forces:
-            forces = atoms.get_forces(apply_constraint=False)
-            data.force = torch.tensor(forces, dtype=torch.get_default_dtype())
+            data.force = _as_tensor(forces, dtype)
 
         if self.r_stress:
-            stress = np.array([atoms.get_stress(voigt=False, apply_constraint=False)])
-            data.stress = torch.tensor(stress, dtype=torch.get_default_dtype())
+            data.stress = torch.tensor(stress, dtype=dtype).view(1, 3, 3)
 
         if self.r_fixed:
             fixed_idx = torch.zeros(natoms)
-            if hasattr(atoms, 'constraints'):
-                from ase.constraints import FixAtoms
-
-                for constraint in atoms.constraints:
-                    if isinstance(constraint, FixAtoms):
-                        fixed_idx[constraint.index] = 1
+            if fixed is not None:
+                for index in fixed:
+                    fixed_idx[index] = 1
             data.fixed = fixed_idx
 
         if self.r_pbc:
-            data.pbc = torch.tensor(atoms.pbc)
+            data.pbc = torch.tensor(pbc)
 
         return data
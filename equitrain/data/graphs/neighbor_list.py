@@ -0,0 +1,319 @@
+import itertools
+
+import numpy as np
+from matscipy.neighbours import neighbour_list
+
+
+class NeighborListEngine:
+    """Computes all pairs of atoms within a cutoff radius.
+
+    Engines return `(sender, receiver, unit_shifts)`, where the distance vector of
+    an edge is given by `positions[receiver] - positions[sender] + unit_shifts @ cell`,
+    following the conventions of matscipy. Self-edges that do not cross periodic
+    boundaries are excluded. The cell is only used in periodic directions, but it
+    must be invertible.
+    """
+
+    name = None
+
+    def __call__(
+        self,
+        positions: np.ndarray,  # [num_positions, 3]
+        cutoff: float,
+        pbc: tuple[bool, bool, bool],
+        cell: np.ndarray,  # [3, 3]
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+
+class MatscipyNeighborList(NeighborListEngine):
+    """Neighbor lists computed by matscipy, which requires the cell to be extended
+    in non-periodic directions such that all atoms are inside the cell."""
+
+    name = 'matscipy'
+
+    def __call__(self, positions, cutoff, pbc, cell):
+        return neighbour_list(
+            quantities='ijS',
+            pbc=pbc,
+            cell=cell,
+            positions=positions,
+            cutoff=cutoff,
+        )
+
+
+def _periodic_images(
+    positions: np.ndarray,
+    cutoff: float,
+    pbc: tuple[bool, bool, bool],
+    cell: np.ndarray,
+    padding: bool = True,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Wrap positions into the cell in periodic directions and generate all
+    periodic images required for the cutoff radius.
+
+    Returns the wrapped positions [num_positions, 3], the unit cells in which the
+    original positions are located [num_positions, 3], and for all images the
+    index of the atom [num_images], the unit shift [num_images, 3] and the
+    position [num_images, 3]. Images include the wrapped positions with zero
+    shifts. If `padding` is set, only images within the cutoff radius of the
+    cell are kept.
+    """
+    pbc = np.asarray(pbc, dtype=bool)
+
+    # Columns of the inverse cell are the reciprocal vectors, their norms are the
+    # inverse distances between opposite faces of the cell
+    inverse = np.linalg.inv(cell)
+    reciprocal_norms = np.linalg.norm(inverse, axis=0)
+
+    scaled = positions @ inverse
+    offsets = np.where(pbc, np.floor(scaled), 0.0).astype(np.int64)
+    scaled = scaled - offsets
+    wrapped = scaled @ cell
+
+    num_shifts = np.where(pbc, np.ceil(cutoff * reciprocal_norms), 0).astype(np.int64)
+    shifts = np.array(
+        list(itertools.product(*[range(-n, n + 1) for n in num_shifts])),
+        dtype=np.int64,
+    )  # [num_shifts, 3]
+
+    # Scaled positions of all images [num_shifts, num_positions, 3]
+    scaled_images = scaled[None, :, :] + shifts[:, None, :]
+
+    if padding:
+        margin = cutoff * reciprocal_norms
+        inside = (scaled_images >= -margin) & (scaled_images < 1.0 + margin)
+        keep = np.all(inside | ~pbc, axis=-1)
+    else:
+        keep = np.ones(scaled_images.shape[:2], dtype=bool)
+
+    shift_index, image_index = np.nonzero(keep)
+
+    return (
+        wrapped,
+        offsets,
+        image_index,
+        shifts[shift_index],
+        scaled_images[shift_index, image_index] @ cell,
+    )
+
+
+def _finalize_pairs(
+    sender: np.ndarray,
+    image: np.ndarray,
+    offsets: np.ndarray,
+    image_index: np.ndarray,
+    image_shifts: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Convert pairs of atoms and images to edges between the original positions."""
+    receiver = image_index[image]
+
+    # Positions were wrapped into the cell, which is accounted for in the shifts
+    unit_shifts = image_shifts[image] + offsets[sender] - offsets[receiver]
+
+    # Remove self-edges that do not cross periodic boundaries
+    keep = (sender != receiver) | np.any(unit_shifts != 0, axis=1)
+
+    return sender[keep], receiver[keep], unit_shifts[keep]
+
+
+class CellListNeighborList(NeighborListEngine):
+    """Vectorized cell-list algorithm in NumPy with linear scaling in the number
+    of atoms.
+
+    Periodic images within the cutoff radius of the cell are generated explicitly
+    and sorted into cubic bins of the size of the cutoff radius, which only cover
+    the bounding box of the atoms. Hence, the extension of the cell in non-periodic
+    directions has no effect on the cost. Candidate pairs are processed in chunks
+    of at most `max_pairs` to bound memory usage.
+    """
+
+    name = 'cell-list'
+
+    def __init__(self, max_pairs: int = 2**22):
+        self.max_pairs = max_pairs
+
+    def __call__(self, positions, cutoff, pbc, cell):
+        wrapped, offsets, image_index, image_shifts, image_positions = _periodic_images(
+            positions, cutoff, pbc, cell
+        )
+
+        # Assign images to bins, padded by one bin in each direction such that
+        # all neighboring bins of atoms have valid keys
+        origin = image_positions.min(axis=0)
+        image_bins = np.floor((image_positions - origin) / cutoff).astype(np.int64) + 1
+        num_bins = image_bins.max(axis=0) + 2
+        strides = np.array([num_bins[1] * num_bins[2], num_bins[2], 1], dtype=np.int64)
+
+        # Sort images by bin, such that the images of each bin are contiguous
+        image_keys = image_bins @ strides
+        order = np.argsort(image_keys, kind='stable')
+        image_keys = image_keys[order]
+        sorted_positions = image_positions[order]
+
+        # Keys of the 27 bins neighboring the bin of each atom [num_positions, 27]
+        atom_bins = np.floor((wrapped - origin) / cutoff).astype(np.int64) + 1
+        neighbor_offsets = np.array(
+            list(itertools.product(range(-1, 2), repeat=3)), dtype=np.int64
+        )
+        neighbor_keys = (atom_bins @ strides)[:, None] + neighbor_offsets @ strides
+
+        starts = np.searchsorted(image_keys, neighbor_keys, side='left')
+        counts = np.searchsorted(image_keys, neighbor_keys, side='right') - starts
+
+        senders, images = [], []
+
+        # Chunks of atoms with a bounded number of candidate pairs
+        atom_counts = counts.sum(axis=1)
+        atom_offsets = np.concatenate(([0], np.cumsum(atom_counts)))
+        chunk_start = 0
+        while chunk_start < len(wrapped):
+            chunk_end = np.searchsorted(
+                atom_offsets, atom_offsets[chunk_start] + self.max_pairs, side='right'
+            )
+            chunk_end = max(chunk_end - 1, chunk_start + 1)
+
+            chunk_starts = starts[chunk_start:chunk_end].reshape(-1)
+            chunk_counts = counts[chunk_start:chunk_end].reshape(-1)
+
+            # Expand ranges of sorted images to candidate pairs
+            sender = np.repeat(
+                np.arange(chunk_start, chunk_end), atom_counts[chunk_start:chunk_end]
+            )
+            image = np.arange(chunk_counts.sum()) + np.repeat(
+                chunk_starts - (np.cumsum(chunk_counts) - chunk_counts), chunk_counts
+            )
+
+            # Contiguous take and repeat are considerably faster than fancy indexing
+            distances = np.take(sorted_positions, image, axis=0) - np.repeat(
+                wrapped[chunk_start:chunk_end],
+                atom_counts[chunk_start:chunk_end],
+                axis=0,
+            )
+            within = np.einsum('ij,ij->i', distances, distances) < cutoff * cutoff
+
+            senders.append(sender[within])
+            images.append(order[image[within]])
+
+            chunk_start = chunk_end
+
+        return _finalize_pairs(
+            np.concatenate(senders),
+            np.concatenate(images),
+            offsets,
+            image_index,
+            image_shifts,
+        )
+
+
+class BruteForceNeighborList(NeighborListEngine):
+    """Computes distances between all atoms and periodic images, which has the
+    least overhead for tiny systems."""
+
+    name = 'brute-force'
+
+    def __call__(self, positions, cutoff, pbc, cell):
+        wrapped, offsets, image_index, image_shifts, image_positions = _periodic_images(
+            positions, cutoff, pbc, cell
+        )
+
+        distances = image_positions[None, :, :] - wrapped[:, None, :]
+        sender, image = np.nonzero(
+            np.einsum('ijk,ijk->ij', distances, distances) < cutoff * cutoff
+        )
+
+        return _finalize_pairs(sender, image, offsets, image_index, image_shifts)
+
+
+class VerletNeighborList(NeighborListEngine):
+    """Incremental neighbor lists for consecutive frames of a trajectory.
+
+    Candidate pairs are computed by `engine` for the cutoff radius extended by
+    `skin` and reused as long as no atom moved by more than half the skin since
+    they were computed. Edges are obtained by filtering the candidate pairs for the
+    current positions. The candidates are recomputed if the number of atoms, the
+    periodic boundary conditions, the cell in periodic directions or the cutoff
+    radius change.
+    """
+
+    name = 'verlet'
+
+    def __init__(
+        self, skin: float = 0.5, engine: str | NeighborListEngine | None = None
+    ):
+        self.skin = skin
+        self.engine = get_neighbor_list_engine(engine)
+        self.num_builds = 0
+
+        self.positions = None
+        self.cutoff = None
+        self.pbc = None
+        self.cell = None
+        self.candidates = None
+        self.shifts = None
+
+    def is_valid(self, positions, cutoff, pbc, cell) -> bool:
+        """Whether the candidate pairs can be reused for the given frame."""
+        if self.positions is None or self.positions.shape != positions.shape:
+            return False
+
+        pbc = np.asarray(pbc, dtype=bool)
+        if self.cutoff != cutoff or not np.array_equal(self.pbc, pbc):
+            return False
+        if not np.array_equal(self.cell[pbc], cell[pbc]):
+            return False
+
+        displacements = positions - self.positions
+        max_displacement = np.max(np.einsum('ij,ij->i', displacements, displacements))
+
+        return max_displacement <= 0.25 * self.skin * self.skin
+
+    def build(self, positions, cutoff, pbc, cell) -> None:
+        self.candidates = self.engine(positions, cutoff + self.skin, pbc, cell)
+        self.num_builds += 1
+
+        # Shifts remain valid as long as the cell in periodic directions is fixed
+        self.shifts = self.candidates[2] @ cell
+
+        self.positions = np.array(positions, dtype=np.float64)
+        self.cutoff = cutoff
+        self.pbc = np.array(pbc, dtype=bool)
+        self.cell = np.array(cell, dtype=np.float64)
+
+    def __call__(self, positions, cutoff, pbc, cell):
+        if not self.is_valid(positions, cutoff, pbc, cell):
+            self.build(positions, cutoff, pbc, cell)
+
+        sender, receiver, unit_shifts = self.candidates
+
+        distances = np.take(positions, receiver, axis=0)
+        distances -= np.take(positions, sender, axis=0)
+        distances += self.shifts
+        within = np.einsum('ij,ij->i', distances, distances) < cutoff * cutoff
+
+        return sender[within], receiver[within], unit_shifts[within]
+
+
+NEIGHBOR_LIST_ENGINES = {
+    engine.name: engine
+    for engine in [MatscipyNeighborList, CellListNeighborList, BruteForceNeighborList]
+}
+
+
+def get_neighbor_list_engine(
+    engine: str | NeighborListEngine | None = None,
+) -> NeighborListEngine:
+    """Return the neighbor list engine with the given name, matscipy by default."""
+    if engine is None:
+        engine = MatscipyNeighborList.name
+
+    if isinstance(engine, NeighborListEngine):
+        return engine
+
+    if engine not in NEIGHBOR_LIST_ENGINES:
+        raise ValueError(
+            f'Unknown neighbor list engine {engine}, '
+            f'expected one of {", ".join(NEIGHBOR_LIST_ENGINES)}'
+        )
+
+    return NEIGHBOR_LIST_ENGINES[engine]()
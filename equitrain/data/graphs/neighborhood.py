@@ -1,14 +1,16 @@
 import numpy as np
-from matscipy.neighbours import neighbour_list
 
+from .neighbor_list import NeighborListEngine, get_neighbor_list_engine
 
-def get_neighborhood(
+
+def get_neighborhood_cell(
     positions: np.ndarray,  # [num_positions, 3]
     cutoff: float,
     pbc: tuple[bool, bool, bool] | None = None,
     cell: np.ndarray | None = None,  # [3, 3]
-    true_self_interaction=False,
-) -> tuple[np.ndarray, np.ndarray]:
+) -> tuple[tuple[bool, bool, bool], np.ndarray]:
+    """Return pbc and the cell used for computing neighbors, where the cell
+    is extended in non-periodic directions. The given cell is modified in-place."""
     if pbc is None:
         pbc = (False, False, False)
 
@@ -33,14 +35,25 @@ def get_neighborhood(
     if not pbc_z:
         cell[2, :] = max_positions * 5 * cutoff * identity[2, :]
 
-    sender, receiver, unit_shifts = neighbour_list(
-        quantities='ijS',
-        pbc=pbc,
-        cell=cell,
-        positions=positions,
-        cutoff=cutoff,
-        # self_interaction=True,  # we want edges from atom to itself in different periodic images
-        # use_scaled_positions=False,  # positions are not scaled positions
+    return pbc, cell
+
+
+def get_neighborhood(
+    positions: np.ndarray,  # [num_positions, 3]
+    cutoff: float,
+    pbc: tuple[bool, bool, bool] | None = None,
+    cell: np.ndarray | None = None,  # [3, 3]
+    *,
+    true_self_interaction=False,
+    engine: str | NeighborListEngine | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Compute the edges of all atom pairs within the cutoff radius, using the
+    given neighbor list engine (matscipy by default). The returned cell is
+    extended in non-periodic directions, see `get_neighborhood_cell`."""
+    pbc, cell = get_neighborhood_cell(positions, cutoff, pbc, cell)
+
+    sender, receiver, unit_shifts = get_neighbor_list_engine(engine)(
+        positions, cutoff, pbc, cell
     )
 
     if not true_self_interaction:
@@ -0,0 +1,188 @@
+import itertools
+
+import torch
+
+
+def _segment_reduce(
+    values: torch.Tensor, batch: torch.Tensor, num_graphs: int, reduce: str
+) -> torch.Tensor:
+    """Reduce rows of `values` [n, ...] over the graphs given by `batch` [n]."""
+    out = values.new_zeros((num_graphs, *values.shape[1:]))
+    index = batch.view(-1, *([1] * (values.dim() - 1))).expand_as(values)
+    return out.scatter_reduce(0, index, values, reduce=reduce, include_self=False)
+
+
+def get_neighborhood_cell_batch(
+    positions: torch.Tensor,  # [num_positions, 3]
+    cutoff: float,
+    pbc: torch.Tensor,  # [num_graphs, 3]
+    cell: torch.Tensor,  # [num_graphs, 3, 3]
+    batch: torch.Tensor,  # [num_positions]
+) -> torch.Tensor:
+    """Batched version of `get_neighborhood_cell`, which returns a copy of the
+    cells extended in non-periodic directions [num_graphs, 3, 3]."""
+    num_graphs = cell.shape[0]
+
+    cell = cell.clone()
+    cell[~cell.reshape(num_graphs, 9).any(dim=1)] = torch.eye(
+        3, dtype=cell.dtype, device=cell.device
+    )
+
+    max_positions = (
+        _segment_reduce(positions.abs().amax(dim=1), batch, num_graphs, 'amax') + 1
+    )
+    extended = (max_positions * 5 * cutoff)[:, None, None] * torch.eye(
+        3, dtype=cell.dtype, device=cell.device
+    )
+
+    return torch.where(pbc[:, :, None], cell, extended)
+
+
+def get_neighborhood_batch(
+    positions: torch.Tensor,  # [num_positions, 3]
+    cutoff: float,
+    pbc: torch.Tensor,  # [num_graphs, 3]
+    cell: torch.Tensor,  # [num_graphs, 3, 3]
+    batch: torch.Tensor,  # [num_positions]
+) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Compute the edges of all graphs in a batch at once, on the device of the
+    given tensors.
+
+    Returns the same edges as `get_neighborhood` for each graph, i.e. the edge
+    index [2, num_edges] with global node indices, the shifts [num_edges, 3], the
+    unit shifts [num_edges, 3] and the extended cells [num_graphs, 3, 3]. Edges
+    are sorted by sender. Computations are carried out in double precision, but
+    for positions of lower precision, pairs at a distance close to the cutoff
+    radius may differ. The algorithm is the same as for the cell-list engine,
+    where bins of different graphs are kept apart by including the graph index
+    in their keys.
+    """
+    dtype = positions.dtype
+    num_graphs = cell.shape[0]
+
+    positions = positions.double()
+    pbc = pbc.bool()
+    cell = get_neighborhood_cell_batch(positions, cutoff, pbc, cell.double(), batch)
+
+    # Wrap positions into the cell in periodic directions
+    inverse = torch.linalg.inv(cell)
+    reciprocal_norms = torch.linalg.norm(inverse, dim=1)  # [num_graphs, 3]
+
+    scaled = torch.einsum('ni,nij->nj', positions, inverse[batch])
+    offsets = torch.where(pbc[batch], torch.floor(scaled), 0.0)
+    scaled = scaled - offsets
+
+    # Periodic images within the cutoff radius of each cell, where the shifts
+    # cover the largest range required by any graph of the batch
+    num_shifts = torch.where(pbc, torch.ceil(cutoff * reciprocal_norms), 0.0)
+    shifts = torch.tensor(
+        list(
+            itertools.product(
+                *[range(-n, n + 1) for n in num_shifts.amax(dim=0).long().tolist()]
+            )
+        ),
+        dtype=torch.float64,
+        device=positions.device,
+    )  # [num_shifts, 3]
+
+    scaled_images = scaled[None, :, :] + shifts[:, None, :]
+    margin = (cutoff * reciprocal_norms)[batch]
+    keep = (shifts[:, None, :].abs() <= num_shifts[batch]) & (
+        ~pbc[batch] | ((scaled_images >= -margin) & (scaled_images < 1.0 + margin))
+    )
+    shift_index, image_index = torch.nonzero(keep.all(dim=-1), as_tuple=True)
+
+    image_graph = batch[image_index]
+    image_positions = torch.einsum(
+        'ni,nij->nj', scaled_images[shift_index, image_index], cell[image_graph]
+    )
+    wrapped = torch.einsum('ni,nij->nj', scaled, cell[batch])
+
+    # Bins of the size of the cutoff radius, padded by one bin in each direction
+    origin = _segment_reduce(image_positions, image_graph, num_graphs, 'amin')
+    image_bins = torch.floor((image_positions - origin[image_graph]) / cutoff).long()
+    image_bins += 1
+    num_bins = image_bins.amax(dim=0) + 2
+    strides = torch.stack(
+        [num_bins[1] * num_bins[2], num_bins[2], torch.ones_like(num_bins[2])]
+    )
+    graph_stride = torch.prod(num_bins)
+
+    # Sort images by bin, such that the images of each bin are contiguous
+    image_keys = image_graph * graph_stride + image_bins @ strides
+    image_keys, order = torch.sort(image_keys, stable=True)
+    sorted_positions = image_positions.index_select(0, order)
+
+    # Keys of the 27 bins neighboring the bin of each atom [num_positions, 27]
+    atom_bins = torch.floor((wrapped - origin[batch]) / cutoff).long() + 1
+    neighbor_offsets = torch.tensor(
+        list(itertools.product(range(-1, 2), repeat=3)), device=positions.device
+    )
+    atom_keys = batch * graph_stride + atom_bins @ strides
+    neighbor_keys = atom_keys[:, None] + neighbor_offsets @ strides
+
+    starts = torch.searchsorted(image_keys, neighbor_keys, side='left')
+    counts = torch.searchsorted(image_keys, neighbor_keys, side='right') - starts
+
+    # Expand ranges of sorted images to candidate pairs
+    atom_counts = counts.sum(dim=1)
+    counts, starts = counts.reshape(-1), starts.reshape(-1)
+    num_pairs = int(atom_counts.sum())
+
+    sender = torch.repeat_interleave(
+        torch.arange(positions.shape[0], device=positions.device),
+        atom_counts,
+        output_size=num_pairs,
+    )
+    image = torch.arange(num_pairs, device=positions.device)
+    image += torch.repeat_interleave(
+        starts - (torch.cumsum(counts, dim=0) - counts), counts, output_size=num_pairs
+    )
+
+    # Contiguous selections are considerably faster than advanced indexing
+    distances = sorted_positions.index_select(0, image)
+    distances -= wrapped.index_select(0, sender)
+    distances *= distances
+    # Matrix-vector product is faster than reducing over the last dimension
+    within = distances @ distances.new_ones(3) < cutoff * cutoff
+    sender, image = sender[within], order[image[within]]
+
+    receiver = image_index[image]
+    unit_shifts = shifts[shift_index[image]] + offsets[sender] - offsets[receiver]
+
+    # Remove self-edges that do not cross periodic boundaries
+    keep = (sender != receiver) | (unit_shifts != 0).any(dim=1)
+    sender, receiver, unit_shifts = sender[keep], receiver[keep], unit_shifts[keep]
+
+    edge_index = torch.stack((sender, receiver))
+    shifts = torch.einsum('ni,nij->nj', unit_shifts, cell[batch[sender]])
+
+    return edge_index, shifts.to(dtype), unit_shifts.to(dtype), cell.to(dtype)
+
+
+class RadiusGraph:
+    """Computes edges of collated batches of graphs without edges, as returned by
+    `HDF5GraphDataset` with `r_edges=False`. Batches are modified in place, such
+    that they match batches of graphs with edges computed by `AtomsToGraphs`."""
+
+    def __init__(self, r_max: float):
+        self.r_max = r_max
+
+    def __call__(self, data):
+        if 'edge_index' in data:
+            return data
+
+        edge_index, shifts, unit_shifts, cell = get_neighborhood_batch(
+            data.positions,
+            self.r_max,
+            data.pbc.view(-1, 3),
+            data.cell.view(-1, 3, 3),
+            data.batch,
+        )
+
+        data.edge_index = edge_index
+        data.shifts = shifts
+        data.unit_shifts = unit_shifts
+        data.cell = cell.view(-1, 3)
+
+        return data
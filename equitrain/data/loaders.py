@@ -1,45 +1,119 @@
 from pathlib import Path
 
+import numpy as np
 import torch
 from accelerate import Accelerator
 
+from equitrain.argparser import ArgumentError
 from equitrain.data.format_hdf5.dataset import HDF5GraphDataset
-from equitrain.logger import FileLogger
+from equitrain.data.format_hdf5.index import DatasetIndex
+from equitrain.data.format_npy import NumpyGraphDataset
+from equitrain.data.format_shm import SharedGraphDataset, open_shared_store
 
+from .cache import GraphCache
 from .loaders_dynamic import DynamicGraphLoader
+from .samplers import (
+    BalancedBatchSampler,
+    BucketedBatchSampler,
+    BudgetBatchSampler,
+    ShardedBatchSampler,
+)
+from .samplers_priority import PrioritySampler
 
 
-def dataloader_update_errors(
+def get_batch_sampler(
     args,
-    dataloader,
-    errors: torch.Tensor,
+    data_set: HDF5GraphDataset,
+    r_max: float,
     accelerator: Accelerator = None,
-    logger: FileLogger = None,
+    graph_cache: bool = False,
 ):
-    generator = torch.Generator(device=accelerator.device)
-
-    dataloader = DynamicGraphLoader(
-        dataset=dataloader.dataset,
-        errors=errors,
-        errors_threshold=args.weighted_sampler_threshold,
-        batch_size=args.batch_size,
-        shuffle=False,
-        drop_last=False,
-        pin_memory=args.pin_memory,
-        num_workers=args.workers,
-        max_nodes=args.batch_max_nodes,
-        max_edges=args.batch_max_edges,
-        drop=args.batch_drop,
-        generator=generator,
-    )
+    num_processes = accelerator.num_processes if accelerator is not None else 1
 
-    if accelerator is not None:
-        dataloader = accelerator.prepare(dataloader)
+    if args.sampler == 'random':
+        if graph_cache:
+            # Send structures to the worker that caches them
+            return ShardedBatchSampler(
+                len(data_set),
+                args.batch_size,
+                num_workers=args.workers,
+                num_processes=num_processes,
+                shuffle=args.shuffle,
+                seed=args.seed,
+            )
+        return None
+
+    if args.sampler == 'budget':
+        if args.batch_max_nodes is None and args.batch_max_edges is None:
+            raise ArgumentError(
+                '--sampler budget requires --batch-max-nodes or --batch-max-edges'
+            )
+        # Edge counts are only required for an edge budget
+        r_max_index = r_max if args.batch_max_edges is not None else None
+    else:
+        r_max_index = None
+
+    index = data_set.index
+    if index is None or (r_max_index is not None and not index.has_edges(r_max)):
+        index = DatasetIndex.from_dataset(
+            data_set, r_max=r_max_index, engine=args.neighbor_list_engine
+        )
+
+    if args.sampler == 'budget':
+
+        def batch_sampler_fn(indices, seed):
+            return BudgetBatchSampler(
+                index.num_atoms[indices],
+                index.num_edges[indices] if index.num_edges is not None else None,
+                max_nodes=args.batch_max_nodes,
+                max_edges=args.batch_max_edges,
+                shuffle=args.shuffle,
+                drop=args.batch_drop,
+                seed=seed,
+            )
+
+    else:
+        # Group by edge counts if available, which better reflect the cost of a structure
+        if index.has_edges(r_max):
+            sizes = index.num_edges
+        else:
+            sizes = index.num_atoms
+
+        def batch_sampler_fn(indices, seed):
+            return BucketedBatchSampler(
+                sizes[indices],
+                batch_size=args.batch_size,
+                shuffle=args.shuffle,
+                seed=seed,
+            )
 
-    if logger is not None:
-        logger.log(1, 'Updating training loader with new sampling weights')
+    if graph_cache:
+        # Batches are planned for the structures cached by each worker, to which
+        # they are sent. Work is not balanced across processes in this case
+        return ShardedBatchSampler(
+            len(data_set),
+            num_workers=args.workers,
+            num_processes=num_processes,
+            shuffle=args.shuffle,
+            seed=args.seed,
+            batch_sampler_fn=batch_sampler_fn,
+        )
 
-    return dataloader
+    if args.sampler == 'budget' and num_processes > 1:
+        # Balance work across processes, accelerate assigns consecutive
+        # batches to different processes
+        return BalancedBatchSampler(
+            index.num_atoms,
+            index.num_edges,
+            max_nodes=args.batch_max_nodes,
+            max_edges=args.batch_max_edges,
+            num_replicas=num_processes,
+            shuffle=args.shuffle,
+            drop=args.batch_drop,
+            seed=args.seed,
+        )
+
+    return batch_sampler_fn(np.arange(len(data_set)), args.seed)
 
 
 def get_dataloader(
@@ -48,18 +122,125 @@ def get_dataloader(
     atomic_numbers: list[int],
     r_max: float,
     accelerator: Accelerator = None,
+    *,
+    weighted_sampler: bool = False,
 ):
     if data_file is None:
         return None
 
-    data_set = HDF5GraphDataset(data_file, r_max=r_max, atomic_numbers=atomic_numbers)
+    if args.shared_memory_store:
+        store = open_shared_store(
+            data_file,
+            r_max,
+            accelerator,
+            root=args.shared_memory_dir,
+            engine=args.neighbor_list_engine,
+        )
+        data_set = SharedGraphDataset(
+            store,
+            r_max=r_max,
+            atomic_numbers=atomic_numbers,
+            compact=args.compact_graphs,
+            r_edges=not args.batched_neighbors,
+        )
+    elif Path(data_file).is_dir():
+        data_set = NumpyGraphDataset(
+            data_file,
+            r_max=r_max,
+            atomic_numbers=atomic_numbers,
+            compact=args.compact_graphs,
+            neighbor_list_engine=args.neighbor_list_engine,
+            r_edges=not args.batched_neighbors,
+        )
+    else:
+        data_set = HDF5GraphDataset(
+            data_file,
+            r_max=r_max,
+            atomic_numbers=atomic_numbers,
+            compact=args.compact_graphs,
+            neighbor_list_engine=args.neighbor_list_engine,
+            r_edges=not args.batched_neighbors,
+            rdcc_nbytes=args.hdf5_cache_size,
+            page_buf_size=args.hdf5_page_buffer_size,
+            swmr=args.hdf5_swmr,
+        )
+
+    if (
+        args.batched_neighbors
+        and args.batch_max_edges is not None
+        and args.sampler != 'budget'
+    ):
+        # Graphs have no edges when batches are split in data loading workers
+        raise ArgumentError(
+            '--batched-neighbors requires --sampler budget with --batch-max-edges'
+        )
+
+    if weighted_sampler and args.sampler != 'random':
+        raise ArgumentError(
+            f'--weighted-sampler cannot be combined with --sampler {args.sampler}'
+        )
+
+    if args.graph_cache_size is not None:
+        num_processes = accelerator.num_processes if accelerator is not None else 1
+        process_index = accelerator.process_index if accelerator is not None else 0
+
+        if weighted_sampler and num_processes * max(args.workers, 1) > 1:
+            # Sampled structures cannot be sent to the worker that caches them
+            raise ArgumentError(
+                '--weighted-sampler cannot be combined with --graph-cache-size '
+                'for multiple data loading workers or processes'
+            )
+
+    batch_sampler = get_batch_sampler(
+        args,
+        data_set,
+        r_max,
+        accelerator,
+        graph_cache=args.graph_cache_size is not None and not weighted_sampler,
+    )
+
+    if args.graph_cache_size is not None:
+        data_set = GraphCache(
+            data_set,
+            args.graph_cache_size,
+            num_workers=args.workers,
+            process_index=process_index,
+            num_processes=num_processes,
+        )
+
+    if weighted_sampler:
+        # Priorities are updated in place, so that the loader and its workers
+        # are kept alive across epochs
+        sampler = PrioritySampler(
+            len(data_set),
+            threshold=args.weighted_sampler_threshold,
+            shuffle=args.shuffle,
+            seed=args.seed,
+        )
+        loader_kwargs = dict(
+            batch_size=args.batch_size,
+            sampler=sampler,
+            drop_last=False,
+            persistent_workers=args.workers > 0,
+        )
+    elif batch_sampler is None:
+        loader_kwargs = dict(
+            batch_size=args.batch_size, shuffle=args.shuffle, drop_last=False
+        )
+    else:
+        # Batches are formed by the sampler
+        loader_kwargs = dict(batch_sampler=batch_sampler)
+
+    if args.graph_cache_size is not None:
+        # Caches of workers are kept across epochs
+        loader_kwargs['persistent_workers'] = args.workers > 0
+
+    if args.workers > 0 and args.workers_start_method is not None:
+        loader_kwargs['multiprocessing_context'] = args.workers_start_method
 
     data_loader = DynamicGraphLoader(
         dataset=data_set,
-        errors=None,
-        batch_size=args.batch_size,
-        shuffle=args.shuffle,
-        drop_last=False,
+        **loader_kwargs,
         pin_memory=args.pin_memory,
         num_workers=args.workers,
         max_nodes=args.batch_max_nodes,
@@ -85,6 +266,7 @@ def get_dataloaders(
         atomic_numbers,
         r_max,
         accelerator,
+        weighted_sampler=args.weighted_sampler,
     )
     valid_loader = get_dataloader(
         args,
@@ -0,0 +1,390 @@
+from collections.abc import Callable
+
+import numpy as np
+import torch
+
+
+class EpochBatchSampler(torch.utils.data.Sampler):
+    """Base class of batch samplers that plan all batches of an epoch at once.
+
+    Batches are computed once per epoch by `_plan` and are deterministic for
+    a given seed and epoch. The epoch is incremented after each iteration.
+    """
+
+    def __init__(self, shuffle: bool = True, seed: int = 0):
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+        self._batches = None
+        self._batches_epoch = None
+
+    def __len__(self):
+        return len(self.batches(self.epoch))
+
+    def __iter__(self):
+        try:
+            yield from self.batches(self.epoch)
+        finally:
+            self.epoch += 1
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def batches(self, epoch: int) -> list[list[int]]:
+        """Batches of the given epoch, which are computed only once."""
+        if self._batches_epoch != epoch:
+            self._batches = self._plan(epoch)
+            self._batches_epoch = epoch
+
+        return self._batches
+
+    def _plan(self, epoch: int) -> list[list[int]]:
+        raise NotImplementedError
+
+
+class BudgetBatchSampler(EpochBatchSampler):
+    """Batch sampler that packs structures into batches with a node and edge budget.
+
+    Indices are shuffled and split into windows of `window_size` structures.
+    Within each window, structures are packed with first-fit-decreasing, i.e.
+    structures are sorted by size and each one is placed into the first batch
+    that still has room for it. The least filled batch of a window is carried
+    over to the next window, so that all batches except the last ones of an
+    epoch are well filled. Each batch fits the budget and therefore results in
+    exactly one forward and backward pass.
+
+    Structures exceeding the budget are either dropped or placed in a batch
+    of their own.
+    """
+
+    def __init__(
+        self,
+        num_nodes: np.ndarray,
+        num_edges: np.ndarray = None,
+        max_nodes: int = None,
+        max_edges: int = None,
+        *,
+        shuffle: bool = True,
+        window_size: int = 4096,
+        drop: bool = False,
+        seed: int = 0,
+    ):
+        if max_nodes is None and max_edges is None:
+            raise ValueError('Either max_nodes or max_edges must be specified')
+        if max_edges is not None and num_edges is None:
+            raise ValueError('Number of edges is required for an edge budget')
+
+        super().__init__(shuffle=shuffle, seed=seed)
+
+        self.num_nodes = np.asarray(num_nodes, dtype=np.int64)
+        self.num_edges = (
+            np.asarray(num_edges, dtype=np.int64)
+            if num_edges is not None
+            else np.zeros_like(self.num_nodes)
+        )
+        # A missing budget is treated as infinite
+        self.max_nodes = max_nodes if max_nodes is not None else np.iinfo(np.int64).max
+        self.max_edges = max_edges if max_edges is not None else np.iinfo(np.int64).max
+        self.window_size = window_size
+        self.drop = drop
+
+    def fill(self, batch: list[int]) -> float:
+        """Fraction of the node or edge budget used by a batch."""
+        return max(
+            self.num_nodes[batch].sum() / self.max_nodes,
+            self.num_edges[batch].sum() / self.max_edges,
+        )
+
+    def _plan(self, epoch: int) -> list[list[int]]:
+        rng = np.random.default_rng((self.seed, epoch))
+
+        if self.shuffle:
+            indices = rng.permutation(len(self.num_nodes))
+        else:
+            indices = np.arange(len(self.num_nodes))
+
+        oversized = (self.num_nodes[indices] > self.max_nodes) | (
+            self.num_edges[indices] > self.max_edges
+        )
+
+        batches = []
+        if not self.drop:
+            batches.extend([[int(i)] for i in indices[oversized]])
+
+        indices = indices[~oversized]
+
+        carry = np.zeros(0, dtype=np.int64)
+        for start in range(0, len(indices), self.window_size):
+            window = np.concatenate([carry, indices[start : start + self.window_size]])
+            window_batches = self._pack(window)
+
+            # Carry the least filled batch over to the next window
+            if start + self.window_size < len(indices) and len(window_batches) > 1:
+                j = np.argmin([self.fill(batch) for batch in window_batches])
+                carry = np.array(window_batches.pop(j), dtype=np.int64)
+            else:
+                carry = np.zeros(0, dtype=np.int64)
+
+            batches.extend(window_batches)
+
+        # Packing orders batches by size, shuffle them across the epoch
+        if self.shuffle:
+            batches = [batches[j] for j in rng.permutation(len(batches))]
+
+        return batches
+
+    def _pack(self, indices: np.ndarray) -> list[list[int]]:
+        nodes = self.num_nodes[indices]
+        edges = self.num_edges[indices]
+
+        # Sort by the fraction of the budget required by each structure
+        cost = np.maximum(nodes / self.max_nodes, edges / self.max_edges)
+        order = np.argsort(-cost, kind='stable')
+
+        # Remaining budget of each batch
+        free_nodes = np.empty(len(indices), dtype=np.int64)
+        free_edges = np.empty(len(indices), dtype=np.int64)
+        batches = []
+
+        for j in order:
+            n = len(batches)
+            fits = (free_nodes[:n] >= nodes[j]) & (free_edges[:n] >= edges[j])
+            k = int(np.argmax(fits)) if n > 0 else 0
+
+            if n == 0 or not fits[k]:
+                k = n
+                free_nodes[k] = self.max_nodes
+                free_edges[k] = self.max_edges
+                batches.append([])
+
+            free_nodes[k] -= nodes[j]
+            free_edges[k] -= edges[j]
+            batches[k].append(int(indices[j]))
+
+        return batches
+
+
+class BalancedBatchSampler(BudgetBatchSampler):
+    """Budget batch sampler that balances the work of each step across processes.
+
+    Every step consists of `num_replicas` consecutive batches, one for each
+    process. All batches fit the node and edge budget, so that each process
+    performs exactly one forward and backward pass per step. Batches are
+    sorted by their cost (number of edges, or nodes if edge counts are not
+    available) and grouped into steps of similar cost, the order of steps is
+    shuffled afterwards. If necessary, the largest batches are split so that
+    the number of batches is a multiple of `num_replicas`.
+
+    If `rank` is None, batches of all processes are returned in the layout
+    expected by accelerate, which assigns batch `i` to process
+    `i % num_replicas`. Otherwise only the batches of process `rank` are
+    returned.
+    """
+
+    def __init__(
+        self,
+        num_nodes: np.ndarray,
+        num_edges: np.ndarray = None,
+        max_nodes: int = None,
+        max_edges: int = None,
+        *,
+        num_replicas: int = 1,
+        rank: int = None,
+        **kwargs,
+    ):
+        super().__init__(
+            num_nodes, num_edges, max_nodes=max_nodes, max_edges=max_edges, **kwargs
+        )
+
+        if rank is not None and not 0 <= rank < num_replicas:
+            raise ValueError(f'Invalid rank {rank} for {num_replicas} replicas')
+
+        self.num_replicas = num_replicas
+        self.rank = rank
+
+    def cost(self, batch: list[int]) -> int:
+        """Estimated cost of a batch, i.e. the number of edges or nodes."""
+        if self.num_edges.any():
+            return int(self.num_edges[batch].sum())
+        return int(self.num_nodes[batch].sum())
+
+    def _plan(self, epoch: int) -> list[list[int]]:
+        batches = super()._plan(epoch)
+
+        # Pad number of batches to a multiple of the number of replicas
+        while len(batches) % self.num_replicas != 0:
+            j = int(np.argmax([len(batch) for batch in batches]))
+            if len(batches[j]) > 1:
+                batch = batches.pop(j)
+                batches.extend([batch[0::2], batch[1::2]])
+            else:
+                # Fewer structures than replicas, repeat batches
+                batches.append(batches[0])
+
+        rng = np.random.default_rng((self.seed, epoch, self.num_replicas))
+
+        # Group batches of similar cost into steps
+        order = np.argsort([self.cost(batch) for batch in batches], kind='stable')
+        steps = order.reshape(-1, self.num_replicas)
+
+        if self.shuffle:
+            steps = rng.permuted(steps[rng.permutation(len(steps))], axis=1)
+
+        batches = [batches[j] for j in steps.flatten()]
+
+        if self.rank is not None:
+            batches = batches[self.rank :: self.num_replicas]
+
+        return batches
+
+
+class BucketedBatchSampler(EpochBatchSampler):
+    """Batch sampler that draws batches of structures with similar sizes.
+
+    Structures are assigned to `num_buckets` buckets by quantiles of their
+    size. Each epoch, structures are shuffled within buckets, buckets are
+    concatenated in order of size and split into batches of `batch_size`
+    structures, and the order of batches is shuffled. Batches therefore
+    only mix structures of neighboring buckets, which reduces the number
+    of sub-batches created by `DynamicGraphCollater` as well as padding.
+    """
+
+    def __init__(
+        self,
+        sizes: np.ndarray,
+        batch_size: int,
+        num_buckets: int = 16,
+        shuffle: bool = True,
+        seed: int = 0,
+    ):
+        super().__init__(shuffle=shuffle, seed=seed)
+
+        sizes = np.asarray(sizes)
+
+        self.batch_size = batch_size
+        # Quantiles may coincide for discrete sizes, which merges buckets
+        self.boundaries = np.unique(
+            np.quantile(sizes, np.linspace(0.0, 1.0, num_buckets + 1)[1:-1])
+        )
+        self.buckets = np.searchsorted(self.boundaries, sizes, side='right')
+
+    def _plan(self, epoch: int) -> list[list[int]]:
+        rng = np.random.default_rng((self.seed, epoch))
+
+        if self.shuffle:
+            # Sort by bucket, random order within each bucket
+            keys = rng.random(len(self.buckets))
+            indices = np.lexsort((keys, self.buckets))
+        else:
+            indices = np.argsort(self.buckets, kind='stable')
+
+        batches = [
+            indices[start : start + self.batch_size].tolist()
+            for start in range(0, len(indices), self.batch_size)
+        ]
+
+        if self.shuffle:
+            batches = [batches[j] for j in rng.permutation(len(batches))]
+
+        return batches
+
+
+class ShardedBatchSampler(EpochBatchSampler):
+    """Batch sampler that sends each structure to the same DataLoader worker in
+    every epoch, as required for caching graphs in workers, see `GraphCache`.
+
+    Structures are assigned to one shard per worker of each process by their
+    index modulo the number of shards. Each epoch, structures are shuffled within
+    shards and split into batches of `batch_size` structures. Alternatively,
+    batches of each shard are planned by the batch sampler returned by
+    `batch_sampler_fn(indices, seed)` for the indices of the shard, e.g. a
+    `BudgetBatchSampler`, where batches are indexed by positions in `indices`.
+    Batches of all shards are interleaved in the order in which accelerate
+    distributes batches to processes and the DataLoader of each process
+    distributes them to its workers, i.e. consecutive batches go to different
+    processes and, within a process, consecutive batches go to different
+    workers. Shards with fewer batches split their largest batches, so that
+    batches are routed to their shard until the end of the epoch.
+    """
+
+    def __init__(
+        self,
+        num_samples: int,
+        batch_size: int = None,
+        *,
+        num_workers: int = 0,
+        num_processes: int = 1,
+        shuffle: bool = True,
+        seed: int = 0,
+        batch_sampler_fn: Callable[[np.ndarray, int], EpochBatchSampler] = None,
+    ):
+        if batch_size is None and batch_sampler_fn is None:
+            raise ValueError('Either batch_size or batch_sampler_fn must be specified')
+
+        super().__init__(shuffle=shuffle, seed=seed)
+
+        self.num_samples = num_samples
+        self.batch_size = batch_size
+        self.num_workers = max(num_workers, 1)
+        self.num_processes = num_processes
+
+        num_shards = self.num_processes * self.num_workers
+        self.shard_indices = [
+            np.arange(shard, num_samples, num_shards) for shard in range(num_shards)
+        ]
+
+        self.shard_samplers = None
+        if batch_sampler_fn is not None:
+            self.shard_samplers = [
+                batch_sampler_fn(indices, seed + shard)
+                for shard, indices in enumerate(self.shard_indices)
+            ]
+
+    def _plan(self, epoch: int) -> list[list[int]]:
+        rng = np.random.default_rng((self.seed, epoch))
+
+        shard_batches = []
+        for shard, indices in enumerate(self.shard_indices):
+            if self.shard_samplers is not None:
+                batches = [
+                    indices[batch].tolist()
+                    for batch in self.shard_samplers[shard].batches(epoch)
+                ]
+            else:
+                if self.shuffle:
+                    indices = rng.permutation(indices)
+
+                batches = [
+                    indices[start : start + self.batch_size].tolist()
+                    for start in range(0, len(indices), self.batch_size)
+                ]
+
+            shard_batches.append(batches)
+
+        num_rounds = max(len(batches) for batches in shard_batches)
+        for batches in shard_batches:
+            while 0 < len(batches) < num_rounds:
+                j = int(np.argmax([len(batch) for batch in batches]))
+                if len(batches[j]) < 2:
+                    break
+                batch = batches.pop(j)
+                batches[j:j] = [batch[0::2], batch[1::2]]
+
+        # Batch k is processed by process k % num_processes and, within this
+        # process, by worker (k // num_processes) % num_workers
+        order = [
+            process * self.num_workers + worker
+            for worker in range(self.num_workers)
+            for process in range(self.num_processes)
+        ]
+
+        batches = []
+        for i in range(num_rounds):
+            batches.extend(
+                shard_batches[shard][i]
+                for shard in order
+                if i < len(shard_batches[shard])
+            )
+
+        return batches
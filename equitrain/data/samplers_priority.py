@@ -0,0 +1,263 @@
+import numpy as np
+import torch
+from accelerate import Accelerator
+
+
+class SumTree:
+    """Binary tree over non-negative priorities where each node stores the sum of
+    its children, which allows to update priorities and to draw samples
+    proportional to priorities in O(log n).
+
+    Leaves are stored at positions [size, size + n) of a flat array, where `size`
+    is the smallest power of two not less than n. The root is at position 1.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self.depth = max(n - 1, 0).bit_length()
+        self.size = 1 << self.depth
+        self.tree = np.zeros(2 * self.size, dtype=np.float64)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def total(self) -> float:
+        return self.tree[1]
+
+    @property
+    def priorities(self) -> np.ndarray:
+        return self.tree[self.size : self.size + self.n]
+
+    def update(self, indices: np.ndarray, priorities: np.ndarray) -> None:
+        """Set priorities of the given indices. If an index occurs multiple times,
+        the last priority is used."""
+        indices = np.asarray(indices, dtype=np.int64)
+        priorities = np.broadcast_to(
+            np.asarray(priorities, dtype=np.float64), indices.shape
+        )
+
+        if len(indices) == 0:
+            return
+        if np.any(priorities < 0.0):
+            raise ValueError('Priorities must be non-negative')
+
+        if len(indices) * self.depth > self.size:
+            # Rebuilding all levels is cheaper for large updates
+            last = np.full(self.n, -1, dtype=np.int64)
+            np.maximum.at(last, indices, np.arange(len(indices)))
+            last = last[last >= 0]
+
+            self.tree[indices[last] + self.size] = priorities[last]
+            self._rebuild()
+            return
+
+        # Keep only the last occurrence of each index
+        _, last = np.unique(indices[::-1], return_index=True)
+        last = len(indices) - 1 - last
+
+        nodes = indices[last] + self.size
+        self.tree[nodes] = priorities[last]
+
+        # Recompute all sums on the paths to the root. Paths merge towards the
+        # root, repeated nodes are assigned identical sums
+        tree = self.tree
+        for _ in range(self.depth):
+            nodes >>= 1
+            left = nodes << 1
+            tree[nodes] = tree[left] + tree[left + 1]
+
+    def _rebuild(self) -> None:
+        size = self.size
+        while size > 1:
+            self.tree[size // 2 : size] = (
+                self.tree[size : 2 * size : 2] + self.tree[size + 1 : 2 * size : 2]
+            )
+            size //= 2
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """Indices of the leaves at which the cumulative sum of priorities exceeds
+        `values`, which must be in [0, total)."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(values.shape, dtype=np.int64)
+
+        for _ in range(self.depth):
+            left = self.tree[2 * nodes]
+            right = values >= left
+            values -= np.where(right, left, 0.0)
+            nodes = 2 * nodes + right
+
+        # Rounding errors may lead to leaves with zero priority
+        return np.minimum(nodes - self.size, self.n - 1)
+
+    def sample(self, num_samples: int, rng: np.random.Generator) -> np.ndarray:
+        """Draw indices with replacement proportional to their priorities."""
+        values = rng.random(num_samples) * self.total
+        return self.find(values)
+
+
+class PrioritySampler(torch.utils.data.Sampler):
+    """Sampler that draws structures with probability proportional to their
+    prediction error.
+
+    Priorities are stored in a sum-tree and all indices of an epoch are drawn
+    when the iteration starts, so the sampler can be kept alive across epochs
+    together with the data loader and its worker processes. Errors reported with
+    `update` are buffered and applied to the sum-tree in a single pass by
+    `synchronize`, which only exchanges the changed priorities between
+    processes. Until priorities are set, the sampler returns a random
+    permutation of all structures.
+
+    Errors exceeding `threshold` are replaced by the mean priority of all
+    structures, which prevents outliers from dominating the sampling.
+    """
+
+    def __init__(
+        self,
+        num_samples: int,
+        threshold: float = None,
+        shuffle: bool = True,
+        seed: int = 0,
+    ):
+        self.num_samples = num_samples
+        self.threshold = threshold
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+
+        self.tree = SumTree(num_samples)
+        self.initialized = False
+
+        # Updates since the last synchronization
+        self.updated_indices = []
+        self.updated_errors = []
+
+    def __len__(self):
+        return self.num_samples
+
+    def __iter__(self):
+        rng = np.random.default_rng((self.seed, self.epoch))
+        self.epoch += 1
+
+        if not self.initialized or self.tree.total <= 0.0:
+            if self.shuffle:
+                indices = rng.permutation(self.num_samples)
+            else:
+                indices = np.arange(self.num_samples)
+        else:
+            indices = self.tree.sample(self.num_samples, rng)
+
+        return iter(indices.tolist())
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def _priorities(self, errors: np.ndarray) -> np.ndarray:
+        errors = np.abs(np.asarray(errors, dtype=np.float64))
+
+        # Errors might be zero, in case a sample was not used. Such samples
+        # would never be drawn again and receive the mean priority instead
+        invalid = ~np.isfinite(errors) | (errors == 0.0)
+        if self.threshold is not None:
+            invalid |= errors >= self.threshold
+
+        if np.any(invalid):
+            if self.initialized and self.tree.total > 0.0:
+                mean = self.tree.total / self.num_samples
+            elif np.any(~invalid):
+                mean = errors[~invalid].mean()
+            else:
+                mean = 1.0
+            errors = np.where(invalid, mean, errors)
+
+        return errors
+
+    def set_priorities(self, errors: torch.Tensor | np.ndarray) -> None:
+        """Set the priorities of all structures from a dense array of errors."""
+        self.initialized = False
+        self.tree.update(
+            np.arange(self.num_samples), self._priorities(_to_numpy(errors))
+        )
+        self.initialized = True
+
+        self.updated_indices = []
+        self.updated_errors = []
+
+    def update(
+        self, indices: torch.Tensor | np.ndarray, errors: torch.Tensor | np.ndarray
+    ) -> None:
+        """Record errors of structures after they have been evaluated. Updates
+        take effect in the next epoch after calling `synchronize`."""
+        if not self.initialized:
+            return
+
+        self.updated_indices.append(_to_numpy(indices).astype(np.int64))
+        self.updated_errors.append(_to_numpy(errors).astype(np.float64))
+
+    def synchronize(self, accelerator: Accelerator = None) -> None:
+        """Apply errors recorded since the last call, which are first exchanged
+        between processes.
+
+        All processes apply the updates of all processes in the same order, so
+        that sum-trees and therefore sampled indices are identical everywhere.
+        This is a collective operation that must be called on all processes.
+        """
+        if not self.initialized:
+            return
+
+        if len(self.updated_indices) > 0:
+            indices = np.concatenate(self.updated_indices)
+            errors = np.concatenate(self.updated_errors)
+        else:
+            indices = np.zeros(0, dtype=np.int64)
+            errors = np.zeros(0, dtype=np.float64)
+
+        self.updated_indices = []
+        self.updated_errors = []
+
+        if accelerator is not None and accelerator.num_processes > 1:
+            indices = torch.tensor(indices, device=accelerator.device)
+            errors = torch.tensor(errors, device=accelerator.device)
+
+            # Processes have different numbers of updates, padded entries are removed
+            indices = accelerator.pad_across_processes(indices, pad_index=-1)
+            errors = accelerator.pad_across_processes(errors)
+
+            indices = accelerator.gather(indices).cpu().numpy()
+            errors = accelerator.gather(errors).cpu().numpy()
+
+            valid = indices >= 0
+            indices = indices[valid]
+            errors = errors[valid]
+
+        self.tree.update(indices, self._priorities(errors))
+
+
+def _to_numpy(x: torch.Tensor | np.ndarray) -> np.ndarray:
+    if isinstance(x, torch.Tensor):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+def get_priority_sampler(data_loader) -> PrioritySampler:
+    """Find the priority sampler of a (possibly wrapped) data loader."""
+    if data_loader is None:
+        return None
+
+    candidates = [
+        getattr(data_loader, 'sampler', None),
+        getattr(data_loader, 'batch_sampler', None),
+    ]
+    while candidates:
+        candidate = candidates.pop()
+        if isinstance(candidate, PrioritySampler):
+            return candidate
+        if candidate is not None:
+            candidates.extend(
+                [
+                    getattr(candidate, 'sampler', None),
+                    getattr(candidate, 'batch_sampler', None),
+                ]
+            )
+
+    return None
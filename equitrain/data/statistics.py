@@ -1,13 +1,15 @@
 import logging
 
+import h5py
 import numpy as np
 import torch
 from e3nn.util.jit import compile_mode
 
 from .atomic import AtomicNumberTable
-from .format_hdf5 import HDF5Dataset
+from .format_hdf5 import HDF5Dataset, HDF5NeighborLists
+from .graphs.neighborhood import get_neighborhood
 from .scatter import scatter_sum
-from .utility import compute_one_hot, to_numpy
+from .utility import compute_one_hot
 
 
 @compile_mode('script')
@@ -45,9 +47,13 @@ def compute_statistics(
 
     atomic_energies_fn = AtomicEnergiesBlock(atomic_energies=atomic_energies_list)
 
-    atom_energy_list = []
-    forces_list = []
-    num_neighbors = []
+    # Running sums in double precision, which do not grow with the dataset
+    atom_energy_sum = 0.0
+    num_graphs = 0
+    forces_sq_sum = 0.0
+    num_forces = 0
+    num_edges = 0
+    num_receivers = 0
 
     for batch in data_loader:
         node_e0 = atomic_energies_fn(
@@ -57,29 +63,240 @@ def compute_statistics(
             src=node_e0, index=batch.batch, dim=-1, dim_size=batch.num_graphs
         )
         graph_sizes = batch.ptr[1:] - batch.ptr[:-1]
-        atom_energy_list.append((batch.y - graph_e0s) / graph_sizes)  # {[n_graphs], }
-        forces_list.append(batch.force)  # {[n_graphs*n_atoms,3], }
+        atom_energies = (batch.y - graph_e0s) / graph_sizes  # [n_graphs]
+        atom_energy_sum += atom_energies.double().sum().item()
+        num_graphs += batch.num_graphs
 
+        forces_sq_sum += torch.square(batch.force.double()).sum().item()
+        num_forces += batch.force.numel()
+
+        # Atoms without neighbors are not counted
         _, receivers = batch.edge_index
-        _, counts = torch.unique(receivers, return_counts=True)
-        num_neighbors.append(counts)
+        num_edges += receivers.numel()
+        num_receivers += torch.unique(receivers).numel()
 
-    atom_energies = torch.cat(atom_energy_list, dim=0)  # [total_n_graphs]
-    forces = torch.cat(forces_list, dim=0)  # {[total_n_graphs*n_atoms,3], }
+    mean = atom_energy_sum / num_graphs
+    rms = float(np.sqrt(forces_sq_sum / num_forces))
+    avg_num_neighbors = num_edges / num_receivers
 
-    mean = to_numpy(torch.mean(atom_energies)).item()
-    rms = to_numpy(torch.sqrt(torch.mean(torch.square(forces)))).item()
+    return avg_num_neighbors, mean, rms
 
-    avg_num_neighbors = torch.mean(
-        torch.cat(num_neighbors, dim=0).type(torch.get_default_dtype())
-    )
 
-    return to_numpy(avg_num_neighbors).item(), mean, rms
+class StatisticsAccumulator:
+    """Running sums of the statistics of a dataset, which are computed in a
+    single pass over its structures, e.g. while a data file is written.
+
+    Memory does not depend on the number of structures, the largest sums are the
+    normal equations of the least-squares fit of E0s, which are quadratic in the
+    number of elements. Accumulators of disjoint parts of a dataset, e.g. of
+    preprocessing workers, are combined with `merge`. Neighbors are counted for
+    the cutoff radius `r_max`, unless it is None. The sums are stored in data
+    files with `save`, so that structures can be appended later without reading
+    the existing ones again.
+    """
+
+    NUM_ELEMENTS = 119
+    GROUP = 'statistics'
+    # Scalar sums and arrays, which are stored in data files
+    SCALARS = [
+        'num_structures',
+        'num_atoms',
+        'energy_per_atom',
+        'forces_sq',
+        'num_edges',
+        'num_receivers',
+    ]
+    ARRAYS = ['element_counts', 'ata', 'atb', 'fractions']
+
+    def __init__(self, r_max: float = None, engine: str = None):
+        self.r_max = r_max
+        self.engine = engine
+
+        n = self.NUM_ELEMENTS
+        self.num_structures = 0
+        self.num_atoms = 0
+        self.element_counts = np.zeros(n, dtype=np.int64)
+        # Normal equations A^T A x = A^T b, where rows of A are element counts
+        # and b are the energies of structures
+        self.ata = np.zeros((n, n))
+        self.atb = np.zeros(n)
+        # Sums of energies and element fractions per atom, from which the mean
+        # interaction energy per atom follows for any E0s
+        self.energy_per_atom = 0.0
+        self.fractions = np.zeros(n)
+        self.forces_sq = 0.0
+        self.num_edges = 0
+        self.num_receivers = 0
+
+    def update(self, record: dict[str, np.ndarray], edge_index: np.ndarray = None):
+        """Add a structure, given by its raw fields as returned by `read_record`.
+        Neighbors are computed if `edge_index` [2, n_edges] is not given."""
+        atomic_numbers = record['atomic_numbers']
+        num_atoms = len(atomic_numbers)
+        counts = np.bincount(atomic_numbers, minlength=self.NUM_ELEMENTS)
+        energy = float(record['energy'])
+
+        self.num_structures += 1
+        self.num_atoms += num_atoms
+        self.element_counts += counts
+        # Only elements of the structure contribute to the outer product
+        (z,) = np.nonzero(counts)
+        self.ata[np.ix_(z, z)] += np.outer(counts[z], counts[z])
+        self.atb[z] += counts[z] * energy
+        self.energy_per_atom += energy / num_atoms
+        self.fractions[z] += counts[z] / num_atoms
+        self.forces_sq += float(np.sum(np.square(record['forces'])))
+
+        if self.r_max is None:
+            return
+
+        if edge_index is None:
+            edge_index, _, _, _ = get_neighborhood(
+                record['positions'],
+                self.r_max,
+                record['pbc'],
+                record['cell'].copy(),
+                engine=self.engine,
+            )
+
+        # Atoms without neighbors are not counted
+        self.num_edges += edge_index.shape[1]
+        self.num_receivers += len(np.unique(edge_index[1]))
+
+    def merge(self, other: 'StatisticsAccumulator') -> 'StatisticsAccumulator':
+        """Add the sums of another accumulator for the same cutoff radius."""
+        if self.r_max != other.r_max:
+            raise ValueError(
+                f'Cannot merge statistics for r_max={other.r_max} into r_max={self.r_max}'
+            )
+
+        self.num_structures += other.num_structures
+        self.num_atoms += other.num_atoms
+        self.element_counts += other.element_counts
+        self.ata += other.ata
+        self.atb += other.atb
+        self.energy_per_atom += other.energy_per_atom
+        self.fractions += other.fractions
+        self.forces_sq += other.forces_sq
+        self.num_edges += other.num_edges
+        self.num_receivers += other.num_receivers
+
+        return self
+
+    @classmethod
+    def load(cls, file: h5py.File, engine: str = None) -> 'StatisticsAccumulator':
+        """Load the sums stored in `file` or return None if there are none."""
+        if cls.GROUP not in file:
+            return None
+
+        group = file[cls.GROUP]
+        accumulator = cls(r_max=group.attrs.get('r_max'), engine=engine)
+        if accumulator.r_max is not None:
+            accumulator.r_max = float(accumulator.r_max)
+
+        for name in cls.SCALARS:
+            setattr(accumulator, name, group.attrs[name].item())
+        for name in cls.ARRAYS:
+            setattr(accumulator, name, group[name][()])
+
+        return accumulator
+
+    def save(self, file: h5py.File) -> None:
+        """Store the sums in `file`, replacing existing ones."""
+        if self.GROUP in file:
+            del file[self.GROUP]
+
+        group = file.create_group(self.GROUP)
+        if self.r_max is not None:
+            group.attrs['r_max'] = float(self.r_max)
+
+        for name in self.SCALARS:
+            group.attrs[name] = getattr(self, name)
+        for name in self.ARRAYS:
+            group.create_dataset(name, data=getattr(self, name))
+
+    def validate(self, num_structures: int) -> None:
+        if self.num_structures != num_structures:
+            raise RuntimeError(
+                f'Statistics cover {self.num_structures} structures, '
+                f'but the dataset contains {num_structures}. Please recompute them.'
+            )
+
+    @classmethod
+    def from_dataset(
+        cls,
+        dataset: HDF5Dataset,
+        r_max: float = None,
+        batch_size: int = 1024,
+        engine: str = None,
+    ) -> 'StatisticsAccumulator':
+        """Accumulate all structures of an `HDF5Dataset`, using stored neighbor
+        lists for `r_max` if available."""
+        accumulator = cls(r_max=r_max, engine=engine)
+
+        neighbor_lists = None
+        if r_max is not None:
+            neighbor_lists = HDF5NeighborLists.open(dataset.file, r_max)
+
+        if neighbor_lists is not None:
+            neighbor_lists.validate(len(dataset))
+
+        for start in range(0, len(dataset), batch_size):
+            indices = range(start, min(start + batch_size, len(dataset)))
+            records = dataset.read_records(indices)
+
+            if neighbor_lists is None:
+                neighbors = [(None, None)] * len(records)
+            else:
+                neighbors = neighbor_lists.read(indices)
+
+            for record, (edge_index, _) in zip(records, neighbors):
+                accumulator.update(record, edge_index)
+
+        return accumulator
+
+    @property
+    def atomic_numbers(self) -> AtomicNumberTable:
+        """Elements contained in at least one structure."""
+        return AtomicNumberTable([int(z) for z in np.nonzero(self.element_counts)[0]])
+
+    def atomic_energies(
+        self, z_table: AtomicNumberTable, ridge: float = 0.0
+    ) -> dict[int, float]:
+        """Least-squares fit of E0s of the elements in `z_table`, see
+        `solve_atomic_energies`."""
+        z = np.array(z_table, dtype=np.int64)
+
+        return solve_atomic_energies(
+            self.ata[np.ix_(z, z)], self.atb[z], z_table, ridge=ridge
+        )
+
+    def energy_mean(self, atomic_energies: dict[int, float]) -> float:
+        """Mean interaction energy per atom, i.e. after subtracting E0s."""
+        (z,) = np.nonzero(self.element_counts)
+        e0 = np.array([atomic_energies[int(i)] for i in z])
+
+        return float(
+            (self.energy_per_atom - self.fractions[z] @ e0) / self.num_structures
+        )
+
+    @property
+    def forces_rms(self) -> float:
+        return float(np.sqrt(self.forces_sq / (3 * self.num_atoms)))
+
+    @property
+    def avg_num_neighbors(self) -> float:
+        """Mean number of neighbors of atoms with at least one neighbor."""
+        return self.num_edges / self.num_receivers
 
 
 def compute_atomic_numbers(
     dataset: HDF5Dataset,
 ) -> AtomicNumberTable:
+    # Use the dataset index if available, which avoids reading all structures
+    if dataset.index is not None:
+        return AtomicNumberTable(dataset.index.atomic_numbers())
+
     data_loader = torch.utils.data.DataLoader(
         dataset=dataset,
         batch_size=1,
@@ -103,56 +320,86 @@ def compute_atomic_numbers(
 def compute_average_atomic_energies(
     dataset: HDF5Dataset,
     z_table: AtomicNumberTable,
+    *,
     max_n: int = None,
+    ridge: float = 0.0,
+    seed: int = 0,
+    batch_size: int = 4096,
 ) -> dict[int, float]:
     """
     Function to compute the average interaction energy of each chemical element
     returns dictionary of E0s
-    """
 
-    if max_n is None:
-        len_train = len(dataset)
-    else:
-        len_train = max_n
+    E0s are fitted by least squares to the energies of all structures, or of
+    `max_n` structures drawn at random with the given seed. Only element counts
+    and energies are read, which are accumulated into the normal equations,
+    i.e. memory does not depend on the number of structures. A positive `ridge`
+    adds L2 regularization of the E0s.
+    """
+    indices = np.arange(len(dataset))
+    if max_n is not None and max_n < len(indices):
+        rng = np.random.default_rng(seed)
+        indices = np.sort(rng.choice(indices, size=max_n, replace=False))
 
+    lookup = z_table.lookup
     len_zs = len(z_table)
 
-    # Use data loader for shuffling
-    data_loader = torch.utils.data.DataLoader(
-        dataset=dataset,
-        batch_size=1,
-        # shuffle data in case we only use a subset of the data
-        shuffle=True,
-        drop_last=False,
-        pin_memory=False,
-        num_workers=2,
-        collate_fn=lambda data: data,
-    )
+    ata = np.zeros((len_zs, len_zs))
+    atb = np.zeros(len_zs)
+
+    for start in range(0, len(indices), batch_size):
+        records = dataset.read_records(
+            indices[start : start + batch_size], columns=['atomic_numbers', 'energy']
+        )
+
+        atomic_numbers = np.concatenate([r['atomic_numbers'] for r in records])
+        structure = np.repeat(
+            np.arange(len(records)), [len(r['atomic_numbers']) for r in records]
+        )
+        energy = np.array([r['energy'] for r in records], dtype=np.float64)
+
+        # Elements that are not in the table are not counted
+        z_index = lookup[np.minimum(atomic_numbers, len(lookup) - 1)]
+        z_index[atomic_numbers >= len(lookup)] = -1
+        mask = z_index >= 0
 
-    A = np.zeros((len_train, len_zs))
-    B = np.zeros(len_train)
+        # Element counts of each structure [n_structures, n_elements]
+        A = np.bincount(
+            structure[mask] * len_zs + z_index[mask],
+            minlength=len(records) * len_zs,
+        ).reshape(len(records), len_zs)
 
-    for i, batch in enumerate(data_loader):
-        B[i] = batch[0].get_potential_energy()
-        for j, z in enumerate(z_table):
-            A[i, j] = np.count_nonzero(batch[0].get_atomic_numbers() == z)
+        ata += A.T @ A
+        atb += A.T @ energy
 
-        # break if max_n is reached
-        if i >= len_train:
-            break
+    return solve_atomic_energies(ata, atb, z_table, ridge=ridge)
 
+
+def solve_atomic_energies(
+    ata: np.ndarray, atb: np.ndarray, z_table: AtomicNumberTable, ridge: float = 0.0
+) -> dict[int, float]:
+    """Solve the normal equations A^T A x = A^T b of the least-squares fit of E0s
+    to element counts A and energies b, with rows and columns ordered as `z_table`.
+
+    Without regularization, the minimum norm solution is returned, which is the
+    same as `np.linalg.lstsq` on A and b, i.e. E0s of elements that do not occur
+    in any structure are zero.
+    """
     try:
-        E0s = np.linalg.lstsq(A, B, rcond=None)[0]
+        if ridge > 0.0:
+            E0s = np.linalg.solve(ata + ridge * np.identity(len(atb)), atb)
+        else:
+            E0s = np.linalg.lstsq(ata, atb, rcond=None)[0]
         atomic_energies_dict = {}
         for i, z in enumerate(z_table):
-            atomic_energies_dict[z] = E0s[i]
+            atomic_energies_dict[int(z)] = float(E0s[i])
 
     except np.linalg.LinAlgError:
         logging.warning(
             'Failed to compute E0s using least squares regression, using the same for all atoms'
         )
         atomic_energies_dict = {}
-        for i, z in enumerate(z_table.zs):
-            atomic_energies_dict[z] = 0.0
+        for z in z_table:
+            atomic_energies_dict[int(z)] = 0.0
 
     return atomic_energies_dict
@@ -5,7 +5,7 @@ from dataclasses import asdict, dataclass
 from pathlib import Path
 
 from .atomic import AtomicNumberTable
-from .statistics import compute_average_atomic_energies
+from .statistics import StatisticsAccumulator, compute_average_atomic_energies
 
 
 @dataclass
@@ -41,7 +41,20 @@ class Statistics:
             json.dump(asdict(self), f, indent=4)
 
 
-def get_atomic_energies(E0s, dataset, z_table) -> dict:
+def get_atomic_energies(
+    E0s,
+    dataset,
+    z_table,
+    *,
+    statistics: StatisticsAccumulator = None,
+    ridge: float = 0.0,
+    max_n: int = None,
+    seed: int = 0,
+) -> dict:
+    """Average E0s are fitted to the normal equations of `statistics` if given,
+    otherwise to all structures of `dataset`, with L2 regularization `ridge`.
+    With `max_n`, E0s are fitted to `max_n` structures of `dataset` drawn at
+    random with the given seed instead."""
     if E0s is not None:
         logging.log(
             1, 'Atomic Energies not in training file, using command line argument E0s'
@@ -52,8 +65,15 @@ def get_atomic_energies(E0s, dataset, z_table) -> dict:
             )
             # catch if colections.train not defined above
             try:
-                assert dataset is not None
-                atomic_energies_dict = compute_average_atomic_energies(dataset, z_table)
+                if statistics is not None and max_n is None:
+                    atomic_energies_dict = statistics.atomic_energies(
+                        z_table, ridge=ridge
+                    )
+                else:
+                    assert dataset is not None
+                    atomic_energies_dict = compute_average_atomic_energies(
+                        dataset, z_table, max_n=max_n, ridge=ridge, seed=seed
+                    )
             except Exception as e:
                 raise RuntimeError(
                     f'Could not compute average E0s if no training xyz given, error {e} occured'
@@ -17,8 +17,11 @@ def to_numpy(t: torch.Tensor) -> np.ndarray:
 def atomic_numbers_to_indices(
     atomic_numbers_tensor: torch.Tensor, atomic_numbers: AtomicNumberTable
 ) -> np.ndarray:
-    to_index_fn = np.vectorize(atomic_numbers.z_to_index)
-    return to_index_fn(atomic_numbers_tensor)
+    if not isinstance(atomic_numbers, AtomicNumberTable):
+        atomic_numbers = AtomicNumberTable(atomic_numbers)
+    if isinstance(atomic_numbers_tensor, torch.Tensor):
+        atomic_numbers_tensor = atomic_numbers_tensor.cpu().numpy()
+    return atomic_numbers.to_indices(atomic_numbers_tensor)
 
 
 def to_one_hot(indices: torch.Tensor, num_classes: int) -> torch.Tensor:
@@ -41,9 +44,6 @@ def to_one_hot(indices: torch.Tensor, num_classes: int) -> torch.Tensor:
 
 
 def compute_one_hot(batch, atomic_numbers):
-    indices = atomic_numbers_to_indices(batch, atomic_numbers)
-    one_hot = to_one_hot(
-        torch.tensor(indices, dtype=torch.long).unsqueeze(-1),
-        num_classes=len(atomic_numbers),
-    )
-    return one_hot
+    if not isinstance(atomic_numbers, AtomicNumberTable):
+        atomic_numbers = AtomicNumberTable(atomic_numbers)
+    return atomic_numbers.to_one_hot(batch)
@@ -0,0 +1,54 @@
+from pathlib import Path
+
+from equitrain.argparser import ArgumentError, check_args_complete
+from equitrain.data.format_hdf5 import migrate_hdf5
+from equitrain.data.format_npy import migrate_npy
+from equitrain.logger import FileLogger
+
+
+def _migrate(args):
+    logger = FileLogger(
+        log_to_file=False, enable_logging=True, output_dir=None, verbosity=args.verbose
+    )
+
+    if args.output_format == 'npy':
+        logger.log(1, f'Migrating {args.input_file} to NumPy shards {args.output_file}')
+
+        n = migrate_npy(
+            args.input_file, args.output_file, shard_size=args.npy_shard_size
+        )
+
+        logger.log(1, f'Migrated {n} structures')
+        return
+
+    logger.log(
+        1,
+        f'Migrating {args.input_file} to {args.output_file} (format version {args.format_version})',
+    )
+
+    n = migrate_hdf5(
+        args.input_file,
+        args.output_file,
+        format_version=args.format_version,
+        chunk_size=args.hdf5_chunk_size,
+        compression=args.hdf5_compression,
+        compression_level=args.hdf5_compression_level,
+        shuffle=args.hdf5_shuffle,
+        page_size=args.hdf5_page_size,
+    )
+
+    logger.log(1, f'Migrated {n} structures')
+
+
+def migrate(args):
+    check_args_complete(args, 'migrate')
+
+    if args.input_file is None:
+        raise ArgumentError('--input-file is a required argument')
+    if args.output_file is None:
+        raise ArgumentError('--output-file is a required argument')
+
+    if Path(args.output_file).resolve() == Path(args.input_file).resolve():
+        raise ArgumentError('--output-file must differ from --input-file')
+
+    _migrate(args)
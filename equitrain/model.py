@@ -1,5 +1,6 @@
 import torch
 
+from equitrain.data.graphs.radius_graph import RadiusGraph
 from equitrain.model_wrappers import MaceWrapper, SevennetWrapper
 
 
@@ -22,4 +23,8 @@ def get_model(args, logger=None):
 
         model.load_state_dict(torch.load(args.load_checkpoint_model, weights_only=True))
 
+    if args.batched_neighbors:
+        # Edges are computed for whole batches on the device of the model
+        model.radius_graph = RadiusGraph(model.r_max)
+
     return model
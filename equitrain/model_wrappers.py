@@ -4,6 +4,9 @@ from equitrain.data.atomic import AtomicNumberTable
 
 
 class MaceWrapper(torch.nn.Module):
+    # Optional pre-step computing edges of batches, see `get_model`
+    radius_graph = None
+
     def __init__(self, args, model, optimize_atomic_energies=False):
         super().__init__()
 
@@ -19,8 +22,12 @@ class MaceWrapper(torch.nn.Module):
         self.compute_force = args.forces_weight > 0.0
         self.compute_stress = args.stress_weight > 0.0
 
-    def forward(self, *args):
+    def forward(self, data, *args):
+        if self.radius_graph is not None:
+            data = self.radius_graph(data)
+
         y_pred = self.model(
+            data,
             *args,
             compute_force=self.compute_force,
             compute_stress=self.compute_stress,
@@ -42,12 +49,18 @@ class MaceWrapper(torch.nn.Module):
 
 
 class SevennetWrapper(torch.nn.Module):
+    # Optional pre-step computing edges of batches, see `get_model`
+    radius_graph = None
+
     def __init__(self, args, model):
         super().__init__()
 
         self.model = model
 
     def forward(self, input):
+        if self.radius_graph is not None:
+            input = self.radius_graph(input)
+
         input.energy = input.y
         input.forces = input['force']
         input.edge_vec, _ = self.get_edge_vectors_and_lengths(
@@ -5,7 +5,7 @@ from pymatgen.core import Structure
 from pymatgen.io.ase import AseAtomsAdaptor
 
 from equitrain.argparser import check_args_complete
-from equitrain.data.graphs import AtomsToGraphs
+from equitrain.data.graphs import AtomsToGraphs, VerletNeighborList
 from equitrain.data.loaders import get_dataloader
 from equitrain.data.statistics import AtomicNumberTable
 from equitrain.model import get_model
@@ -61,8 +61,15 @@ def predict_atoms(
     pin_memory=False,
     batch_size=12,
     device=None,
+    *,
+    skin: float = None,
 ) -> list[torch.Tensor]:
-    """Predict energy, forces, and stress of a structure"""
+    """Predict energy, forces, and stress of a structure
+
+    If `skin` is given, neighbor lists are reused between consecutive structures
+    of `atoms_list` as long as no atom moved by more than half the skin, see
+    `VerletNeighborList`, which avoids recomputing them for frames of a trajectory.
+    """
 
     atoms_to_graphs = AtomsToGraphs(
         z_table,
@@ -74,6 +81,7 @@ def predict_atoms(
         r_edges=True,
         r_fixed=False,
         r_pbc=True,
+        neighbor_list_engine=None if skin is None else VerletNeighborList(skin),
     )
 
     graph_list = [atoms_to_graphs.convert(atom) for atom in atoms_list]
@@ -97,8 +105,10 @@ def predict_structures(
     pin_memory=False,
     batch_size=12,
     device=None,
+    *,
+    skin: float = None,
 ) -> list[torch.Tensor]:
-    """Predict energy, forces, and stress of a structure"""
+    """Predict energy, forces, and stress of a structure, see `predict_atoms`"""
 
     atoms_list = [AseAtomsAdaptor.get_atoms(structure) for structure in structure_list]
 
@@ -111,6 +121,7 @@ def predict_structures(
         pin_memory=pin_memory,
         batch_size=batch_size,
         device=device,
+        skin=skin,
     )
 
 
@@ -157,5 +168,7 @@ def predict(args):
 
     # Never shuffle data
     args.shuffle = False
+    # Predictions must be returned in the order of the data file
+    args.sampler = 'random'
 
     return _predict(args)
@@ -1,53 +1,238 @@
 import os
 from pathlib import Path
 
-import torch_geometric
-
 from equitrain.argparser import ArgumentError, check_args_complete
 from equitrain.data import (
     AtomicNumberTable,
     Statistics,
-    compute_atomic_numbers,
-    compute_statistics,
+    StatisticsAccumulator,
     get_atomic_energies,
 )
-from equitrain.data.format_hdf5 import HDF5Dataset, HDF5GraphDataset
+from equitrain.data.format_hdf5 import (
+    DatasetIndex,
+    HDF5Dataset,
+    HDF5NeighborLists,
+    HDF5Sources,
+    compute_index,
+    compute_neighbor_lists,
+    file_digest,
+)
 from equitrain.data.format_xyz import XYZReader
 from equitrain.logger import FileLogger
 from equitrain.utility import set_dtype, set_seeds
 
+# Number of structures whose neighbors are appended to a data file at once
+_BATCH_SIZE = 1024
+
+
+def _load_statistics(args, file, r_max, logger):
+    """Sums of the statistics of all structures in `file`, which are read from
+    the file if they are stored for the same structures and cutoff radius."""
+    accumulator = StatisticsAccumulator.load(
+        file.file, engine=args.neighbor_list_engine
+    )
+
+    if (
+        accumulator is None
+        or accumulator.num_structures != len(file)
+        or accumulator.r_max != r_max
+    ):
+        if len(file) > 0:
+            logger.log(1, f'Computing statistics of {file.filename}')
+
+        accumulator = StatisticsAccumulator.from_dataset(
+            file, r_max=r_max, engine=args.neighbor_list_engine
+        )
+
+    return accumulator
+
+
+def _open_hdf5(args, filename_hdf5, mode='a'):
+    return HDF5Dataset(
+        filename_hdf5,
+        mode,
+        chunk_size=args.hdf5_chunk_size,
+        compression=args.hdf5_compression,
+        compression_level=args.hdf5_compression_level,
+        shuffle=args.hdf5_shuffle,
+        page_size=args.hdf5_page_size,
+    )
+
 
 def _convert_xyz_to_hdf5(
     args,
     filename_xyz,
     filename_hdf5,
+    logger,
+    *,
     extract_atomic_numbers=False,
     extract_atomic_energies=False,
+    compute_statistics=False,
 ):
-    atomic_numbers = None
-    atomic_energies = None
-
-    reader = XYZReader(
-        filename=filename_xyz,
-        energy_key=args.energy_key,
-        forces_key=args.forces_key,
-        stress_key=args.stress_key,
-        extract_atomic_numbers=extract_atomic_numbers,
-        extract_atomic_energies=extract_atomic_energies,
+    """Convert an xyz file to a new HDF5 file, or append it to an existing one
+    with --append unless it was ingested before.
+
+    Neighbors of each structure are searched once while it is written if
+    neighbor lists are stored or statistics are computed, which then provides
+    the edge counts of the dataset index as well. Otherwise, no neighbors are
+    searched and the index has no edge counts, unless it had them before
+    structures were appended. Returns the sources of the HDF5 file and,
+    with `compute_statistics`, the sums of the statistics of all its
+    structures, which are stored in the file as well.
+    """
+    append = args.append and Path(filename_hdf5).exists()
+    digest = file_digest(filename_xyz)
+
+    with _open_hdf5(args, filename_hdf5, 'a' if append else 'w') as file:
+        sources = HDF5Sources.load(file.file)
+        if sources is None:
+            # Structures written before sources were recorded
+            sources = HDF5Sources(num_structures=len(file))
+        sources.validate(len(file))
+
+        # Neighbor lists and the index must cover the existing structures
+        # before appended ones are added
+        neighbor_lists = _compute_neighbors(args, file, logger)
+
+        r_max = _index_r_max(args, file, neighbor_lists, compute_statistics)
+        index = _compute_index(args, file, logger, r_max)
+
+        statistics = None
+        if compute_statistics:
+            statistics = _load_statistics(args, file, args.r_max, logger)
+
+        if sources.find(digest) is not None:
+            logger.log(
+                1, f'{filename_xyz} was added to {filename_hdf5} before. Skipping...'
+            )
+            if statistics is not None:
+                statistics.save(file.file)
+            return sources, statistics
+
+        reader = XYZReader(
+            filename=filename_xyz,
+            energy_key=args.energy_key,
+            forces_key=args.forces_key,
+            stress_key=args.stress_key,
+            extract_atomic_numbers=extract_atomic_numbers,
+            extract_atomic_energies=extract_atomic_energies,
+            statistics=statistics,
+            fast=args.xyz_reader == 'fast',
+        )
+
+        start = len(file)
+        batch = []
+        index_parts = []
+        with file.writer() as writer:
+            for record, neighbors in reader.records_with_neighbors(
+                r_max,
+                engine=args.neighbor_list_engine,
+                workers=args.preprocess_workers,
+            ):
+                writer.append_record(record)
+
+                batch.append((record, neighbors))
+                if len(batch) == _BATCH_SIZE:
+                    index_parts.append(_add_neighbors(batch, neighbor_lists, r_max))
+                    batch = []
+
+            index_parts.append(_add_neighbors(batch, neighbor_lists, r_max))
+
+        if neighbor_lists is not None:
+            neighbor_lists.trim()
+        index.concatenate(*index_parts).save(file.file)
+
+        # Isolated atoms are not written, but recorded with their source
+        sources.add(
+            filename_xyz,
+            digest,
+            start,
+            len(file) - start,
+            atomic_numbers=reader.atomic_numbers if extract_atomic_numbers else None,
+            atomic_energies=reader.atomic_energies if extract_atomic_energies else None,
+        )
+
+        # Sources are stored last, they mark the file as complete
+        if statistics is not None:
+            statistics.save(file.file)
+        sources.save(file.file)
+
+    return sources, statistics
+
+
+def _add_neighbors(batch, neighbor_lists, r_max):
+    """Append the neighbors of a batch of written records to the neighbor
+    lists if they are stored, and return the index of the records with edge
+    counts for `r_max` unless it is None."""
+    if neighbor_lists is not None:
+        neighbor_lists.append([neighbors for _, neighbors in batch])
+
+    num_edges = None
+    if r_max is not None:
+        num_edges = [edge_index.shape[1] for _, (edge_index, _) in batch]
+
+    return DatasetIndex.from_records(
+        [record for record, _ in batch], num_edges=num_edges, r_max=r_max
     )
 
-    # Open HDF5 file in write mode
-    with HDF5Dataset(filename_hdf5, 'w') as file:
-        for i, config in enumerate(reader):
-            file[i] = config
 
-    if extract_atomic_numbers:
-        atomic_numbers = reader.atomic_numbers
+def _compute_neighbors(args, file, logger):
+    """Neighbor lists of all structures in `file` for --r-max, which are
+    computed with --compute-neighbors. Existing neighbor lists are extended by
+    appended structures also without it. Returns None if there are none."""
+    neighbor_lists = HDF5NeighborLists.open(file.file, args.r_max)
+
+    if neighbor_lists is None and not args.compute_neighbors:
+        return None
+
+    if neighbor_lists is not None and len(neighbor_lists) == len(file):
+        logger.log(1, f'Neighbor lists exist in {file.filename}. Skipping...')
+        return neighbor_lists
+
+    # Appended structures are added to existing neighbor lists
+    if len(file) > 0:
+        logger.log(1, f'Computing neighbor lists for {file.filename}')
+
+    return compute_neighbor_lists(
+        file, args.r_max, engine=args.neighbor_list_engine, append=True
+    )
+
+
+def _index_r_max(args, file, neighbor_lists, compute_statistics=False):
+    """Cutoff radius of the edge counts of the index of `file`, which are only
+    stored if neighbors are searched anyway, i.e. if neighbor lists are stored or
+    statistics are computed, or if the existing index has them. Returns None if
+    the index has no edge counts."""
+    index = DatasetIndex.load(file.file)
+
+    if (
+        neighbor_lists is not None
+        or compute_statistics
+        or (index is not None and index.num_edges is not None)
+    ):
+        return args.r_max
 
-    if extract_atomic_energies:
-        atomic_energies = reader.atomic_energies
+    return None
 
-    return atomic_numbers, atomic_energies
+
+def _compute_index(args, file, logger, r_max):
+    """Dataset index of all structures in `file` with edge counts for `r_max`,
+    or without edge counts if it is None, which is extended if it was computed
+    before structures were appended."""
+    index = DatasetIndex.load(file.file)
+
+    if (
+        index is not None
+        and len(index) == len(file)
+        and (index.has_edges(r_max) if r_max is not None else index.num_edges is None)
+    ):
+        logger.log(1, f'Dataset index exists in {file.filename}. Skipping...')
+        return index
+
+    if len(file) > 0:
+        logger.log(1, f'Computing dataset index for {file.filename}')
+
+    return compute_index(file, r_max, engine=args.neighbor_list_engine, append=True)
 
 
 def _preprocess(args):
@@ -67,6 +252,10 @@ def _preprocess(args):
     filename_test = os.path.join(args.output_dir, 'test.h5')
 
     statistics = Statistics(r_max=args.r_max)
+    # Sums from which statistics of the training data are computed, and the
+    # sources of the training data
+    accumulator = None
+    sources = None
 
     # Read atomic numbers from arguments if available
     if args.atomic_numbers is not None:
@@ -75,87 +264,102 @@ def _preprocess(args):
 
     # Convert training file and obtain z_table and atomit_energies if required
     if args.train_file:
-        if Path(filename_train).exists():
+        if Path(filename_train).exists() and not args.append:
             logger.log(1, 'Train file exists. Skipping...')
 
         else:
             logger.log(1, 'Converting train file')
-            atomic_numbers, atomic_energies = _convert_xyz_to_hdf5(
+            sources, accumulator = _convert_xyz_to_hdf5(
                 args,
                 args.train_file,
                 filename_train,
+                logger,
                 extract_atomic_numbers=(
                     args.compute_statistics and statistics.atomic_numbers is None
                 ),
                 extract_atomic_energies=(
                     args.compute_statistics and statistics.atomic_energies is None
                 ),
+                compute_statistics=args.compute_statistics,
             )
 
-            if statistics.atomic_numbers is None:
-                statistics.atomic_numbers = atomic_numbers
-
-            if statistics.atomic_energies is None:
-                statistics.atomic_energies = atomic_energies
-
     # Convert validation file
     if args.valid_file:
-        if Path(filename_valid).exists():
+        if Path(filename_valid).exists() and not args.append:
             logger.log(1, 'Validation file exists. Skipping...')
 
         else:
             logger.log(1, 'Converting valid file')
-            _convert_xyz_to_hdf5(args, args.valid_file, filename_valid)
+            _convert_xyz_to_hdf5(args, args.valid_file, filename_valid, logger)
 
     # Convert test file
     if args.test_file:
-        if Path(filename_test).exists():
+        if Path(filename_test).exists() and not args.append:
             logger.log(1, 'Test file exists. Skipping...')
 
         else:
             logger.log(1, 'Converting test file')
-            _convert_xyz_to_hdf5(args, args.test_file, filename_test)
+            _convert_xyz_to_hdf5(args, args.test_file, filename_test, logger)
+
+    # Store neighbor lists and the dataset index in data files that were
+    # converted before
+    for filename in [filename_train, filename_valid, filename_test]:
+        if Path(filename).exists():
+            with _open_hdf5(args, filename) as file:
+                neighbor_lists = _compute_neighbors(args, file, logger)
+                _compute_index(
+                    args, file, logger, _index_r_max(args, file, neighbor_lists)
+                )
 
     if Path(filename_train).exists() and args.compute_statistics:
         logger.log(1, 'Computing statistics')
 
-        # Compute statistics
-        with HDF5Dataset(filename_train) as train_dataset:
-            # If training set did not contain any single atom entries, estimate E0s...
-            if statistics.atomic_numbers is None or len(statistics.atomic_numbers) == 0:
-                statistics.atomic_numbers = compute_atomic_numbers(train_dataset)
+        if accumulator is None:
+            # The train file was converted before, which is only read if it
+            # does not store statistics for all structures
+            with HDF5Dataset(filename_train) as train_dataset:
+                sources = HDF5Sources.load(train_dataset.file)
+                accumulator = _load_statistics(
+                    args, train_dataset, statistics.r_max, logger
+                )
 
-            # If training set did not contain any single atom entries, estimate E0s...
-            if (
-                statistics.atomic_energies is None
-                or len(statistics.atomic_energies) == 0
-            ):
-                statistics.atomic_energies = get_atomic_energies(
-                    args.atomic_energies, train_dataset, statistics.atomic_numbers
+        # Elements and energies of isolated atoms of all sources, where isolated
+        # atoms are not written to the train file
+        if sources is not None:
+            if statistics.atomic_numbers is None:
+                statistics.atomic_numbers = AtomicNumberTable(
+                    sorted(
+                        set(sources.atomic_numbers()) | set(accumulator.atomic_numbers)
+                    )
                 )
+            if statistics.atomic_energies is None:
+                statistics.atomic_energies = sources.atomic_energies()
 
-        with HDF5GraphDataset(
-            filename_train,
-            r_max=statistics.r_max,
-            atomic_numbers=statistics.atomic_numbers,
-        ) as train_dataset:
-            train_loader = torch_geometric.loader.DataLoader(
-                dataset=train_dataset,
-                batch_size=args.batch_size,
-                shuffle=False,
-                drop_last=False,
-            )
-            statistics.avg_num_neighbors, statistics.mean, statistics.std = (
-                compute_statistics(
-                    train_loader,
-                    statistics.atomic_energies,
+        if statistics.atomic_numbers is None or len(statistics.atomic_numbers) == 0:
+            statistics.atomic_numbers = accumulator.atomic_numbers
+
+        # If training set did not contain any single atom entries, estimate E0s...
+        if statistics.atomic_energies is None or len(statistics.atomic_energies) == 0:
+            # A random subset of structures is read from the train file, the
+            # sums of all structures are used otherwise
+            with HDF5Dataset(filename_train) as train_dataset:
+                statistics.atomic_energies = get_atomic_energies(
+                    args.atomic_energies,
+                    train_dataset,
                     statistics.atomic_numbers,
+                    statistics=accumulator,
+                    ridge=args.atomic_energies_ridge,
+                    max_n=args.atomic_energies_max_n,
+                    seed=args.seed,
                 )
-            )
 
-            logger.log(1, f'Final statistics to be saved: {statistics}')
+        statistics.avg_num_neighbors = accumulator.avg_num_neighbors
+        statistics.mean = accumulator.energy_mean(statistics.atomic_energies)
+        statistics.std = accumulator.forces_rms
+
+        logger.log(1, f'Final statistics to be saved: {statistics}')
 
-            statistics.dump(os.path.join(args.output_dir, 'statistics.json'))
+        statistics.dump(os.path.join(args.output_dir, 'statistics.json'))
 
 
 def preprocess(args):
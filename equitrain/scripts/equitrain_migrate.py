@@ -0,0 +1,19 @@
+import sys
+
+from equitrain import get_args_parser_migrate, migrate
+
+
+# %%
+def main():
+    parser = get_args_parser_migrate()
+
+    try:
+        migrate(parser.parse_args())
+    except ValueError as v:
+        print(v, file=sys.stderr)
+        sys.exit(1)
+
+
+# %%
+if __name__ == '__main__':
+    main()
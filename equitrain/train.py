@@ -15,7 +15,9 @@ from equitrain.argparser import (
     check_args_complete,
     get_loss_monitor,
 )
-from equitrain.data.loaders import dataloader_update_errors, get_dataloaders
+from equitrain.data.cache import get_graph_cache
+from equitrain.data.loaders import get_dataloaders
+from equitrain.data.samplers_priority import PrioritySampler, get_priority_sampler
 from equitrain.logger import FileLogger
 from equitrain.loss import LossCollection
 from equitrain.loss_fn import LossFnCollection
@@ -24,6 +26,7 @@ from equitrain.model import get_model
 from equitrain.train_checkpoint import load_checkpoint, save_checkpoint
 from equitrain.train_optimizer import create_optimizer, update_weight_decay
 from equitrain.train_scheduler import SchedulerWrapper, create_scheduler
+from equitrain.train_timer import StepTimer
 from equitrain.utility import set_dtype, set_seeds
 
 warnings.filterwarnings('ignore', message=r'.*TorchScript type system.*')
@@ -122,17 +125,23 @@ def forward_and_backward(
     data_list,
     i_,
     step,
-    errors,
+    sampler,
     loss_fn,
     loss_collection,
     accelerator,
     logger,
+    *,
+    step_timer=None,
 ):
     y_pred = model(data)
 
     # Evaluate metric to be optimized
     loss, error = loss_fn(y_pred, data)
 
+    # Local work of this step ends before gradients are synchronized
+    if step_timer is not None:
+        step_timer.stop()
+
     try:
         # Backpropagate here to prevent out-of-memory errors, gradients
         # will be accumulated. Since we accumulate gradients over sub-batches,
@@ -148,7 +157,8 @@ def forward_and_backward(
 
     loss_collection += loss
 
-    errors[data.idx] = error
+    if sampler is not None:
+        sampler.update(data.idx, error)
 
 
 def train_one_epoch(
@@ -158,7 +168,7 @@ def train_one_epoch(
     accelerator: Accelerator,
     dataloader: Iterable,
     optimizer: torch.optim.Optimizer,
-    errors: torch.Tensor,
+    sampler: PrioritySampler,
     epoch: int,
     logger: FileLogger,
 ):
@@ -170,18 +180,22 @@ def train_one_epoch(
 
     start_time = time.perf_counter()
 
-    if errors is None:
-        errors = torch.zeros(len(dataloader.dataset), device=accelerator.device)
-    else:
-        dataloader = dataloader_update_errors(
-            args, dataloader, errors, accelerator, logger
-        )
+    # Number of steps and sub-batches for monitoring the batch sampler
+    num_steps = 0
+    num_sub_batches = 0
 
     if args.train_max_steps is None:
         total = len(dataloader)
     else:
         total = args.train_max_steps
 
+    # Measure local step times to detect stragglers, which synchronizes the
+    # device in every step and is therefore only done for multiple processes
+    step_timer = None
+    if accelerator.num_processes > 1:
+        step_timer = StepTimer(accelerator)
+        step_timer.start()
+
     with tqdm(
         enumerate(dataloader),
         total=total,
@@ -196,6 +210,9 @@ def train_one_epoch(
             # Reset gradients
             optimizer.zero_grad()
 
+            num_steps += 1
+            num_sub_batches += len(data_list)
+
             # Sub-batching causes deadlocks when the number of sub-batches varies between
             # processes. We need to loop over sub-batches withouth sync
             with accelerator.no_sync(model):
@@ -210,7 +227,7 @@ def train_one_epoch(
                         data_list,
                         i_,
                         step,
-                        errors,
+                        sampler,
                         loss_fn,
                         loss_collection,
                         accelerator,
@@ -224,11 +241,12 @@ def train_one_epoch(
                 data_list,
                 i_,
                 step,
-                errors,
+                sampler,
                 loss_fn,
                 loss_collection,
                 accelerator,
                 logger,
+                step_timer=step_timer,
             )
 
             # Handle NaN/Inf values and clip gradients
@@ -273,12 +291,26 @@ def train_one_epoch(
             if step >= total:
                 break
 
+            if step_timer is not None:
+                step_timer.start()
+
+    if step_timer is not None:
+        step_timer.log(logger, epoch)
+
+    if num_steps > 0:
+        logger.log(
+            1,
+            f'Epoch [{epoch:>4}] -- Mean number of sub-batches per step: {num_sub_batches / num_steps:.2f}',
+        )
+
     # Reset gradients
     optimizer.zero_grad()
-    # Sum local errors across all processes
-    accelerator.reduce(errors, reduction='sum')
 
-    return loss_metrics, errors
+    if sampler is not None:
+        # Exchange only priorities that changed during this epoch
+        sampler.synchronize(accelerator)
+
+    return loss_metrics
 
 
 def _train_with_accelerator(args, accelerator: Accelerator):
@@ -339,8 +371,11 @@ def _train_with_accelerator(args, accelerator: Accelerator):
             f'Number of test points      : {len(test_loader) if test_loader is not None else 0}',
         )
 
-    # Prediction errors for sampling training data accordingly
-    if args.weighted_sampler:
+    # Prediction errors for sampling training data accordingly, which are
+    # updated during training
+    sampler = get_priority_sampler(train_loader)
+
+    if sampler is not None:
         _, errors = evaluate(
             args,
             model=model,
@@ -349,8 +384,7 @@ def _train_with_accelerator(args, accelerator: Accelerator):
             dataloader=train_loader,
             desc='Estimating errors',
         )
-    else:
-        errors = None
+        sampler.set_priorities(errors)
 
     if args.wandb_project is not None:
         accelerator.init_trackers(
@@ -387,17 +421,14 @@ def _train_with_accelerator(args, accelerator: Accelerator):
     for epoch in range(args.epochs_start, args.epochs_start + args.epochs):
         epoch_start_time = time.perf_counter()
 
-        if not args.weighted_sampler:
-            errors = None
-
-        train_loss, errors = train_one_epoch(
+        train_loss = train_one_epoch(
             args=args,
             model=model,
             model_ema=model_ema,
             accelerator=accelerator,
             dataloader=train_loader,
             optimizer=optimizer,
-            errors=errors,
+            sampler=sampler,
             epoch=epoch,
             logger=logger,
         )
@@ -412,6 +443,11 @@ def _train_with_accelerator(args, accelerator: Accelerator):
 
         update_val_result = best_metrics.update(valid_loss.main, epoch)
 
+        for name, data_loader in [('train', train_loader), ('val', val_loader)]:
+            graph_cache = get_graph_cache(data_loader)
+            if graph_cache is not None:
+                graph_cache.log(logger, accelerator, epoch, name)
+
         accelerator.log({'train_loss': train_loss.main['total'].avg}, step=epoch)
         accelerator.log({'val_loss': valid_loss.main['total'].avg}, step=epoch)
         accelerator.log({'lr': lr_scheduler.get_last_lr()[0]}, step=epoch)
@@ -0,0 +1,72 @@
+import time
+
+import torch
+from accelerate import Accelerator
+
+from equitrain.logger import FileLogger
+
+
+class StepTimer:
+    def __init__(self, accelerator: Accelerator):
+        """
+        Measures the local time of each training step on every process.
+
+        The local time of a step starts when the process waits for the next batch
+        and ends right before the backward pass that synchronizes gradients. It
+        therefore includes data loading and all computations that differ between
+        processes, but not the time a process waits for the others.
+        """
+        self.accelerator = accelerator
+        self.times = []
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+
+    def stop(self):
+        if self.start_time is None:
+            return
+
+        if self.accelerator.device.type == 'cuda':
+            torch.cuda.synchronize(self.accelerator.device)
+
+        self.times.append(time.perf_counter() - self.start_time)
+        self.start_time = None
+
+    def gather(self) -> torch.Tensor:
+        """Step times of all processes as tensor [num_processes, num_steps],
+        where steps are truncated to the smallest number of steps of any process."""
+        # Processes must agree on the number of steps for gathering, padded
+        # steps would distort the statistics of step times
+        num_steps = self.accelerator.gather(
+            torch.tensor([len(self.times)], device=self.accelerator.device)
+        )
+        times = torch.tensor(
+            self.times[: int(num_steps.min())],
+            dtype=torch.float64,
+            device=self.accelerator.device,
+        )
+        times = self.accelerator.gather(times)
+
+        return times.reshape(self.accelerator.num_processes, -1).cpu()
+
+    def log(self, logger: FileLogger, epoch: int):
+        """Log the skew of step times between processes, which is a collective
+        operation that must be called on all processes."""
+        times = self.gather()
+
+        if times.numel() == 0:
+            return
+
+        mean = times.mean(dim=0)
+        skew = ((times.max(dim=0).values - mean) / mean.clamp(min=1e-12)).mean()
+        time_per_process = times.mean(dim=1)
+
+        logger.log(
+            1,
+            f'Epoch [{epoch:>4}] -- Step time per process: '
+            f'min={1e3 * time_per_process.min():.1f}ms, '
+            f'max={1e3 * time_per_process.max():.1f}ms, '
+            f'skew={100 * skew:.1f}%, '
+            f'slowest process: {int(time_per_process.argmax())}',
+        )
@@ -0,0 +1,59 @@
+# %%
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.utility import to_one_hot
+
+
+def one_hot_vectorize(atomic_numbers, table):
+    """Previous implementation with a linear search per atom."""
+    indices = np.vectorize(table.z_to_index)(atomic_numbers)
+    return to_one_hot(
+        torch.tensor(indices, dtype=torch.long).unsqueeze(-1), num_classes=len(table)
+    )
+
+
+def one_hot_lookup(atomic_numbers, table):
+    return table.to_one_hot(atomic_numbers)
+
+
+def timeit(fn, structures, table):
+    start = time.perf_counter()
+    for atomic_numbers in structures:
+        fn(atomic_numbers, table)
+    return 1e6 * (time.perf_counter() - start) / len(structures)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark atomic number table lookups')
+    parser.add_argument('--num-structures', type=int, default=2000)
+    parser.add_argument('--num-atoms', type=int, default=200)
+    parser.add_argument('--num-elements', type=int, default=89)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+
+    table = AtomicNumberTable(list(range(1, args.num_elements + 1)))
+    structures = [
+        rng.integers(1, args.num_elements + 1, size=args.num_atoms)
+        for _ in range(args.num_structures)
+    ]
+
+    for name, fn in [('vectorize', one_hot_vectorize), ('lookup', one_hot_lookup)]:
+        time_numpy = timeit(fn, structures, table)
+        time_torch = timeit(fn, [torch.from_numpy(zs) for zs in structures], table)
+
+        print(
+            f'{name:>9}: {time_numpy:8.1f} us/structure (numpy), '
+            f'{time_torch:8.1f} us/structure (torch)'
+        )
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+from ase import Atoms
+
+from equitrain import get_args_parser_train
+from equitrain.data import AtomicNumberTable
+from equitrain.data.configuration import CachedCalc
+from equitrain.data.format_hdf5 import HDF5Dataset, compute_index
+from equitrain.data.loaders import get_dataloader
+from equitrain.data.scatter import scatter_sum
+
+
+# %%
+def random_crystals(n, max_atoms=300, volume_per_atom=15.0, seed=123):
+    """Random periodic structures with a long-tailed size distribution
+    similar to Alexandria and MPtrj."""
+    rng = np.random.default_rng(seed)
+
+    for _ in range(n):
+        num_atoms = int(np.clip(rng.lognormal(2.5, 0.9), 1, max_atoms))
+        length = (num_atoms * volume_per_atom) ** (1 / 3)
+
+        atoms = Atoms(
+            numbers=rng.integers(1, 90, size=num_atoms),
+            positions=rng.uniform(0.0, length, size=(num_atoms, 3)),
+            cell=length * np.identity(3),
+            pbc=True,
+        )
+        atoms.calc = CachedCalc(
+            rng.normal(), rng.normal(size=(num_atoms, 3)), rng.normal(size=6)
+        )
+        atoms.info['virials'] = np.zeros((3, 3))
+        atoms.info['dipole'] = np.zeros(3)
+
+        yield atoms
+
+
+class MessagePassing(torch.nn.Module):
+    """Small stand-in for an interatomic potential, whose cost scales with
+    the number of edges."""
+
+    def __init__(self, num_features=64, num_layers=2):
+        super().__init__()
+        self.embedding = torch.nn.Embedding(128, num_features)
+        self.layers = torch.nn.ModuleList(
+            [torch.nn.Linear(num_features, num_features) for _ in range(num_layers)]
+        )
+
+    def forward(self, data):
+        h = self.embedding(data.atomic_numbers)
+        senders, receivers = data.edge_index
+
+        for layer in self.layers:
+            messages = torch.nn.functional.silu(layer(h[senders]))
+            h = h + scatter_sum(messages, receivers, dim=0, dim_size=h.shape[0])
+
+        return scatter_sum(h.sum(dim=-1), data.batch, dim=0, dim_size=data.num_graphs)
+
+
+def run(data_loader, model=None):
+    num_atoms = 0
+    num_steps = 0
+    num_passes = 0
+
+    start = time.perf_counter()
+
+    for data_list in data_loader:
+        num_steps += 1
+
+        for data in data_list:
+            num_passes += 1
+            num_atoms += data.num_nodes
+
+            if model is not None:
+                energy = model(data)
+                energy.square().sum().backward()
+
+    elapsed = time.perf_counter() - start
+
+    return num_atoms / elapsed, num_passes / num_steps, num_steps
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark batch samplers')
+    parser.add_argument('--num-structures', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batch-max-nodes', type=int, default=1024)
+    parser.add_argument('--batch-max-edges', type=int, default=32768)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    parser.add_argument('--workers', type=int, default=0)
+    args_benchmark = parser.parse_args()
+
+    torch.set_default_dtype(torch.float32)
+
+    atomic_numbers = AtomicNumberTable(list(range(1, 90)))
+    model = MessagePassing()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        with HDF5Dataset(filename, 'w') as file:
+            file.extend(random_crystals(args_benchmark.num_structures))
+            compute_index(file, args_benchmark.r_max)
+
+        for sampler in ['random', 'bucketed', 'budget']:
+            args = get_args_parser_train().parse_args([])
+            args.sampler = sampler
+            args.batch_size = args_benchmark.batch_size
+            args.batch_max_nodes = args_benchmark.batch_max_nodes
+            args.batch_max_edges = args_benchmark.batch_max_edges
+            args.workers = args_benchmark.workers
+            args.pin_memory = False
+
+            data_loader = get_dataloader(
+                args, filename, atomic_numbers, args_benchmark.r_max
+            )
+
+            loading, passes, steps = run(data_loader)
+            training, _, _ = run(data_loader, model)
+
+            print(
+                f'{sampler:>8}: {steps:5d} steps, {passes:5.2f} passes/step, '
+                f'loading {loading:9.1f} atoms/s, training {training:9.1f} atoms/s'
+            )
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+
+from equitrain import get_args_parser_train
+from equitrain.argparser import str2bytes
+from equitrain.data import AtomicNumberTable
+from equitrain.data.cache import HITS, MISSES, get_graph_cache
+from equitrain.data.format_hdf5 import HDF5Dataset
+from equitrain.data.loaders import get_dataloader
+
+from batch_sampler import random_crystals
+
+
+def run(data_loader, num_epochs):
+    elapsed = []
+    for epoch in range(num_epochs):
+        if hasattr(data_loader.batch_sampler, 'set_epoch'):
+            data_loader.batch_sampler.set_epoch(epoch)
+
+        start = time.perf_counter()
+        for data_list in data_loader:
+            for data in data_list:
+                data['positions']
+        elapsed.append(time.perf_counter() - start)
+
+    return elapsed
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark the graph cache')
+    parser.add_argument('--num-structures', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument(
+        '--cache-size',
+        type=str,
+        nargs='+',
+        default=['64M', '1G'],
+        help='Cache budgets to compare, e.g. smaller and larger than the dataset',
+    )
+    args_benchmark = parser.parse_args()
+
+    torch.set_default_dtype(torch.float32)
+
+    atomic_numbers = AtomicNumberTable(list(range(1, 90)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        # Neighbor lists are computed when graphs are read
+        with HDF5Dataset(filename, 'w') as file:
+            file.extend(random_crystals(args_benchmark.num_structures))
+
+        for cache_size in [None] + args_benchmark.cache_size:
+            args = get_args_parser_train().parse_args([])
+            args.batch_size = args_benchmark.batch_size
+            args.workers = args_benchmark.workers
+            args.pin_memory = False
+            if cache_size is not None:
+                args.graph_cache_size = str2bytes(cache_size)
+
+            data_loader = get_dataloader(
+                args, filename, atomic_numbers, args_benchmark.r_max
+            )
+            elapsed = run(data_loader, args_benchmark.epochs)
+
+            summary = ', '.join(f'{t:6.2f}s' for t in elapsed)
+            cache = get_graph_cache(data_loader)
+            if cache is not None:
+                counters = cache.counters.sum(dim=0)
+                requests = int(counters[HITS] + counters[MISSES])
+                summary += f', hit rate {100 * int(counters[HITS]) / requests:5.1f}%'
+
+            print(f'{cache_size or "no cache":>8}: {summary}')
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_hdf5 import HDF5Dataset, HDF5GraphDataset
+
+from batch_sampler import random_crystals
+
+
+class TimedDataset(torch.utils.data.Dataset):
+    """Wraps a graph dataset and measures the latency of each sample within the
+    worker process that produces it."""
+
+    def __init__(self, dataset: HDF5GraphDataset, path: str):
+        self.dataset = dataset
+        self.path = path
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        start = time.perf_counter()
+
+        if self.path == 'atoms':
+            # Previous path via ase.Atoms and CachedCalc
+            atoms = HDF5Dataset.__getitem__(self.dataset, index)
+            graph = self.dataset.converter.convert(atoms)
+        else:
+            graph = self.dataset[index]
+
+        return graph, time.perf_counter() - start
+
+    def __getitems__(self, indices):
+        if self.path != 'batch':
+            return [self[index] for index in indices]
+
+        start = time.perf_counter()
+        graphs = self.dataset.__getitems__(indices)
+        latency = (time.perf_counter() - start) / len(indices)
+
+        return [(graph, latency) for graph in graphs]
+
+
+def run(dataset, path, batch_size, workers):
+    data_loader = torch.utils.data.DataLoader(
+        TimedDataset(dataset, path),
+        batch_size=batch_size,
+        shuffle=True,
+        num_workers=workers,
+        collate_fn=list,
+    )
+
+    latencies = []
+
+    start = time.perf_counter()
+    for batch in data_loader:
+        latencies.extend(latency for _, latency in batch)
+    elapsed = time.perf_counter() - start
+
+    return 1e6 * np.mean(latencies), len(latencies) / elapsed
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark conversion of structures to graphs')
+    parser.add_argument('--num-structures', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    torch.set_default_dtype(torch.float32)
+
+    atomic_numbers = AtomicNumberTable(list(range(1, 90)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        with HDF5Dataset(filename, 'w') as file:
+            file.extend(random_crystals(args.num_structures))
+
+        dataset = HDF5GraphDataset(
+            filename, r_max=args.r_max, atomic_numbers=atomic_numbers
+        )
+
+        for path in ['atoms', 'record', 'batch']:
+            latency, throughput = run(dataset, path, args.batch_size, args.workers)
+
+            print(
+                f'{path:>6}: {latency:8.1f} us/sample in workers, '
+                f'{throughput:8.1f} samples/s'
+            )
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import torch
+
+from equitrain import get_args_parser_train
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_hdf5 import HDF5Dataset, compute_neighbor_lists
+from equitrain.data.loaders import get_dataloader
+
+from batch_sampler import random_crystals
+
+
+def batch_nbytes(batch) -> int:
+    """Size of all tensors of a batch, which DataLoader workers copy into
+    shared memory for the main process."""
+    return sum(
+        value.untyped_storage().nbytes()
+        for value in batch.to_dict().values()
+        if torch.is_tensor(value)
+    )
+
+
+def run(data_loader):
+    num_bytes = 0
+    num_samples = 0
+
+    start = time.perf_counter()
+
+    for data_list in data_loader:
+        for data in data_list:
+            num_bytes += batch_nbytes(data)
+            num_samples += data.num_graphs
+
+            # Access all attributes a model would use
+            data['node_attrs']
+            data['positions']
+
+    elapsed = time.perf_counter() - start
+
+    return num_bytes / num_samples, num_samples / elapsed
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark graph schemas')
+    parser.add_argument('--num-structures', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--num-elements', type=int, default=89)
+    parser.add_argument('--dtype', type=str, default='float64')
+    args_benchmark = parser.parse_args()
+
+    torch.set_default_dtype(getattr(torch, args_benchmark.dtype))
+
+    atomic_numbers = AtomicNumberTable(list(range(1, args_benchmark.num_elements + 1)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        with HDF5Dataset(filename, 'w') as file:
+            file.extend(random_crystals(args_benchmark.num_structures))
+            # Exclude the cost of computing neighbors
+            compute_neighbor_lists(file, args_benchmark.r_max)
+
+        for compact in [False, True]:
+            args = get_args_parser_train().parse_args([])
+            args.batch_size = args_benchmark.batch_size
+            args.workers = args_benchmark.workers
+            args.compact_graphs = compact
+            args.pin_memory = False
+
+            data_loader = get_dataloader(
+                args, filename, atomic_numbers, args_benchmark.r_max
+            )
+
+            nbytes, throughput = run(data_loader)
+
+            print(
+                f'{"compact" if compact else "full":>7}: '
+                f'{nbytes / 1024:8.1f} KiB/sample, {throughput:8.1f} samples/s'
+            )
+
+
+# %%
+if __name__ == '__main__':
+    main()
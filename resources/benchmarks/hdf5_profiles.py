@@ -0,0 +1,97 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from hdf5_write import random_structures
+
+from equitrain.data.format_hdf5 import HDF5Dataset, migrate_hdf5
+
+# Chunking and compression profiles as passed to HDF5Dataset
+PROFILES = {
+    'default': dict(),
+    'chunk-1024': dict(chunk_size=1024),
+    'chunk-16384': dict(chunk_size=16384),
+    'lzf': dict(chunk_size=4096, compression='lzf'),
+    'lzf+shuffle': dict(chunk_size=4096, compression='lzf', shuffle=True),
+    'gzip-1': dict(chunk_size=4096, compression='gzip', compression_level=1),
+    'gzip-4+shuffle': dict(
+        chunk_size=4096, compression='gzip', compression_level=4, shuffle=True
+    ),
+}
+
+
+def read_random(dataset, num_reads, seed=123):
+    rng = np.random.default_rng(seed)
+    for i in rng.integers(0, len(dataset), size=num_reads):
+        dataset.read_record(i)
+
+    return num_reads
+
+
+def read_sequential(dataset, batch_size=256):
+    for start in range(0, len(dataset), batch_size):
+        dataset.read_records(range(start, min(start + batch_size, len(dataset))))
+
+    return len(dataset)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser(
+        'Benchmark chunking and compression profiles of equitrain HDF5 files'
+    )
+    parser.add_argument(
+        '--input-file',
+        help='Equitrain data file used as input, synthetic data if not given',
+        type=str,
+        default=None,
+    )
+    parser.add_argument('--num-structures', type=int, default=20000)
+    parser.add_argument('--num-reads', type=int, default=2000)
+    parser.add_argument('--format-version', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename_input = args.input_file
+
+        if filename_input is None:
+            filename_input = os.path.join(tmpdir, 'input.h5')
+            with HDF5Dataset(filename_input, 'w') as file:
+                file.extend(random_structures(args.num_structures))
+
+        print(
+            f'{"profile":>16} {"size [MB]":>10} {"random [1/s]":>13} {"sequential [1/s]":>17}'
+        )
+
+        for name, options in PROFILES.items():
+            filename = os.path.join(tmpdir, f'{name}.h5')
+
+            migrate_hdf5(
+                filename_input,
+                filename,
+                format_version=args.format_version,
+                **options,
+            )
+
+            with HDF5Dataset(filename) as dataset:
+                start = time.perf_counter()
+                n = read_random(dataset, args.num_reads)
+                random_throughput = n / (time.perf_counter() - start)
+
+                start = time.perf_counter()
+                n = read_sequential(dataset)
+                sequential_throughput = n / (time.perf_counter() - start)
+
+            size = os.path.getsize(filename) / 1024**2
+
+            print(
+                f'{name:>16} {size:10.1f} {random_throughput:13.1f} {sequential_throughput:17.1f}'
+            )
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from ase import Atoms
+
+from equitrain.data.configuration import CachedCalc
+from equitrain.data.format_hdf5 import HDF5Dataset
+
+
+# %%
+def random_structures(n, max_atoms=200, seed=123):
+    rng = np.random.default_rng(seed)
+
+    for _ in range(n):
+        num_atoms = rng.integers(1, max_atoms + 1)
+
+        atoms = Atoms(
+            numbers=rng.integers(1, 90, size=num_atoms),
+            positions=rng.uniform(0.0, 10.0, size=(num_atoms, 3)),
+            cell=10.0 * np.identity(3),
+            pbc=True,
+        )
+        atoms.calc = CachedCalc(
+            rng.normal(), rng.normal(size=(num_atoms, 3)), rng.normal(size=6)
+        )
+        atoms.info['virials'] = np.zeros((3, 3))
+        atoms.info['dipole'] = np.zeros(3)
+
+        yield atoms
+
+
+def write_rows(filename, structures, format_version):
+    with HDF5Dataset(filename, 'w', format_version=format_version) as file:
+        for i, atoms in enumerate(structures):
+            file[i] = atoms
+
+
+def write_buffered(filename, structures, format_version):
+    with HDF5Dataset(filename, 'w', format_version=format_version) as file:
+        file.extend(structures)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark writing equitrain HDF5 files')
+    parser.add_argument('--num-structures', type=int, default=10000)
+    parser.add_argument('--max-atoms', type=int, default=200)
+    args = parser.parse_args()
+
+    structures = list(random_structures(args.num_structures, args.max_atoms))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        for format_version in (1, 2):
+            for name, write_fn in [
+                ('row-wise', write_rows),
+                ('buffered', write_buffered),
+            ]:
+                start = time.perf_counter()
+                write_fn(filename, structures, format_version)
+                elapsed = time.perf_counter() - start
+
+                print(
+                    f'format v{format_version} {name:>8}: '
+                    f'{len(structures) / elapsed:10.1f} structures/s'
+                )
+
+
+# %%
+if __name__ == '__main__':
+    main()
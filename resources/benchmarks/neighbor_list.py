@@ -0,0 +1,87 @@
+# %%
+import argparse
+import time
+
+import numpy as np
+
+from equitrain.data.graphs.neighborhood import get_neighborhood
+
+
+def random_structure(rng, num_atoms, density, periodic):
+    """Random positions at the given number density (atoms per cubic Angstrom),
+    either in a periodic cubic cell or as an isolated cluster."""
+    length = (num_atoms / density) ** (1 / 3)
+    positions = rng.uniform(0.0, length, size=(num_atoms, 3))
+
+    if periodic:
+        return positions, (True, True, True), length * np.identity(3)
+
+    return positions, (False, False, False), None
+
+
+def timeit(engine, structure, cutoff, repeats):
+    positions, pbc, cell = structure
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        edge_index, _, _, _ = get_neighborhood(
+            positions,
+            cutoff,
+            pbc,
+            None if cell is None else cell.copy(),
+            engine=engine,
+        )
+    elapsed = (time.perf_counter() - start) / repeats
+
+    return 1e3 * elapsed, edge_index.shape[1]
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark neighbor list engines')
+    parser.add_argument(
+        '--num-atoms', type=int, nargs='+', default=[8, 64, 512, 4096, 32768]
+    )
+    parser.add_argument('--cutoff', type=float, nargs='+', default=[3.0, 4.5, 6.0])
+    parser.add_argument('--density', type=float, default=0.08)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument(
+        '--max-brute-force',
+        type=int,
+        default=4096,
+        help='Skip the brute-force engine for larger structures',
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+
+    print(
+        f'{"structure":>9} {"atoms":>7} {"cutoff":>6} {"edges":>9}  '
+        f'{"matscipy":>10} {"cell-list":>10} {"brute-force":>11}'
+    )
+
+    for periodic in [True, False]:
+        for num_atoms in args.num_atoms:
+            structure = random_structure(rng, num_atoms, args.density, periodic)
+
+            for cutoff in args.cutoff:
+                times = {}
+                for engine in ['matscipy', 'cell-list', 'brute-force']:
+                    if engine == 'brute-force' and num_atoms > args.max_brute_force:
+                        times[engine] = '-'
+                        continue
+
+                    elapsed, num_edges = timeit(engine, structure, cutoff, args.repeats)
+                    times[engine] = f'{elapsed:.2f}ms'
+
+                print(
+                    f'{"periodic" if periodic else "molecule":>9} '
+                    f'{num_atoms:7d} {cutoff:6.1f} {num_edges:9d}  '
+                    f'{times["matscipy"]:>10} {times["cell-list"]:>10} '
+                    f'{times["brute-force"]:>11}'
+                )
+
+
+# %%
+if __name__ == '__main__':
+    main()
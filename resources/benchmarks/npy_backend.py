@@ -0,0 +1,100 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from equitrain import get_args_parser_train
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_hdf5 import HDF5Dataset, compute_neighbor_lists
+from equitrain.data.format_npy import NumpyDataset, migrate_npy
+from equitrain.data.loaders import get_dataloader
+
+from batch_sampler import random_crystals
+
+
+def read_records(dataset, indices):
+    """Random access to raw records in a single process."""
+    start = time.perf_counter()
+    for i in indices:
+        dataset.read_record(i)
+    return len(indices) / (time.perf_counter() - start)
+
+
+def load_graphs(filename, atomic_numbers, r_max, workers, batch_size):
+    """Random access to graphs with a DataLoader."""
+    args = get_args_parser_train().parse_args([])
+    args.batch_size = batch_size
+    args.workers = workers
+    args.pin_memory = False
+
+    data_loader = get_dataloader(args, filename, atomic_numbers, r_max)
+
+    num_samples = 0
+    start = time.perf_counter()
+    for data_list in data_loader:
+        for data in data_list:
+            num_samples += data.num_graphs
+    return num_samples / (time.perf_counter() - start)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark the NumPy dataset backend')
+    parser.add_argument('--num-structures', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 16])
+    parser.add_argument(
+        '--input-file',
+        type=str,
+        default=None,
+        help='Benchmark an existing data file instead of synthetic structures',
+    )
+    args = parser.parse_args()
+
+    torch.set_default_dtype(torch.float32)
+    atomic_numbers = AtomicNumberTable(list(range(1, 90)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = args.input_file
+        if filename is None:
+            filename = os.path.join(tmpdir, 'benchmark.h5')
+            with HDF5Dataset(filename, 'w') as file:
+                file.extend(random_crystals(args.num_structures))
+                # Exclude the cost of computing neighbors
+                compute_neighbor_lists(file, args.r_max)
+
+        path = os.path.join(tmpdir, 'benchmark-npy')
+        start = time.perf_counter()
+        migrate_npy(filename, path)
+        print(f'Converted to NumPy shards in {time.perf_counter() - start:.2f}s')
+
+        with HDF5Dataset(filename) as dataset_hdf5, NumpyDataset(path) as dataset_npy:
+            indices = np.random.default_rng(1).permutation(len(dataset_hdf5))
+
+            print(
+                f'{"records":>10}: '
+                f'hdf5 {read_records(dataset_hdf5, indices):10.1f}/s, '
+                f'npy {read_records(dataset_npy, indices):10.1f}/s'
+            )
+
+        for workers in args.workers:
+            throughput = {
+                name: load_graphs(
+                    file, atomic_numbers, args.r_max, workers, args.batch_size
+                )
+                for name, file in [('hdf5', filename), ('npy', path)]
+            }
+            print(
+                f'{f"{workers} workers":>10}: '
+                f'hdf5 {throughput["hdf5"]:10.1f}/s, npy {throughput["npy"]:10.1f}/s'
+            )
+
+
+# %%
+if __name__ == '__main__':
+    main()
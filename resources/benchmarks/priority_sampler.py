@@ -0,0 +1,124 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import WeightedRandomSampler
+
+from equitrain import get_args_parser_train
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_hdf5 import HDF5Dataset
+from equitrain.data.loaders import get_dataloader
+from equitrain.data.loaders_dynamic import DynamicGraphLoader
+from equitrain.data.samplers_priority import PrioritySampler, get_priority_sampler
+
+from batch_sampler import random_crystals
+
+
+def time_sampling(num_samples, batch_size, repeats=3):
+    """Per-epoch cost of rebuilding a WeightedRandomSampler from dense errors
+    against incremental updates of the sum-tree."""
+    rng = np.random.default_rng(1)
+    errors = torch.rand(num_samples, dtype=torch.float64)
+    batches = np.array_split(rng.permutation(num_samples), num_samples // batch_size)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            errors[batch] = torch.rand(len(batch), dtype=torch.float64)
+        list(WeightedRandomSampler(errors, num_samples=num_samples))
+    time_dense = (time.perf_counter() - start) / repeats
+
+    sampler = PrioritySampler(num_samples)
+    sampler.set_priorities(errors)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            sampler.update(batch, rng.random(len(batch)))
+        sampler.synchronize(None)
+        list(sampler)
+    time_tree = (time.perf_counter() - start) / repeats
+
+    return time_dense, time_tree
+
+
+def time_epochs(data_loader, epochs):
+    """Mean time of loading all batches of an epoch."""
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for _ in data_loader:
+            pass
+    return (time.perf_counter() - start) / epochs
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark priority sampler')
+    parser.add_argument('--num-structures', type=int, default=500)
+    parser.add_argument('--num-samples', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=5)
+    args_benchmark = parser.parse_args()
+
+    time_dense, time_tree = time_sampling(
+        args_benchmark.num_samples, args_benchmark.batch_size
+    )
+    print(
+        f'{args_benchmark.num_samples} samples: dense errors + WeightedRandomSampler '
+        f'{time_dense:.2f}s/epoch, sum-tree {time_tree:.2f}s/epoch'
+    )
+
+    atomic_numbers = AtomicNumberTable(list(range(1, 90)))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        with HDF5Dataset(filename, 'w') as file:
+            file.extend(random_crystals(args_benchmark.num_structures))
+
+        args = get_args_parser_train().parse_args([])
+        args.batch_size = args_benchmark.batch_size
+        args.workers = args_benchmark.workers
+        args.pin_memory = False
+
+        data_loader = get_dataloader(
+            args, filename, atomic_numbers, 4.5, weighted_sampler=True
+        )
+        get_priority_sampler(data_loader).set_priorities(
+            torch.rand(len(data_loader.dataset))
+        )
+
+        time_persistent = time_epochs(data_loader, args_benchmark.epochs)
+
+        # Previous behaviour, the loader was rebuilt with new weights every epoch
+        times = []
+        for _ in range(args_benchmark.epochs):
+            start = time.perf_counter()
+            rebuilt_loader = DynamicGraphLoader(
+                dataset=data_loader.dataset,
+                batch_size=args.batch_size,
+                sampler=WeightedRandomSampler(
+                    torch.rand(len(data_loader.dataset)),
+                    num_samples=len(data_loader.dataset),
+                ),
+                num_workers=args.workers,
+            )
+            time_epochs(rebuilt_loader, 1)
+            times.append(time.perf_counter() - start)
+        time_rebuild = np.mean(times)
+
+        print(
+            f'Loading with {args.workers} workers: rebuilt loader '
+            f'{1e3 * time_rebuild:.1f}ms/epoch, persistent loader '
+            f'{1e3 * time_persistent:.1f}ms/epoch'
+        )
+
+
+# %%
+if __name__ == '__main__':
+    main()
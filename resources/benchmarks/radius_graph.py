@@ -0,0 +1,85 @@
+# %%
+import argparse
+import time
+
+import numpy as np
+import torch
+from torch_geometric.data import Batch
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.graphs import AtomsToGraphs, RadiusGraph
+
+from batch_sampler import random_crystals
+
+
+def convert(converter, batches):
+    """Conversion of structures to graphs as carried out in workers."""
+    start = time.perf_counter()
+    for structures in batches:
+        Batch.from_data_list([converter.convert(atoms) for atoms in structures])
+    return 1e3 * (time.perf_counter() - start) / len(batches)
+
+
+def compute_edges(radius_graph, batches, device):
+    """Edges of collated batches computed on the device of the model."""
+    batches = [batch.to(device) for batch in batches]
+
+    start = time.perf_counter()
+    for batch in batches:
+        radius_graph(batch)
+    if device == 'cuda':
+        torch.cuda.synchronize()
+    return 1e3 * (time.perf_counter() - start) / len(batches)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark batched radius graphs')
+    parser.add_argument('--num-structures', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    args = parser.parse_args()
+
+    torch.set_default_dtype(torch.float32)
+
+    atomic_numbers = AtomicNumberTable(list(range(1, 90)))
+    structures = list(random_crystals(args.num_structures))
+    batches = [
+        structures[i : i + args.batch_size]
+        for i in range(0, len(structures), args.batch_size)
+    ]
+
+    converter = AtomsToGraphs(
+        atomic_numbers, radius=args.r_max, r_edges=True, r_pbc=True
+    )
+    converter_atoms = AtomsToGraphs(
+        atomic_numbers, radius=args.r_max, r_edges=False, r_pbc=True
+    )
+    radius_graph = RadiusGraph(args.r_max)
+
+    num_atoms = np.mean([len(atoms) for atoms in structures])
+    print(f'{args.batch_size} structures per batch, {num_atoms:.1f} atoms on average')
+
+    print(
+        f'{"per structure":>16}: '
+        f'{convert(converter, batches):8.2f} ms/batch in workers'
+    )
+    print(
+        f'{"without edges":>16}: '
+        f'{convert(converter_atoms, batches):8.2f} ms/batch in workers'
+    )
+
+    batches = [
+        Batch.from_data_list([converter_atoms.convert(atoms) for atoms in structures])
+        for structures in batches
+    ]
+
+    devices = ['cpu'] + (['cuda'] if torch.cuda.is_available() else [])
+    for device in devices:
+        elapsed = compute_edges(radius_graph, batches, device)
+        print(f'{f"batched ({device})":>16}: {elapsed:8.2f} ms/batch on device')
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# %%
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import torch
+
+from equitrain import get_args_parser_train
+from equitrain.data import AtomicNumberTable
+from equitrain.data.format_hdf5 import HDF5Dataset, compute_neighbor_lists
+from equitrain.data.format_shm import SharedGraphStore
+from equitrain.data.loaders import get_dataloader
+
+from batch_sampler import random_crystals
+
+
+def read_pss(pid: int) -> int:
+    """Proportional set size of a process in bytes, where shared pages are split
+    evenly between the processes mapping them."""
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return 1024 * int(line.split()[1])
+    return 0
+
+
+def run_rank(queue, filename, r_max, workers, batch_size, shared, root):
+    """One training process of a node, which loads a full epoch with its own
+    DataLoader workers and measures its memory halfway through the epoch."""
+
+    torch.set_default_dtype(torch.float32)
+
+    args = get_args_parser_train().parse_args([])
+    args.batch_size = batch_size
+    args.workers = workers
+    args.pin_memory = False
+    args.shared_memory_store = shared
+    args.shared_memory_dir = root
+
+    data_loader = get_dataloader(
+        args, filename, AtomicNumberTable(list(range(1, 90))), r_max
+    )
+
+    num_samples = 0
+    pss = 0
+
+    start = time.perf_counter()
+    iterator = iter(data_loader)
+    for k, data_list in enumerate(iterator):
+        for data in data_list:
+            num_samples += data.num_graphs
+
+        if k == len(data_loader) // 2:
+            pids = [os.getpid()] + [worker.pid for worker in iterator._workers]
+            pss = sum(read_pss(pid) for pid in pids)
+
+    queue.put((num_samples, time.perf_counter() - start, pss))
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark the shared memory store')
+    parser.add_argument('--num-structures', type=int, default=4000)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--r-max', type=float, default=4.5)
+    parser.add_argument('--ranks', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument(
+        '--neighbor-lists',
+        action='store_true',
+        help='Store neighbor lists in the data file instead of computing them in workers',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'benchmark.h5')
+
+        with HDF5Dataset(filename, 'w') as file:
+            file.extend(random_crystals(args.num_structures))
+            if args.neighbor_lists:
+                compute_neighbor_lists(file, args.r_max)
+
+        # The store is placed in /dev/shm, but removed with the data file
+        root = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+        try:
+            start = time.perf_counter()
+            store = SharedGraphStore.open_or_build(filename, args.r_max, root)
+            print(
+                f'Store built in {time.perf_counter() - start:.2f}s, '
+                f'{store.nbytes / 2**20:.1f}MiB for {len(store)} structures'
+            )
+
+            print(
+                f'{args.ranks} ranks with {args.workers} workers each, '
+                'memory is the proportional set size of all processes'
+            )
+            for shared in [False, True]:
+                # Ranks must not be daemonic to start DataLoader workers
+                context = multiprocessing.get_context('fork')
+                queue = context.Queue()
+                options = (args.r_max, args.workers, args.batch_size, shared, root)
+                ranks = [
+                    context.Process(target=run_rank, args=(queue, filename, *options))
+                    for _ in range(args.ranks)
+                ]
+                for rank in ranks:
+                    rank.start()
+                results = [queue.get() for _ in ranks]
+                for rank in ranks:
+                    rank.join()
+
+                num_samples = sum(result[0] for result in results)
+                elapsed = max(result[1] for result in results)
+                pss = sum(result[2] for result in results)
+
+                print(
+                    f'{"shared" if shared else "hdf5":>6}: '
+                    f'{num_samples / elapsed:8.1f} samples/s, '
+                    f'{pss / 2**20:8.1f}MiB'
+                )
+        finally:
+            shutil.rmtree(root)
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# %%
+import argparse
+import time
+
+import numpy as np
+from ase import units
+from ase.build import bulk
+from ase.calculators.emt import EMT
+from ase.md.verlet import VelocityVerlet
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.graphs import AtomsToGraphs, VerletNeighborList
+
+
+def sample_trajectory(num_frames, size, temperature, timestep, interval):
+    """Molecular dynamics of bulk copper with the EMT calculator of ASE."""
+    atoms = bulk('Cu', 'fcc', a=3.6, cubic=True).repeat(size)
+    atoms.calc = EMT()
+
+    # Maxwell-Boltzmann distributed momenta
+    rng = np.random.default_rng(1)
+    masses = atoms.get_masses()[:, None]
+    atoms.set_momenta(
+        rng.normal(size=(len(atoms), 3))
+        * np.sqrt(masses * units.kB * temperature)
+    )
+    dynamics = VelocityVerlet(atoms, timestep=timestep * units.fs)
+
+    frames = []
+    for _ in range(num_frames):
+        dynamics.run(interval)
+        frame = atoms.copy()
+        frame.calc = None
+        frames.append(frame)
+
+    return frames
+
+
+def run(converter, frames):
+    start = time.perf_counter()
+    graphs = [converter.convert(atoms) for atoms in frames]
+    elapsed = time.perf_counter() - start
+
+    return len(frames) / elapsed, graphs
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark Verlet neighbor lists')
+    parser.add_argument('--num-frames', type=int, default=200)
+    parser.add_argument('--size', type=int, default=4)
+    parser.add_argument('--temperature', type=float, default=600.0)
+    parser.add_argument('--timestep', type=float, default=2.0)
+    parser.add_argument(
+        '--interval', type=int, default=1, help='MD steps between frames'
+    )
+    parser.add_argument('--r-max', type=float, default=5.0)
+    parser.add_argument('--skin', type=float, nargs='+', default=[0.2, 0.5, 1.0])
+    args = parser.parse_args()
+
+    frames = sample_trajectory(
+        args.num_frames, args.size, args.temperature, args.timestep, args.interval
+    )
+    print(f'{len(frames)} frames with {len(frames[0])} atoms')
+
+    atomic_numbers = AtomicNumberTable([29])
+
+    converter = AtomsToGraphs(atomic_numbers, radius=args.r_max, r_edges=True)
+    throughput, graphs_ref = run(converter, frames)
+    print(f'{"get_neighborhood":>16}: {throughput:8.1f} frames/s')
+
+    for skin in args.skin:
+        engine = VerletNeighborList(skin=skin)
+        converter = AtomsToGraphs(
+            atomic_numbers,
+            radius=args.r_max,
+            r_edges=True,
+            neighbor_list_engine=engine,
+        )
+        throughput, graphs = run(converter, frames)
+
+        assert all(
+            graph.num_edges == graph_ref.num_edges
+            for graph, graph_ref in zip(graphs, graphs_ref)
+        )
+
+        print(
+            f'{f"skin {skin:.1f}":>16}: {throughput:8.1f} frames/s, '
+            f'{engine.num_builds} builds'
+        )
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+import ase.io
+from ase.calculators.singlepoint import SinglePointCalculator
+
+from equitrain.data.format_hdf5 import HDF5Dataset
+from equitrain.data.format_xyz import XYZReader
+
+from batch_sampler import random_crystals
+
+
+def write_xyz(filename, num_structures):
+    structures = []
+    for atoms in random_crystals(num_structures):
+        atoms.calc = SinglePointCalculator(
+            atoms,
+            energy=atoms.calc.energy,
+            forces=atoms.calc.forces,
+            stress=atoms.calc.stress,
+        )
+        structures.append(atoms)
+
+    ase.io.write(filename, structures, format='extxyz')
+
+
+def convert(filename_xyz, filename_hdf5, workers):
+    """Convert an extxyz file to HDF5 in the same way as equitrain-preprocess."""
+    reader = XYZReader(filename_xyz, extract_atomic_numbers=True)
+
+    with HDF5Dataset(filename_hdf5, 'w') as file:
+        with file.writer() as writer:
+            for record in reader.records(workers=workers):
+                writer.append_record(record)
+
+        return len(file)
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark parallel conversion of xyz files')
+    parser.add_argument('--num-structures', type=int, default=20000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument(
+        '--input-file',
+        type=str,
+        default=None,
+        help='Benchmark an existing extxyz file instead of synthetic structures',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = args.input_file
+        if filename is None:
+            filename = os.path.join(tmpdir, 'benchmark.xyz')
+            write_xyz(filename, args.num_structures)
+
+        print(f'{os.path.getsize(filename) / 2**20:.1f} MiB, {os.cpu_count()} CPUs')
+
+        throughput = {}
+        for workers in args.workers:
+            start = time.perf_counter()
+            n = convert(filename, os.path.join(tmpdir, 'benchmark.h5'), workers)
+            throughput[workers] = n / (time.perf_counter() - start)
+
+            print(
+                f'{workers:3d} workers: {throughput[workers]:10.1f} structures/s, '
+                f'speedup {throughput[workers] / throughput[args.workers[0]]:.2f}'
+            )
+
+
+# %%
+if __name__ == '__main__':
+    main()
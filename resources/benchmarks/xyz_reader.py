@@ -0,0 +1,71 @@
+# %%
+import argparse
+import os
+import tempfile
+import time
+
+from equitrain.data.format_xyz import XYZReader
+
+from xyz_preprocess import write_xyz
+
+
+def read_records(filename, fast):
+    """Parse an extxyz file into records as in equitrain-preprocess."""
+    reader = XYZReader(filename, extract_atomic_numbers=True, fast=fast)
+
+    start = time.perf_counter()
+    n = sum(1 for _ in reader.records())
+    elapsed = time.perf_counter() - start
+
+    return n / elapsed, os.path.getsize(filename) / 1e6 / elapsed
+
+
+def read_configurations(filename, fast):
+    """Parse an extxyz file into atoms with the fixed keys of `Configuration`."""
+    reader = XYZReader(filename, fast=fast)
+
+    start = time.perf_counter()
+    n = sum(1 for _ in reader)
+    elapsed = time.perf_counter() - start
+
+    return n / elapsed, os.path.getsize(filename) / 1e6 / elapsed
+
+
+# %%
+def main():
+    parser = argparse.ArgumentParser('Benchmark the fast extxyz reader')
+    parser.add_argument('--num-structures', type=int, default=5000)
+    parser.add_argument(
+        '--input-file',
+        type=str,
+        default=None,
+        help='Benchmark an existing extxyz file instead of synthetic structures',
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = args.input_file
+        if filename is None:
+            filename = os.path.join(tmpdir, 'benchmark.xyz')
+            write_xyz(filename, args.num_structures)
+
+        print(f'{os.path.getsize(filename) / 1e6:.1f} MB')
+
+        for name, benchmark in [
+            ('atoms', read_configurations),
+            ('records', read_records),
+        ]:
+            throughput = {}
+            for reader in ['ase', 'fast']:
+                throughput[reader] = benchmark(filename, reader == 'fast')
+                print(
+                    f'{name:>8} {reader:>4}: {throughput[reader][1]:8.2f} MB/s, '
+                    f'{throughput[reader][0]:10.1f} structures/s'
+                )
+
+            print(f'{"":>8} speedup {throughput["fast"][1] / throughput["ase"][1]:.2f}')
+
+
+# %%
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import pickle
+
+import numpy as np
+import pytest
+import torch
+
+from equitrain.data import AtomicNumberTable
+from equitrain.data.utility import atomic_numbers_to_indices, compute_one_hot
+
+
+def test_atomic_number_table():
+    table = AtomicNumberTable([8, 1, 26, 6])
+
+    zs = np.array([1, 6, 26, 8, 8, 1])
+    indices_ref = np.array([table.z_to_index(z) for z in zs])
+
+    assert table.lookup[1] == 1 and table.lookup[2] == -1
+
+    # NumPy arrays and torch tensors give identical results
+    indices = table.to_indices(zs)
+    assert isinstance(indices, np.ndarray)
+    assert np.array_equal(indices, indices_ref)
+
+    indices = table.to_indices(torch.tensor(zs, dtype=torch.int32))
+    assert isinstance(indices, torch.Tensor) and indices.dtype == torch.long
+    assert np.array_equal(indices.numpy(), indices_ref)
+
+    assert np.array_equal(
+        atomic_numbers_to_indices(torch.tensor(zs), table), indices_ref
+    )
+
+    one_hot = table.to_one_hot(zs)
+    assert one_hot.shape == (len(zs), len(table))
+    assert one_hot.dtype == torch.get_default_dtype()
+    assert torch.equal(one_hot, table.to_one_hot(torch.tensor(zs)))
+    assert np.array_equal(one_hot.argmax(dim=-1).numpy(), indices_ref)
+    assert torch.equal(one_hot, compute_one_hot(torch.tensor(zs), [8, 1, 26, 6]))
+
+    # Multi-dimensional inputs
+    assert table.to_indices(zs.reshape(2, 3)).shape == (2, 3)
+
+    # Unknown elements raise the error of z_to_index
+    for unknown in [2, 27, 200, -1]:
+        with pytest.raises(ValueError, match=f'Observed atom type {unknown}'):
+            table.to_indices(np.array([1, unknown]))
+        with pytest.raises(ValueError, match=f'Observed atom type {unknown}'):
+            table.to_indices(torch.tensor([1, unknown]))
+
+    # The lookup follows modifications of the table
+    table.append(2)
+    assert table.to_indices(np.array([2])) == 4
+    assert table.to_one_hot(torch.tensor([2])).shape == (1, 5)
+
+    # Cached lookups are not pickled
+    table_copy = pickle.loads(pickle.dumps(table))
+    assert table_copy == table
+    assert table_copy.__dict__ == {}
+    assert np.array_equal(table_copy.to_indices(zs), indices_ref)
+
+
+if __name__ == '__main__':
+    test_atomic_number_table()
@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+import torch
+
+from equitrain import get_args_parser_train
+from equitrain.argparser import ArgumentError
+from equitrain.data import Statistics
+from equitrain.data.cache import EVICTIONS, HITS, MISSES, GraphCache, graph_nbytes
+from equitrain.data.format_hdf5.dataset import HDF5GraphDataset
+from equitrain.data.loaders import get_dataloader
+from equitrain.data.samplers import BudgetBatchSampler, ShardedBatchSampler
+
+
+def _load_dataset():
+    statistics = Statistics.load('data/statistics.json')
+    return HDF5GraphDataset(
+        'data/train.h5', statistics.r_max, statistics.atomic_numbers
+    )
+
+
+def test_graph_cache():
+    dataset = _load_dataset()
+
+    max_bytes = 4 * graph_nbytes(dataset[0])
+    cache = GraphCache(dataset, max_bytes)
+
+    # Cached graphs are the same as graphs read from the dataset
+    for index in range(len(dataset)):
+        graph, graph_ref = cache[index], dataset[index]
+        for key in graph_ref.keys():
+            if torch.is_tensor(graph_ref[key]):
+                assert torch.equal(graph[key], graph_ref[key])
+
+    assert cache.nbytes <= max_bytes
+    assert int(cache.counters[0, MISSES]) == len(dataset)
+    assert int(cache.counters[0, EVICTIONS]) == len(dataset) - len(cache.graphs)
+
+    # Recently used graphs are kept
+    cached = list(cache.graphs)
+    assert cached == list(range(len(dataset) - len(cached), len(dataset)))
+
+    cache.__getitems__(cached[:1])
+    assert int(cache.counters[0, HITS]) == 1
+    assert list(cache.graphs)[-1] == cached[0]
+
+    # Graphs exceeding the budget are not cached
+    cache = GraphCache(dataset, 1)
+    cache[0]
+    cache[0]
+    assert len(cache.graphs) == 0
+    assert int(cache.counters[0, MISSES]) == 2
+
+
+def test_graph_cache_shards():
+    dataset = _load_dataset()
+
+    cache = GraphCache(dataset, 2**30, num_workers=2, process_index=1, num_processes=2)
+
+    # Without workers, the cache behaves as worker 0 of process 1, i.e. shard 2
+    cache.__getitems__(list(range(len(dataset))))
+    assert sorted(cache.graphs) == list(range(2, len(dataset), 4))
+
+
+def test_sharded_batch_sampler():
+    num_samples, batch_size = 103, 4
+
+    for num_workers, num_processes in [(0, 1), (2, 1), (3, 2)]:
+        sampler = ShardedBatchSampler(
+            num_samples,
+            batch_size,
+            num_workers=num_workers,
+            num_processes=num_processes,
+            seed=1,
+        )
+        num_workers = max(num_workers, 1)
+        num_shards = num_workers * num_processes
+
+        for epoch in range(2):
+            sampler.set_epoch(epoch)
+            batches = list(sampler)
+
+            indices = np.sort(np.concatenate(batches))
+            assert np.array_equal(indices, np.arange(num_samples))
+
+            # Batches are routed to the worker that owns the shard
+            for k, batch in enumerate(batches[: len(batches) - num_shards]):
+                process = k % num_processes
+                worker = (k // num_processes) % num_workers
+                shard = process * num_workers + worker
+                assert all(index % num_shards == shard for index in batch)
+
+
+def test_sharded_budget_sampler():
+    rng = np.random.default_rng(0)
+    num_nodes = rng.integers(1, 20, size=101)
+    max_nodes = 40
+
+    def batch_sampler_fn(indices, seed):
+        return BudgetBatchSampler(num_nodes[indices], max_nodes=max_nodes, seed=seed)
+
+    for num_workers, num_processes in [(0, 1), (2, 1), (3, 2)]:
+        sampler = ShardedBatchSampler(
+            len(num_nodes),
+            num_workers=num_workers,
+            num_processes=num_processes,
+            seed=1,
+            batch_sampler_fn=batch_sampler_fn,
+        )
+        num_workers = max(num_workers, 1)
+        num_shards = num_workers * num_processes
+
+        batches = list(sampler)
+
+        indices = np.sort(np.concatenate(batches))
+        assert np.array_equal(indices, np.arange(len(num_nodes)))
+        assert all(num_nodes[batch].sum() <= max_nodes for batch in batches)
+
+        # Shards have the same number of batches, all of which are routed to
+        # the worker that owns the shard
+        assert len(batches) % num_shards == 0
+        for k, batch in enumerate(batches):
+            process = k % num_processes
+            worker = (k // num_processes) % num_workers
+            shard = process * num_workers + worker
+            assert all(index % num_shards == shard for index in batch)
+
+
+def test_graph_cache_loader():
+    statistics = Statistics.load('data/statistics.json')
+
+    for sampler in ['random', 'budget', 'bucketed']:
+        args = get_args_parser_train().parse_args()
+        args.batch_size = 4
+        args.workers = 2
+        args.graph_cache_size = 2**30
+        args.sampler = sampler
+        args.batch_max_nodes = 200
+
+        data_loader = get_dataloader(
+            args, 'data/train.h5', statistics.atomic_numbers, statistics.r_max
+        )
+        cache = data_loader.dataset
+        assert isinstance(cache, GraphCache)
+
+        for epoch in range(2):
+            data_loader.batch_sampler.set_epoch(epoch)
+
+            indices = []
+            for data_list in data_loader:
+                for data in data_list:
+                    indices.extend(data.idx.tolist())
+
+            assert sorted(indices) == list(range(len(cache)))
+
+        # Each worker reads its shard once, all further requests are hits
+        counters = cache.counters.sum(dim=0)
+        assert int(counters[MISSES]) == len(cache), sampler
+        assert int(counters[HITS]) == len(cache), sampler
+
+    # Structures drawn by priority cannot be sent to the worker caching them
+    args.sampler = 'random'
+    with pytest.raises(ArgumentError):
+        get_dataloader(
+            args,
+            'data/train.h5',
+            statistics.atomic_numbers,
+            statistics.r_max,
+            weighted_sampler=True,
+        )
+
+
+if __name__ == '__main__':
+    test_graph_cache()
+    test_graph_cache_shards()
+    test_sharded_batch_sampler()
+    test_sharded_budget_sampler()
+    test_graph_cache_loader()
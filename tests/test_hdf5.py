@@ -0,0 +1,265 @@
+import pickle
+import time
+
+import h5py
+import numpy as np
+import torch
+from torch_geometric.data import Batch
+
+from equitrain import get_args_parser_migrate, get_args_parser_train, migrate
+from equitrain.data import Statistics
+from equitrain.data.format_hdf5 import HDF5Dataset, HDF5GraphDataset
+from equitrain.data.loaders import get_dataloader
+
+
+def test_hdf5_migrate():
+    args = get_args_parser_migrate().parse_args()
+
+    args.input_file = 'data/train.h5'
+    args.output_file = 'test_hdf5_migrate.h5'
+    args.format_version = 2
+
+    migrate(args)
+
+    with (
+        HDF5Dataset('data/train.h5') as dataset_v1,
+        HDF5Dataset('test_hdf5_migrate.h5') as dataset_v2,
+    ):
+        assert dataset_v1.format_version == 1
+        assert dataset_v2.format_version == 2
+        assert len(dataset_v1) == len(dataset_v2)
+
+        for i in range(len(dataset_v1)):
+            record_v1 = dataset_v1.read_record(i)
+            record_v2 = dataset_v2.read_record(i)
+
+            for key, value in record_v1.items():
+                assert np.array_equal(value, record_v2[key]), key
+
+            atoms_v1 = dataset_v1[i]
+            atoms_v2 = dataset_v2[i]
+
+            assert np.array_equal(atoms_v1.positions, atoms_v2.positions)
+            assert np.array_equal(atoms_v1.get_forces(), atoms_v2.get_forces())
+
+
+def test_hdf5_compression():
+    args = get_args_parser_migrate().parse_args()
+
+    args.input_file = 'data/train.h5'
+    args.output_file = 'test_hdf5_compression.h5'
+    args.hdf5_chunk_size = 16
+    args.hdf5_compression = 'gzip'
+    args.hdf5_compression_level = 4
+    args.hdf5_shuffle = True
+
+    migrate(args)
+
+    with (
+        HDF5Dataset('data/train.h5') as dataset_ref,
+        HDF5Dataset('test_hdf5_compression.h5') as dataset,
+    ):
+        assert dataset.file['positions'].chunks == (16, 3)
+        assert dataset.file['positions'].compression == 'gzip'
+        assert dataset.file['positions'].shuffle
+
+        for i in range(len(dataset_ref)):
+            record_ref = dataset_ref.read_record(i)
+            record = dataset.read_record(i)
+
+            for key, value in record_ref.items():
+                assert np.array_equal(value, record[key]), key
+
+
+def test_hdf5_extend():
+    with HDF5Dataset('data/train.h5') as dataset:
+        atoms_list = [dataset[i] for i in range(len(dataset))]
+
+    for format_version in (1, 2):
+        with HDF5Dataset(
+            'test_hdf5_extend.h5', 'w', format_version=format_version
+        ) as dataset:
+            dataset[0] = atoms_list[0]
+
+            assert dataset.extend(atoms_list[1:], buffer_size=10) == len(atoms_list) - 1
+
+        with HDF5Dataset('test_hdf5_extend.h5') as dataset:
+            assert len(dataset) == len(atoms_list)
+
+            for atoms, atoms_ref in zip(dataset, atoms_list):
+                assert np.array_equal(atoms.numbers, atoms_ref.numbers)
+                assert np.array_equal(atoms.positions, atoms_ref.positions)
+                assert np.array_equal(atoms.get_forces(), atoms_ref.get_forces())
+
+
+def _assert_graphs_equal(graph, graph_ref):
+    assert graph.keys() == graph_ref.keys()
+
+    for key in graph_ref.keys():
+        if torch.is_tensor(graph_ref[key]):
+            assert graph[key].dtype == graph_ref[key].dtype, key
+            assert torch.equal(graph[key], graph_ref[key]), key
+        else:
+            assert graph[key] == graph_ref[key], key
+
+
+def test_hdf5_getitems():
+    statistics = Statistics.load('data/statistics.json')
+
+    with HDF5GraphDataset(
+        'data/train.h5', r_max=4.5, atomic_numbers=statistics.atomic_numbers
+    ) as dataset:
+        indices = [7, 3, 3, 62, 0, 1, 2]
+
+        for index, graph in zip(indices, dataset.__getitems__(indices)):
+            _assert_graphs_equal(graph, dataset[index])
+
+        # Negative indices do not modify the array of the caller
+        indices = np.array([-1, 0])
+        records = dataset.read_records(indices)
+
+        assert indices.tolist() == [-1, 0]
+        assert np.array_equal(
+            records[0]['positions'], dataset.read_record(62)['positions']
+        )
+
+
+def test_hdf5_convert_record():
+    statistics = Statistics.load('data/statistics.json')
+
+    dtype = torch.get_default_dtype()
+
+    for default_dtype in [torch.float32, torch.float64]:
+        torch.set_default_dtype(default_dtype)
+
+        try:
+            with HDF5GraphDataset(
+                'data/train.h5', r_max=4.5, atomic_numbers=statistics.atomic_numbers
+            ) as dataset:
+                for index in [0, 5, 62, -1]:
+                    # Reference graph from an ase.Atoms object
+                    atoms = HDF5Dataset.__getitem__(dataset, index)
+                    graph_ref = dataset.converter.convert(atoms)
+                    graph_ref.idx = index
+
+                    _assert_graphs_equal(dataset[index], graph_ref)
+
+                # Tensors share memory with the record if data types agree
+                record = dataset.read_record(5)
+                graph = dataset.converter.convert_record(record)
+
+                assert graph.pos.data_ptr() == graph.positions.data_ptr()
+
+                if default_dtype == torch.float64:
+                    assert graph.pos.data_ptr() == record['positions'].ctypes.data
+                    assert graph.force.data_ptr() == record['forces'].ctypes.data
+        finally:
+            torch.set_default_dtype(dtype)
+
+
+def test_hdf5_compact_graphs():
+    statistics = Statistics.load('data/statistics.json')
+
+    indices = [4, 8, 15, 16, 23, 42]
+
+    with (
+        HDF5GraphDataset(
+            'data/train.h5', r_max=4.5, atomic_numbers=statistics.atomic_numbers
+        ) as dataset_ref,
+        HDF5GraphDataset(
+            'data/train.h5',
+            r_max=4.5,
+            atomic_numbers=statistics.atomic_numbers,
+            compact=True,
+        ) as dataset,
+    ):
+        batch_ref = Batch.from_data_list(dataset_ref.__getitems__(indices))
+        batch = Batch.from_data_list(dataset.__getitems__(indices))
+
+        def nbytes(batch):
+            return sum(
+                value.nbytes
+                for value in batch.to_dict().values()
+                if torch.is_tensor(value)
+            )
+
+        assert 'node_attrs' not in batch.keys()
+        assert nbytes(batch) < nbytes(batch_ref)
+
+        # Batches are sent from workers to the main process
+        batch = pickle.loads(pickle.dumps(batch))
+
+        # Derived attributes are materialized on access
+        assert 'node_attrs' in batch
+        assert batch.positions is batch.pos
+
+        for key in batch_ref.keys():
+            if torch.is_tensor(batch_ref[key]):
+                assert batch[key].dtype == batch_ref[key].dtype, key
+                assert torch.equal(batch[key], batch_ref[key]), key
+            else:
+                assert batch[key] == batch_ref[key], key
+
+
+def test_hdf5_start_methods():
+    args = get_args_parser_migrate().parse_args()
+    args.input_file = 'data/train.h5'
+    args.output_file = 'test_hdf5_start_methods.h5'
+    args.hdf5_page_size = 4096
+
+    migrate(args)
+
+    statistics = Statistics.load('data/statistics.json')
+
+    dataset = HDF5GraphDataset(
+        'test_hdf5_start_methods.h5',
+        statistics.r_max,
+        statistics.atomic_numbers,
+        rdcc_nbytes=1 << 22,
+        page_buf_size=1 << 16,
+    )
+    assert dataset.file.id.get_create_plist().get_file_space_strategy()[0] == (
+        h5py.h5f.FSPACE_STRATEGY_PAGE
+    )
+
+    # Unpickled datasets reopen the file with the same options
+    dataset_copy = pickle.loads(pickle.dumps(dataset))
+    assert dataset_copy.driver_options == dataset.driver_options
+    _assert_graphs_equal(dataset_copy[3], dataset[3])
+
+    for start_method in ['fork', 'spawn']:
+        args = get_args_parser_train().parse_args()
+        args.batch_size = 4
+        args.workers = 2
+        args.pin_memory = False
+        args.hdf5_cache_size = 1 << 22
+        args.hdf5_page_buffer_size = 1 << 16
+        args.workers_start_method = start_method
+
+        data_loader = get_dataloader(
+            args,
+            'test_hdf5_start_methods.h5',
+            statistics.atomic_numbers,
+            statistics.r_max,
+        )
+
+        indices = []
+        start = time.perf_counter()
+        for data_list in data_loader:
+            for data in data_list:
+                indices.extend(data.idx.tolist())
+        elapsed = time.perf_counter() - start
+
+        assert sorted(indices) == list(range(len(data_loader.dataset)))
+
+        print(f'{start_method}: {len(indices) / elapsed:.1f} structures/s')
+
+
+if __name__ == '__main__':
+    test_hdf5_migrate()
+    test_hdf5_compression()
+    test_hdf5_extend()
+    test_hdf5_getitems()
+    test_hdf5_convert_record()
+    test_hdf5_compact_graphs()
+    test_hdf5_start_methods()
@@ -0,0 +1,82 @@
+import shutil
+
+import numpy as np
+
+from equitrain.data import Statistics
+from equitrain.data.format_hdf5 import (
+    DatasetIndex,
+    HDF5Dataset,
+    HDF5GraphDataset,
+    HDF5NeighborLists,
+    compute_index,
+    compute_neighbor_lists,
+)
+
+
+def test_index():
+    r_max = 4.5
+    statistics = Statistics.load('data/statistics.json')
+
+    shutil.copy('data/train.h5', 'test_index.h5')
+
+    with HDF5Dataset('test_index.h5', 'a') as dataset:
+        assert dataset.index is None
+
+        index = compute_index(dataset, r_max, batch_size=10)
+
+        assert len(index) == len(dataset)
+        assert index.has_edges(r_max)
+        assert not index.has_edges(5.0)
+
+    with (
+        HDF5GraphDataset(
+            'test_index.h5', r_max=r_max, atomic_numbers=statistics.atomic_numbers
+        ) as dataset,
+    ):
+        index = dataset.index
+        atomic_numbers_all = set()
+
+        for i in range(len(dataset)):
+            graph = dataset[i]
+            atomic_numbers = set(graph.atomic_numbers.tolist())
+            atomic_numbers_all |= atomic_numbers
+
+            assert index.num_atoms[i] == graph.num_nodes
+            assert index.num_edges[i] == graph.num_edges
+            assert np.isclose(index.energy[i], graph.y.item())
+            assert index.contains_only(list(atomic_numbers))[i]
+            assert not index.contains_any([1, 2])[i]
+
+        assert index.atomic_numbers() == sorted(atomic_numbers_all)
+
+        # Structures containing oxygen
+        mask = index.contains_any([8])
+        assert mask.sum() > 0
+        assert all(
+            8 in dataset.read_record(i)['atomic_numbers'] for i in np.where(mask)[0]
+        )
+
+    # Edge counts from stored neighbor lists must match computed ones
+    with HDF5Dataset('test_index.h5', 'a') as dataset:
+        num_edges = dataset.index.num_edges
+
+        compute_neighbor_lists(dataset, r_max)
+        index = compute_index(dataset, r_max)
+
+        assert np.array_equal(index.num_edges, num_edges)
+
+    # Edges of structures not covered by stored neighbor lists are computed
+    with HDF5Dataset('test_index.h5', 'a') as dataset:
+        elements = dataset.index.elements
+
+        neighbors = HDF5NeighborLists.open(dataset.file, r_max).read(np.arange(20))
+        HDF5NeighborLists.create(dataset.file, r_max).append(neighbors)
+
+        index = DatasetIndex.from_dataset(dataset, r_max, batch_size=16, start=5)
+
+        assert np.array_equal(index.num_edges, num_edges[5:])
+        assert np.array_equal(index.elements, elements[5:])
+
+
+if __name__ == '__main__':
+    test_index()
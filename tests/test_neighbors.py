@@ -0,0 +1,236 @@
+import shutil
+
+import numpy as np
+import pytest
+import torch
+from torch_geometric.data import Batch
+
+from equitrain.data import Statistics
+from equitrain.data.format_hdf5 import (
+    HDF5Dataset,
+    HDF5GraphDataset,
+    compute_neighbor_lists,
+)
+from equitrain.data.graphs import (
+    CellListNeighborList,
+    RadiusGraph,
+    VerletNeighborList,
+    get_neighbor_list_engine,
+)
+from equitrain.data.graphs.neighborhood import get_neighborhood
+
+
+def assert_graphs_equal(graph, graph_ref):
+    assert graph.keys() == graph_ref.keys()
+
+    for key in graph_ref.keys():
+        if torch.is_tensor(graph_ref[key]):
+            assert graph[key].dtype == graph_ref[key].dtype, key
+            assert torch.equal(graph[key], graph_ref[key]), key
+        else:
+            assert graph[key] == graph_ref[key], key
+
+
+def test_neighbors_stored():
+    r_max = 4.5
+    statistics = Statistics.load('data/statistics.json')
+
+    shutil.copy('data/train.h5', 'test_neighbors_stored.h5')
+
+    with HDF5Dataset('test_neighbors_stored.h5', 'a') as dataset:
+        compute_neighbor_lists(dataset, r_max, batch_size=10)
+
+    with (
+        HDF5GraphDataset(
+            'data/train.h5', r_max=r_max, atomic_numbers=statistics.atomic_numbers
+        ) as dataset_ref,
+        HDF5GraphDataset(
+            'test_neighbors_stored.h5',
+            r_max=r_max,
+            atomic_numbers=statistics.atomic_numbers,
+        ) as dataset,
+    ):
+        assert dataset_ref.neighbor_lists is None
+        assert dataset.neighbor_lists is not None
+
+        for i in range(len(dataset_ref)):
+            assert_graphs_equal(dataset[i], dataset_ref[i])
+
+        indices = [5, 1, 1, 62]
+        for graph, index in zip(dataset.__getitems__(indices), indices):
+            assert_graphs_equal(graph, dataset_ref[index])
+
+    # Neighbor lists must not be used for a different cutoff radius
+    with HDF5GraphDataset(
+        'test_neighbors_stored.h5', r_max=5.0, atomic_numbers=statistics.atomic_numbers
+    ) as dataset:
+        assert dataset.neighbor_lists is None
+
+
+def sorted_edges(edge_index, unit_shifts):
+    return sorted(zip(*edge_index.tolist(), *unit_shifts.astype(int).T.tolist()))
+
+
+def assert_neighborhoods_equal(positions, cutoff, pbc, cell):
+    def neighborhood(engine):
+        return get_neighborhood(
+            positions,
+            cutoff,
+            pbc,
+            None if cell is None else cell.copy(),
+            engine=engine,
+        )
+
+    edge_index_ref, shifts_ref, unit_shifts_ref, cell_ref = neighborhood('matscipy')
+
+    for engine in ['cell-list', 'brute-force', CellListNeighborList(max_pairs=100)]:
+        edge_index, shifts, unit_shifts, cell_engine = neighborhood(engine)
+
+        assert sorted_edges(edge_index, unit_shifts) == sorted_edges(
+            edge_index_ref, unit_shifts_ref
+        )
+        assert np.array_equal(cell_engine, cell_ref)
+        assert np.allclose(shifts, unit_shifts @ cell_ref)
+
+    return edge_index_ref.shape[1]
+
+
+def test_neighbor_list_engines():
+    rng = np.random.default_rng(0)
+
+    num_edges = 0
+    for _ in range(20):
+        num_atoms = rng.integers(1, 40)
+        cutoff = rng.uniform(1.0, 6.0)
+        # Triclinic cells with atoms inside and outside of the cell
+        cell = np.diag(rng.uniform(2.0, 8.0, 3)) + rng.uniform(-1.5, 1.5, (3, 3))
+        positions = rng.uniform(-0.5, 1.5, (num_atoms, 3)) @ cell
+
+        # Periodic
+        num_edges += assert_neighborhoods_equal(
+            positions, cutoff, (True, True, True), cell
+        )
+        # Mixed periodic boundary conditions
+        pbc = tuple(bool(p) for p in rng.integers(0, 2, 3))
+        num_edges += assert_neighborhoods_equal(positions, cutoff, pbc, cell)
+        # Molecules
+        num_edges += assert_neighborhoods_equal(positions, cutoff, None, None)
+
+    assert num_edges > 0
+
+    with pytest.raises(ValueError, match='Unknown neighbor list engine'):
+        get_neighbor_list_engine('unknown')
+
+
+def test_neighbor_list_engine_dataset():
+    r_max = 4.5
+    statistics = Statistics.load('data/statistics.json')
+
+    with (
+        HDF5GraphDataset(
+            'data/train.h5', r_max=r_max, atomic_numbers=statistics.atomic_numbers
+        ) as dataset_ref,
+        HDF5GraphDataset(
+            'data/train.h5',
+            r_max=r_max,
+            atomic_numbers=statistics.atomic_numbers,
+            neighbor_list_engine='cell-list',
+        ) as dataset,
+    ):
+        for i in range(len(dataset_ref)):
+            graph, graph_ref = dataset[i], dataset_ref[i]
+
+            assert sorted_edges(
+                graph.edge_index.numpy(), graph.unit_shifts.numpy()
+            ) == sorted_edges(
+                graph_ref.edge_index.numpy(), graph_ref.unit_shifts.numpy()
+            )
+            assert torch.equal(graph.cell, graph_ref.cell)
+
+
+def edge_shifts(batch):
+    edges = zip(
+        *batch.edge_index.tolist(), *batch.unit_shifts.long().T.tolist(), strict=True
+    )
+    return dict(zip(edges, batch.shifts, strict=True))
+
+
+def test_radius_graph():
+    r_max = 4.5
+    statistics = Statistics.load('data/statistics.json')
+
+    with (
+        HDF5GraphDataset(
+            'data/train.h5', r_max=r_max, atomic_numbers=statistics.atomic_numbers
+        ) as dataset_ref,
+        HDF5GraphDataset(
+            'data/train.h5',
+            r_max=r_max,
+            atomic_numbers=statistics.atomic_numbers,
+            r_edges=False,
+        ) as dataset,
+    ):
+        assert 'edge_index' not in dataset[0]
+
+        radius_graph = RadiusGraph(r_max)
+
+        for indices in [[0], [3, 1, 4, 1, 5], list(range(len(dataset_ref)))]:
+            batch_ref = Batch.from_data_list(dataset_ref.__getitems__(indices))
+            batch = radius_graph(Batch.from_data_list(dataset.__getitems__(indices)))
+
+            assert set(batch.keys()) == set(batch_ref.keys())
+            # Shifts are compared by edge, which might be ordered differently
+            shifts, shifts_ref = edge_shifts(batch), edge_shifts(batch_ref)
+            assert sorted(shifts) == sorted(shifts_ref)
+            for edge, shift in shifts_ref.items():
+                assert torch.allclose(shifts[edge], shift, atol=1e-5)
+
+            for key in ['cell', 'cell_volume', 'positions', 'node_attrs', 'pbc']:
+                assert torch.equal(batch[key], batch_ref[key]), key
+
+            # Batches with edges are left untouched
+            assert radius_graph(batch_ref) is batch_ref
+
+
+def test_verlet_neighbor_list():
+    rng = np.random.default_rng(0)
+
+    cutoff = 3.0
+    cell = 8.0 * np.identity(3) + rng.uniform(-1.0, 1.0, (3, 3))
+
+    for pbc in [(True, True, True), (True, False, True), None]:
+        positions = rng.uniform(0.0, 1.0, (40, 3)) @ cell
+        engine = VerletNeighborList(skin=0.5)
+
+        # Small steps of a random walk reuse the candidate pairs
+        for _ in range(20):
+            positions = positions + rng.normal(0.0, 0.02, positions.shape)
+
+            edge_index, _, unit_shifts, _ = get_neighborhood(
+                positions, cutoff, pbc, cell.copy(), engine=engine
+            )
+            edge_index_ref, _, unit_shifts_ref, _ = get_neighborhood(
+                positions, cutoff, pbc, cell.copy()
+            )
+            assert sorted_edges(edge_index, unit_shifts) == sorted_edges(
+                edge_index_ref, unit_shifts_ref
+            )
+
+        assert 1 < engine.num_builds < 20
+
+        # Large displacements and changes of the cell require a rebuild
+        num_builds = engine.num_builds
+        positions[0] += 0.3
+        get_neighborhood(positions, cutoff, pbc, cell.copy(), engine=engine)
+        assert engine.num_builds == num_builds + 1
+
+        get_neighborhood(positions, cutoff, pbc, 1.01 * cell, engine=engine)
+        assert engine.num_builds == num_builds + (2 if pbc else 1)
+
+
+if __name__ == '__main__':
+    test_neighbors_stored()
+    test_neighbor_list_engines()
+    test_neighbor_list_engine_dataset()
+    test_radius_graph()
+    test_verlet_neighbor_list()
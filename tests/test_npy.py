@@ -0,0 +1,141 @@
+import pickle
+import shutil
+
+import numpy as np
+import torch
+
+from equitrain import get_args_parser_migrate, get_args_parser_train, migrate
+from equitrain.data import Statistics
+from equitrain.data.format_hdf5 import DatasetIndex, HDF5Dataset, HDF5GraphDataset
+from equitrain.data.format_npy import NumpyDataset, NumpyGraphDataset, convert_to_npy
+from equitrain.data.loaders import get_dataloader
+
+
+def assert_graphs_equal(graph, graph_ref):
+    assert set(graph.keys()) == set(graph_ref.keys())
+    for key in graph_ref.keys():
+        if torch.is_tensor(graph_ref[key]):
+            assert torch.equal(graph[key], graph_ref[key]), key
+        else:
+            assert graph[key] == graph_ref[key], key
+
+
+def test_npy_migrate():
+    shutil.rmtree('test_npy_migrate', ignore_errors=True)
+
+    args = get_args_parser_migrate().parse_args()
+    args.input_file = 'data/train.h5'
+    args.output_file = 'test_npy_migrate'
+    args.output_format = 'npy'
+    args.npy_shard_size = 7
+
+    migrate(args)
+
+    with (
+        HDF5Dataset('data/train.h5') as dataset_ref,
+        NumpyDataset('test_npy_migrate') as dataset,
+    ):
+        assert len(dataset) == len(dataset_ref)
+        assert len(dataset.shards) == -(-len(dataset_ref) // 7)
+        assert dataset.r_max is None
+
+        for i in range(len(dataset_ref)):
+            record_ref = dataset_ref.read_record(i)
+            record = dataset.read_record(i)
+
+            for key, value in record_ref.items():
+                assert np.array_equal(value, record[key]), key
+
+            assert np.array_equal(dataset[i].positions, dataset_ref[i].positions)
+
+        index_ref = DatasetIndex.from_dataset(dataset_ref)
+        for name in ['num_atoms', 'elements', 'energy']:
+            assert np.array_equal(
+                getattr(dataset.index, name), getattr(index_ref, name)
+            ), name
+
+
+def test_npy_graph_dataset():
+    shutil.rmtree('test_npy_neighbors', ignore_errors=True)
+
+    statistics = Statistics.load('data/statistics.json')
+
+    with HDF5Dataset('data/train.h5') as dataset:
+        convert_to_npy(dataset, 'test_npy_neighbors', r_max=statistics.r_max)
+
+    dataset_ref = HDF5GraphDataset(
+        'data/train.h5', statistics.r_max, statistics.atomic_numbers
+    )
+    dataset = NumpyGraphDataset(
+        'test_npy_neighbors', statistics.r_max, statistics.atomic_numbers
+    )
+    assert dataset.use_neighbors
+
+    # Graphs are the same for stored and computed neighbor lists
+    for i in range(len(dataset_ref)):
+        assert_graphs_equal(dataset[i], dataset_ref[i])
+
+    dataset = NumpyGraphDataset(
+        'test_npy_neighbors', statistics.r_max + 0.5, statistics.atomic_numbers
+    )
+    assert not dataset.use_neighbors
+    assert dataset[0].num_edges > dataset_ref[0].num_edges
+
+    # Pickled datasets map the same files instead of copying arrays
+    dataset_copy = pickle.loads(pickle.dumps(dataset))
+    assert len(pickle.dumps(dataset)) < 4096
+    assert_graphs_equal(dataset_copy[3], dataset[3])
+
+
+def test_npy_loader():
+    shutil.rmtree('test_npy_migrate', ignore_errors=True)
+
+    args = get_args_parser_migrate().parse_args()
+    args.input_file = 'data/train.h5'
+    args.output_file = 'test_npy_migrate'
+    args.output_format = 'npy'
+
+    migrate(args)
+
+    args = get_args_parser_train().parse_args()
+    args.batch_size = 4
+    args.workers = 2
+
+    statistics = Statistics.load('data/statistics.json')
+
+    data_loader = get_dataloader(
+        args, 'test_npy_migrate', statistics.atomic_numbers, statistics.r_max
+    )
+    assert isinstance(data_loader.dataset, NumpyGraphDataset)
+
+    indices = []
+    for data_list in data_loader:
+        for data in data_list:
+            indices.extend(data.idx.tolist())
+
+    assert sorted(indices) == list(range(len(data_loader.dataset)))
+
+    # Edge counts of the edge budget are computed without stored neighbor lists
+    args.sampler = 'budget'
+    args.batch_max_edges = 2000
+
+    data_loader = get_dataloader(
+        args, 'test_npy_migrate', statistics.atomic_numbers, statistics.r_max
+    )
+    assert not data_loader.dataset.index.has_edges(statistics.r_max)
+
+    with HDF5Dataset('data/train.h5') as dataset_ref:
+        num_edges = DatasetIndex.from_dataset(dataset_ref, statistics.r_max).num_edges
+
+    batches = list(data_loader.batch_sampler)
+    assert sorted(np.concatenate(batches)) == list(range(len(data_loader.dataset)))
+    assert all(
+        len(batch) == 1 or num_edges[batch].sum() <= args.batch_max_edges
+        for batch in batches
+    )
+
+
+if __name__ == '__main__':
+    test_npy_migrate()
+    test_npy_graph_dataset()
+    test_npy_loader()
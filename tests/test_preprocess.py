@@ -1,4 +1,19 @@
+import shutil
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from ase.data import atomic_numbers
+
 from equitrain import get_args_parser_preprocess, preprocess
+from equitrain.data import Statistics, StatisticsAccumulator
+from equitrain.data.format_hdf5 import (
+    DatasetIndex,
+    HDF5Dataset,
+    HDF5NeighborLists,
+    HDF5Sources,
+)
+from equitrain.data.graphs.neighborhood import get_neighborhood
 
 
 def test_preprocess():
@@ -15,5 +30,283 @@ def test_preprocess():
     preprocess(args)
 
 
+def _isolated_atom(symbol, energy):
+    return (
+        '1\n'
+        'Lattice="10.0 0.0 0.0 0.0 10.0 0.0 0.0 0.0 10.0" '
+        'Properties=species:S:1:pos:R:3 config_type=IsolatedAtom '
+        f'energy_corrected={energy} pbc="F F F"\n'
+        f'{symbol} 0.0 0.0 0.0\n'
+    )
+
+
+def test_preprocess_workers():
+    text = Path('data.xyz').read_text()
+    symbols = sorted(
+        {line.split()[0] for line in text.splitlines() if len(line.split()) == 7}
+    )
+
+    # Isolated atoms are spread over the file, the last energy of an element is used
+    Path('test_preprocess').mkdir(exist_ok=True)
+    Path('test_preprocess/workers.xyz').write_text(
+        ''.join(_isolated_atom(symbol, -1.0) for symbol in symbols)
+        + text
+        + _isolated_atom('Mg', -2.0)
+    )
+
+    statistics = {}
+    for workers in [1, 3]:
+        # Existing output files would be skipped
+        shutil.rmtree(f'test_preprocess/workers-{workers}', ignore_errors=True)
+
+        args = get_args_parser_preprocess().parse_args()
+        args.train_file = 'test_preprocess/workers.xyz'
+        args.output_dir = f'test_preprocess/workers-{workers}/'
+        args.energy_key = 'energy_corrected'
+        args.compute_statistics = True
+        args.r_max = 4.5
+        args.preprocess_workers = workers
+
+        preprocess(args)
+
+        statistics[workers] = Statistics.load(
+            f'test_preprocess/workers-{workers}/statistics.json'
+        )
+
+    assert statistics[3].atomic_numbers == statistics[1].atomic_numbers
+    assert statistics[3].atomic_energies == statistics[1].atomic_energies
+    assert statistics[3].atomic_energies[atomic_numbers['Mg']] == -2.0
+    assert statistics[3].atomic_energies[atomic_numbers['O']] == -1.0
+
+    # Structures are written in the order of the input file
+    with (
+        HDF5Dataset('test_preprocess/workers-1/train.h5') as dataset_ref,
+        HDF5Dataset('test_preprocess/workers-3/train.h5') as dataset,
+    ):
+        assert len(dataset) == len(dataset_ref) == text.count('config_type=')
+
+        for i in range(len(dataset_ref)):
+            record_ref = dataset_ref.read_record(i)
+            record = dataset.read_record(i)
+
+            for key, value in record_ref.items():
+                assert np.array_equal(value, record[key]), key
+
+
+def test_preprocess_neighbors_once():
+    # Existing output files would be skipped
+    shutil.rmtree('test_preprocess/neighbors', ignore_errors=True)
+
+    args = get_args_parser_preprocess().parse_args()
+
+    args.train_file = 'data.xyz'
+    args.output_dir = 'test_preprocess/neighbors'
+    args.compute_statistics = True
+    args.compute_neighbors = True
+    args.r_max = 4.5
+
+    # Neighbors are searched once per structure while it is written, and used
+    # for statistics, neighbor lists and the dataset index
+    with (
+        mock.patch(
+            'equitrain.data.format_xyz.reader.get_neighborhood',
+            wraps=get_neighborhood,
+        ) as search,
+        mock.patch(
+            'equitrain.data.statistics.get_neighborhood', side_effect=AssertionError
+        ),
+        mock.patch(
+            'equitrain.data.format_hdf5.index.get_neighborhood',
+            side_effect=AssertionError,
+        ),
+        mock.patch(
+            'equitrain.data.format_hdf5.neighbors.get_neighborhood',
+            side_effect=AssertionError,
+        ),
+    ):
+        preprocess(args)
+
+    statistics = Statistics.load('test_preprocess/neighbors/statistics.json')
+
+    with HDF5Dataset('test_preprocess/neighbors/train.h5') as dataset:
+        assert search.call_count == len(dataset) == 63
+
+        neighbor_lists = HDF5NeighborLists.open(dataset.file, 4.5)
+        neighbor_lists.validate(len(dataset))
+        num_edges = np.diff(neighbor_lists.edge_offsets[()])
+
+        assert np.array_equal(DatasetIndex.load(dataset.file).num_edges, num_edges)
+
+        accumulator = StatisticsAccumulator.from_dataset(dataset, r_max=4.5)
+        assert statistics.avg_num_neighbors == accumulator.avg_num_neighbors
+
+    # Without neighbor lists and statistics, no neighbors are searched
+    shutil.rmtree('test_preprocess/neighbors', ignore_errors=True)
+
+    args.valid_file = 'data.xyz'
+    args.compute_neighbors = False
+
+    with mock.patch(
+        'equitrain.data.format_xyz.reader.get_neighborhood', wraps=get_neighborhood
+    ) as search:
+        preprocess(args)
+
+    with (
+        HDF5Dataset('test_preprocess/neighbors/train.h5') as dataset,
+        HDF5Dataset('test_preprocess/neighbors/valid.h5') as dataset_valid,
+    ):
+        assert search.call_count == len(dataset)
+        assert DatasetIndex.load(dataset.file).has_edges(4.5)
+
+        index = DatasetIndex.load(dataset_valid.file)
+        assert len(index) == len(dataset_valid)
+        assert index.num_edges is None
+
+
+def test_preprocess_append():
+    lines = Path('data.xyz').read_text().splitlines(keepends=True)
+    # Split the file after 30 frames
+    split = 0
+    for _ in range(30):
+        split += int(lines[split]) + 2
+
+    # Isolated atoms are only allowed in training files, the energy of the
+    # last source is used
+    Path('test_preprocess').mkdir(exist_ok=True)
+    parts = [''.join(lines[:split]), ''.join(lines[split:])]
+    symbols = sorted({line.split()[0] for line in lines if len(line.split()) == 7})
+    isolated_atoms = [
+        ''.join(_isolated_atom(symbol, -1.0) for symbol in symbols),
+        _isolated_atom('Mg', -2.0),
+    ]
+    for i, part in enumerate(parts):
+        Path(f'test_preprocess/append-{i}.xyz').write_text(part)
+        Path(f'test_preprocess/append-train-{i}.xyz').write_text(
+            isolated_atoms[i] + part
+        )
+    Path('test_preprocess/append.xyz').write_text(''.join(parts))
+    Path('test_preprocess/append-train.xyz').write_text(
+        isolated_atoms[0] + parts[0] + isolated_atoms[1] + parts[1]
+    )
+
+    def run(suffix, output_dir, append):
+        args = get_args_parser_preprocess().parse_args()
+        args.train_file = f'test_preprocess/append-train{suffix}.xyz'
+        args.valid_file = f'test_preprocess/append{suffix}.xyz'
+        args.output_dir = output_dir
+        args.energy_key = 'energy_corrected'
+        args.compute_statistics = True
+        args.compute_neighbors = True
+        args.r_max = 4.5
+        args.append = append
+
+        preprocess(args)
+
+        return Statistics.load(f'{output_dir}/statistics.json')
+
+    # Files are appended to the output of earlier runs otherwise
+    for output_dir in ['test_preprocess/append-ref', 'test_preprocess/append']:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    statistics_ref = run('', 'test_preprocess/append-ref', False)
+
+    run('-0', 'test_preprocess/append', True)
+    # Existing structures are not read again, adding a file twice has no effect
+    with mock.patch.object(
+        StatisticsAccumulator, 'from_dataset', side_effect=AssertionError
+    ):
+        for i in [1, 1, 0]:
+            statistics = run(f'-{i}', 'test_preprocess/append', True)
+
+    assert statistics.atomic_numbers == statistics_ref.atomic_numbers
+    assert statistics.atomic_energies == statistics_ref.atomic_energies
+    assert statistics.atomic_energies[atomic_numbers['Mg']] == -2.0
+    assert np.isclose(statistics.mean, statistics_ref.mean, rtol=1e-10)
+    assert np.isclose(statistics.std, statistics_ref.std, rtol=1e-10)
+    assert statistics.avg_num_neighbors == statistics_ref.avg_num_neighbors
+
+    for split in ['train', 'valid']:
+        with (
+            HDF5Dataset(f'test_preprocess/append-ref/{split}.h5') as dataset_ref,
+            HDF5Dataset(f'test_preprocess/append/{split}.h5') as dataset,
+        ):
+            assert len(dataset) == len(dataset_ref) == 63
+
+            sources = HDF5Sources.load(dataset.file)
+            assert len(sources) == 2
+            assert sources.num_structures == len(dataset)
+
+            for i in range(len(dataset_ref)):
+                record_ref = dataset_ref.read_record(i)
+                record = dataset.read_record(i)
+
+                for key, value in record_ref.items():
+                    assert np.array_equal(value, record[key]), key
+
+            neighbor_lists_ref = HDF5NeighborLists.open(dataset_ref.file, 4.5)
+            neighbor_lists = HDF5NeighborLists.open(dataset.file, 4.5)
+            indices = np.arange(len(dataset))
+            for (edge_index, shifts), (edge_index_ref, shifts_ref) in zip(
+                neighbor_lists.read(indices), neighbor_lists_ref.read(indices)
+            ):
+                assert np.array_equal(edge_index, edge_index_ref)
+                assert np.array_equal(shifts, shifts_ref)
+
+            index_ref = DatasetIndex.load(dataset_ref.file)
+            index = DatasetIndex.load(dataset.file)
+            for name in ['num_atoms', 'elements', 'energy', 'num_edges']:
+                assert np.array_equal(getattr(index, name), getattr(index_ref, name)), (
+                    name
+                )
+
+
+def test_preprocess_append_neighbors():
+    lines = Path('data.xyz').read_text().splitlines(keepends=True)
+    split = 0
+    for _ in range(30):
+        split += int(lines[split]) + 2
+
+    Path('test_preprocess').mkdir(exist_ok=True)
+    Path('test_preprocess/append-neighbors-0.xyz').write_text(''.join(lines[:split]))
+    Path('test_preprocess/append-neighbors-1.xyz').write_text(''.join(lines[split:]))
+
+    # Files are appended to the output of earlier runs otherwise
+    shutil.rmtree('test_preprocess/append-neighbors', ignore_errors=True)
+
+    # Stored neighbor lists are extended without --compute-neighbors
+    for i, compute_neighbors in enumerate([True, False]):
+        args = get_args_parser_preprocess().parse_args()
+        args.train_file = f'test_preprocess/append-neighbors-{i}.xyz'
+        args.output_dir = 'test_preprocess/append-neighbors'
+        args.compute_statistics = True
+        args.compute_neighbors = compute_neighbors
+        args.r_max = 4.5
+        args.append = True
+
+        preprocess(args)
+
+    assert Path('test_preprocess/append-neighbors/statistics.json').exists()
+
+    with HDF5Dataset('test_preprocess/append-neighbors/train.h5') as dataset:
+        assert len(dataset) == 63
+
+        neighbor_lists = HDF5NeighborLists.open(dataset.file, 4.5)
+        neighbor_lists.validate(len(dataset))
+
+        for i, (edge_index, shifts) in enumerate(
+            neighbor_lists.read(np.arange(len(dataset)))
+        ):
+            record = dataset.read_record(i)
+            edge_index_ref, _, shifts_ref, _ = get_neighborhood(
+                record['positions'], 4.5, record['pbc'], record['cell'].copy()
+            )
+            assert np.array_equal(edge_index, edge_index_ref)
+            assert np.array_equal(shifts, shifts_ref)
+
+
 if __name__ == '__main__':
     test_preprocess()
+    test_preprocess_workers()
+    test_preprocess_neighbors_once()
+    test_preprocess_append()
+    test_preprocess_append_neighbors()
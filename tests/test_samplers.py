@@ -0,0 +1,130 @@
+import numpy as np
+
+from equitrain import get_args_parser_train
+from equitrain.data import Statistics
+from equitrain.data.loaders import get_dataloader
+from equitrain.data.samplers import BucketedBatchSampler, BudgetBatchSampler
+
+
+def test_budget_sampler():
+    rng = np.random.default_rng(123)
+
+    num_nodes = rng.integers(1, 200, size=5000)
+    num_edges = num_nodes * rng.integers(10, 40, size=5000)
+    # Add structures exceeding the budget
+    num_nodes[:3] = 600
+
+    sampler = BudgetBatchSampler(
+        num_nodes, num_edges, max_nodes=500, max_edges=10000, window_size=512
+    )
+
+    batches = list(sampler)
+    indices = np.sort(np.concatenate(batches))
+
+    assert np.array_equal(indices, np.arange(len(num_nodes)))
+    assert sum(len(batch) == 1 and batch[0] < 3 for batch in batches) == 3
+
+    for batch in batches:
+        if len(batch) > 1:
+            assert num_nodes[batch].sum() <= 500
+            assert num_edges[batch].sum() <= 10000
+
+    # Batches are well filled
+    assert np.mean([sampler.fill(batch) for batch in batches]) > 0.95
+
+    # Sampling is deterministic for a given seed and epoch
+    sampler_copy = BudgetBatchSampler(
+        num_nodes, num_edges, max_nodes=500, max_edges=10000, window_size=512
+    )
+    assert list(sampler_copy) == batches
+    assert list(sampler_copy) != batches
+
+    sampler_copy.set_epoch(0)
+    assert list(sampler_copy) == batches
+
+    # Oversized structures are dropped if requested
+    sampler = BudgetBatchSampler(num_nodes, max_nodes=500, drop=True)
+    indices = np.concatenate(list(sampler))
+    assert len(indices) == len(num_nodes) - 3
+    assert np.all(indices >= 3)
+
+
+def test_bucketed_sampler():
+    rng = np.random.default_rng(123)
+
+    sizes = rng.integers(1, 300, size=4000)
+
+    sampler = BucketedBatchSampler(sizes, batch_size=32, num_buckets=8, seed=1)
+
+    batches = list(sampler)
+    indices = np.sort(np.concatenate(batches))
+
+    assert np.array_equal(indices, np.arange(len(sizes)))
+    assert sum(len(batch) < 32 for batch in batches) <= 1
+
+    # Batches only contain structures of neighboring buckets
+    for batch in batches:
+        buckets = sampler.buckets[batch]
+        assert buckets.max() - buckets.min() <= 1
+
+    # Size range within batches is much smaller than for random batches
+    spread = np.mean([np.ptp(sizes[batch]) for batch in batches])
+    assert spread < 0.25 * np.ptp(sizes)
+
+    # Deterministic under a seed, different across epochs
+    sampler_copy = BucketedBatchSampler(sizes, batch_size=32, num_buckets=8, seed=1)
+    assert list(sampler_copy) == batches
+    assert list(sampler_copy) != batches
+
+
+def test_budget_sampler_loader():
+    args = get_args_parser_train().parse_args()
+    args.sampler = 'budget'
+    args.batch_max_nodes = 100
+    args.batch_max_edges = 2000
+    args.workers = 0
+
+    statistics = Statistics.load('data/statistics.json')
+
+    data_loader = get_dataloader(
+        args, 'data/train.h5', statistics.atomic_numbers, statistics.r_max
+    )
+
+    num_graphs = 0
+    for data_list in data_loader:
+        # Each step results in a single batch within the budget
+        assert len(data_list) == 1
+        assert data_list[0].num_nodes <= 100 or data_list[0].num_graphs == 1
+        assert data_list[0].num_edges <= 2000 or data_list[0].num_graphs == 1
+
+        num_graphs += data_list[0].num_graphs
+
+    assert len(data_loader) > 0
+    assert num_graphs == len(data_loader.dataset)
+
+
+def test_bucketed_sampler_loader():
+    args = get_args_parser_train().parse_args()
+    args.sampler = 'bucketed'
+    args.batch_size = 8
+    args.workers = 0
+
+    statistics = Statistics.load('data/statistics.json')
+
+    data_loader = get_dataloader(
+        args, 'data/train.h5', statistics.atomic_numbers, statistics.r_max
+    )
+
+    indices = []
+    for data_list in data_loader:
+        for data in data_list:
+            indices.extend(data.idx.tolist())
+
+    assert sorted(indices) == list(range(len(data_loader.dataset)))
+
+
+if __name__ == '__main__':
+    test_budget_sampler()
+    test_bucketed_sampler()
+    test_budget_sampler_loader()
+    test_bucketed_sampler_loader()
@@ -0,0 +1,144 @@
+import os
+import socket
+
+import torch
+import torch.multiprocessing as mp
+from accelerate import Accelerator
+
+from equitrain import get_args_parser_train
+from equitrain.data import Statistics
+from equitrain.data.loaders import get_dataloader
+from equitrain.data.samplers import BalancedBatchSampler
+from equitrain.logger import FileLogger
+from equitrain.train_timer import StepTimer
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _run_balanced_sampler(rank, world_size, port):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    os.environ['RANK'] = str(rank)
+    os.environ['LOCAL_RANK'] = str(rank)
+    os.environ['WORLD_SIZE'] = str(world_size)
+
+    accelerator = Accelerator(cpu=True)
+
+    assert accelerator.num_processes == world_size
+
+    args = get_args_parser_train().parse_args([])
+    args.sampler = 'budget'
+    args.batch_max_nodes = 100
+    args.batch_max_edges = 3000
+    args.workers = 0
+    args.pin_memory = False
+
+    statistics = Statistics.load('data/statistics.json')
+
+    data_loader = get_dataloader(
+        args,
+        'data/train.h5',
+        statistics.atomic_numbers,
+        statistics.r_max,
+        accelerator,
+    )
+
+    assert isinstance(data_loader.batch_sampler.batch_sampler, BalancedBatchSampler)
+
+    step_timer = StepTimer(accelerator)
+
+    indices = []
+    num_edges = []
+    num_sub_batches = []
+
+    step_timer.start()
+    for data_list in data_loader:
+        num_sub_batches.append(len(data_list))
+        num_edges.append(sum(data.num_edges for data in data_list))
+        for data in data_list:
+            indices.extend(data.idx.tolist())
+        step_timer.stop()
+        step_timer.start()
+
+    assert len(step_timer.times) == len(data_loader)
+
+    # Steps of processes that ran more steps than others are not gathered
+    times = step_timer.times.copy()
+    if rank == 0:
+        step_timer.times.append(1e3)
+    assert step_timer.gather().shape == (world_size, len(data_loader))
+    step_timer.times = times
+
+    num_sub_batches = accelerator.gather(torch.tensor(num_sub_batches))
+    num_edges = accelerator.gather(torch.tensor(num_edges, dtype=torch.float64))
+    # Number of structures differs between processes
+    indices = accelerator.pad_across_processes(torch.tensor(indices), pad_index=-1)
+    indices = accelerator.gather(indices)
+
+    num_sub_batches = num_sub_batches.reshape(world_size, -1)
+    num_edges = num_edges.reshape(world_size, -1)
+
+    # Each process performs exactly one pass per step
+    assert torch.all(num_sub_batches == 1)
+    # All structures are used
+    assert set(indices.tolist()) - {-1} == set(range(len(data_loader.dataset)))
+    # Work is balanced between processes
+    imbalance = (num_edges.max(dim=0).values / num_edges.mean(dim=0)).mean()
+    assert imbalance < 1.25, imbalance
+
+    logger = FileLogger(enable_logging=rank == 0, verbosity=1)
+    step_timer.log(logger, epoch=1)
+
+    accelerator.end_training()
+
+
+def test_balanced_sampler():
+    num_nodes = torch.randint(1, 100, (1000,)).numpy()
+    num_edges = 20 * num_nodes
+
+    samplers = [
+        BalancedBatchSampler(
+            num_nodes,
+            num_edges,
+            max_nodes=300,
+            max_edges=6000,
+            num_replicas=3,
+            rank=rank,
+            seed=7,
+        )
+        for rank in range(3)
+    ]
+    sampler_all = BalancedBatchSampler(
+        num_nodes, num_edges, max_nodes=300, max_edges=6000, num_replicas=3, seed=7
+    )
+
+    batches = [list(sampler) for sampler in samplers]
+    batches_all = list(sampler_all)
+
+    assert len(batches_all) % 3 == 0
+    assert all(len(b) == len(batches_all) // 3 for b in batches)
+
+    for rank in range(3):
+        assert batches[rank] == batches_all[rank::3]
+
+    indices = sorted(i for b in batches_all for i in b)
+    assert indices == list(range(len(num_nodes)))
+
+
+def test_balanced_sampler_gloo():
+    world_size = 2
+    mp.spawn(
+        _run_balanced_sampler,
+        args=(world_size, _free_port()),
+        nprocs=world_size,
+        join=True,
+    )
+
+
+if __name__ == '__main__':
+    test_balanced_sampler()
+    test_balanced_sampler_gloo()
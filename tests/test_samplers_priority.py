@@ -0,0 +1,191 @@
+import os
+import socket
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from accelerate import Accelerator
+
+from equitrain import get_args_parser_train
+from equitrain.data import Statistics
+from equitrain.data.loaders import get_dataloader
+from equitrain.data.samplers_priority import (
+    PrioritySampler,
+    SumTree,
+    get_priority_sampler,
+)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _run_priority_sampler(rank, world_size, port):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    os.environ['RANK'] = str(rank)
+    os.environ['LOCAL_RANK'] = str(rank)
+    os.environ['WORLD_SIZE'] = str(world_size)
+
+    accelerator = Accelerator(cpu=True)
+
+    sampler = PrioritySampler(100, seed=1)
+    sampler.set_priorities(torch.ones(100))
+
+    # Processes update different and overlapping structures
+    sampler.update(
+        torch.arange(10 * rank, 10 * rank + 20), torch.full((20,), rank + 2.0)
+    )
+    if rank == 0:
+        sampler.update(torch.tensor([99]), torch.tensor([50.0]))
+
+    sampler.synchronize(accelerator)
+
+    priorities = torch.tensor(sampler.tree.priorities)
+    priorities_all = accelerator.gather(priorities[None])
+
+    # All processes hold identical priorities, later processes take precedence
+    assert torch.all(priorities_all == priorities)
+    assert torch.all(priorities[0:10] == 2.0)
+    assert torch.all(priorities[10:30] == 3.0)
+    assert torch.all(priorities[30:99] == 1.0)
+    assert priorities[99] == 50.0
+    assert np.isclose(sampler.tree.total, priorities.sum().item())
+
+    # Nothing left to exchange
+    sampler.synchronize(accelerator)
+    assert torch.all(torch.tensor(sampler.tree.priorities) == priorities)
+
+    accelerator.end_training()
+
+
+def test_sum_tree():
+    rng = np.random.default_rng(1)
+
+    for n in [1, 2, 7, 1000]:
+        tree = SumTree(n)
+        priorities = rng.uniform(size=n)
+        tree.update(np.arange(n), priorities)
+
+        assert np.isclose(tree.total, priorities.sum())
+
+        indices = rng.integers(0, n, size=min(n, 50))
+        priorities[indices] = rng.uniform(size=len(indices))
+        tree.update(indices, priorities[indices])
+
+        assert np.isclose(tree.total, priorities.sum())
+        assert np.array_equal(tree.priorities, priorities)
+
+        # Leaves are found by the cumulative sum of priorities
+        values = rng.uniform(0.0, tree.total, size=100)
+        expected = np.searchsorted(np.cumsum(priorities), values, side='right')
+        assert np.array_equal(tree.find(values), expected)
+
+    # Last priority wins for repeated indices, for small and large updates
+    for n in [4, 1000]:
+        tree = SumTree(n)
+        tree.update([0, 1, 0], [1.0, 2.0, 3.0])
+        assert np.array_equal(tree.priorities[:3], [3.0, 2.0, 0.0])
+        assert tree.total == 5.0
+
+
+def test_priority_sampler():
+    n = 1000
+
+    sampler = PrioritySampler(n, threshold=10.0, seed=3)
+
+    # Without priorities, all structures are drawn exactly once
+    assert sorted(sampler) == list(range(n))
+
+    errors = torch.ones(n)
+    errors[:100] = 9.0
+    # Zero errors and errors above threshold receive the mean priority
+    errors[100:110] = 0.0
+    errors[110:120] = 100.0
+    sampler.set_priorities(errors)
+
+    mean = (100 * 9.0 + 880 * 1.0) / 980
+    assert np.allclose(sampler.tree.priorities[100:120], mean)
+
+    counts = np.bincount(
+        np.concatenate([list(sampler) for _ in range(20)]), minlength=n
+    )
+    ratio = counts[:100].mean() / counts[200:].mean()
+    assert 7.5 < ratio < 10.5, ratio
+
+    # Updates take effect after synchronizing
+    sampler.update(torch.arange(100), torch.ones(100))
+    assert np.all(sampler.tree.priorities[:100] == 9.0)
+    sampler.synchronize()
+    assert np.all(sampler.tree.priorities[:100] == 1.0)
+    assert np.isclose(sampler.tree.total, sampler.tree.priorities.sum())
+    counts = np.bincount(
+        np.concatenate([list(sampler) for _ in range(20)]), minlength=n
+    )
+    ratio = counts[:100].mean() / counts[200:].mean()
+    assert 0.8 < ratio < 1.2, ratio
+
+    # Sampling is deterministic for a given seed and epoch
+    sampler.set_epoch(5)
+    indices = list(sampler)
+    sampler.set_epoch(5)
+    assert list(sampler) == indices
+    assert len(sampler.updated_indices) == 0
+
+
+def test_priority_sampler_loader():
+    args = get_args_parser_train().parse_args([])
+    args.weighted_sampler = True
+    args.batch_size = 4
+    args.workers = 0
+
+    statistics = Statistics.load('data/statistics.json')
+
+    data_loader = get_dataloader(
+        args,
+        'data/train.h5',
+        statistics.atomic_numbers,
+        statistics.r_max,
+        Accelerator(cpu=True),
+        weighted_sampler=True,
+    )
+
+    sampler = get_priority_sampler(data_loader)
+    assert sampler is not None
+
+    indices = [
+        i for data_list in data_loader for data in data_list for i in data.idx.tolist()
+    ]
+    assert sorted(indices) == list(range(len(data_loader.dataset)))
+
+    # Only the first structure can be drawn
+    errors = torch.zeros(len(data_loader.dataset))
+    sampler.set_priorities(errors)
+    sampler.update(torch.arange(1, len(errors)), torch.full((len(errors) - 1,), 1e-12))
+    sampler.update(torch.tensor([0]), torch.tensor([1e12]))
+    sampler.synchronize()
+
+    indices = [
+        i for data_list in data_loader for data in data_list for i in data.idx.tolist()
+    ]
+    assert len(indices) == len(data_loader.dataset)
+    assert np.mean(np.array(indices) == 0) > 0.99
+
+
+def test_priority_sampler_gloo():
+    world_size = 2
+    mp.spawn(
+        _run_priority_sampler,
+        args=(world_size, _free_port()),
+        nprocs=world_size,
+        join=True,
+    )
+
+
+if __name__ == '__main__':
+    test_sum_tree()
+    test_priority_sampler()
+    test_priority_sampler_loader()
+    test_priority_sampler_gloo()
@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+
+from equitrain import get_args_parser_train
+from equitrain.data import Statistics
+from equitrain.data.format_hdf5 import DatasetIndex, HDF5GraphDataset
+from equitrain.data.format_shm import SharedGraphDataset, SharedGraphStore
+from equitrain.data.loaders import get_dataloader
+
+
+def _open_store(root):
+    statistics = Statistics.load('data/statistics.json')
+    store = SharedGraphStore.open_or_build('data/train.h5', statistics.r_max, root)
+    return str(store.path)
+
+
+def test_shared_store():
+    statistics = Statistics.load('data/statistics.json')
+
+    store = SharedGraphStore.open_or_build(
+        'data/train.h5', statistics.r_max, 'test_shared_store'
+    )
+    dataset = SharedGraphDataset(store, statistics.r_max, statistics.atomic_numbers)
+    dataset_ref = HDF5GraphDataset(
+        'data/train.h5', statistics.r_max, statistics.atomic_numbers
+    )
+
+    assert len(dataset) == len(dataset_ref)
+
+    # Graphs are the same as read from the data file
+    graphs = dataset.__getitems__(range(len(dataset)))
+    for graph, graph_ref in zip(graphs, dataset_ref):
+        assert set(graph.keys()) == set(graph_ref.keys())
+        for key in graph_ref.keys():
+            if torch.is_tensor(graph_ref[key]):
+                assert torch.equal(graph[key], graph_ref[key]), key
+            else:
+                assert graph[key] == graph_ref[key], key
+
+    index = dataset.index
+    index_ref = DatasetIndex.from_dataset(dataset_ref, r_max=statistics.r_max)
+    for name in ['num_atoms', 'elements', 'energy', 'num_edges']:
+        assert np.array_equal(getattr(index, name), getattr(index_ref, name)), name
+
+    # Existing stores are attached to without being rebuilt
+    mtime = (store.path / SharedGraphStore.META).stat().st_mtime_ns
+    store = SharedGraphStore.open_or_build(
+        'data/train.h5', statistics.r_max, 'test_shared_store', build=False
+    )
+    assert (store.path / SharedGraphStore.META).stat().st_mtime_ns == mtime
+
+    # Pickled stores attach to the same files instead of copying arrays
+    store_copy = pickle.loads(pickle.dumps(store))
+    assert np.array_equal(
+        store_copy.read_record(-1)['positions'], store.read_record(-1)['positions']
+    )
+    assert len(pickle.dumps(store)) < 1024
+
+    with pytest.raises(RuntimeError):
+        SharedGraphStore.open_or_build(
+            'data/train.h5', statistics.r_max + 1.0, 'test_shared_store', build=False
+        )
+
+    with pytest.raises(ValueError):
+        SharedGraphDataset(store, statistics.r_max + 1.0, statistics.atomic_numbers)
+
+
+def test_shared_store_stale():
+    statistics = Statistics.load('data/statistics.json')
+    root = Path('test_shared_store/stale')
+
+    # Data files with the same name in different directories
+    filenames = [Path(f'test_shared_store/data-{i}/train.h5') for i in range(2)]
+    for filename in filenames:
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy('data/train.h5', filename)
+
+    stores = [
+        SharedGraphStore.open_or_build(filename, statistics.r_max, root)
+        for filename in filenames
+    ]
+    path = stores[0].path
+    path.with_name(f'{path.name}.tmp').mkdir()
+
+    # Stores of earlier versions of a data file are removed when a new one is built
+    stat = filenames[0].stat()
+    os.utime(filenames[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    store = SharedGraphStore.open_or_build(filenames[0], statistics.r_max, root)
+
+    assert store.path != path
+    assert not path.exists()
+    assert not path.with_name(f'{path.name}.tmp').exists()
+    assert not path.with_name(f'{path.name}.lock').exists()
+    assert (stores[1].path / SharedGraphStore.META).exists()
+    assert sorted(root.iterdir()) == sorted(
+        [
+            *[s.path for s in [store, stores[1]]],
+            *[s.path.with_name(f'{s.path.name}.lock') for s in [store, stores[1]]],
+        ]
+    )
+
+
+def test_shared_store_concurrent():
+    # Processes started at the same time build the store only once
+    with multiprocessing.get_context('spawn').Pool(3) as pool:
+        paths = pool.map(_open_store, ['test_shared_store_concurrent'] * 3)
+
+    assert len(set(paths)) == 1
+
+
+def test_shared_store_loader():
+    args = get_args_parser_train().parse_args()
+    args.batch_size = 4
+    args.workers = 2
+    args.shared_memory_store = True
+    args.shared_memory_dir = 'test_shared_store'
+
+    statistics = Statistics.load('data/statistics.json')
+
+    data_loader = get_dataloader(
+        args, 'data/train.h5', statistics.atomic_numbers, statistics.r_max
+    )
+    assert isinstance(data_loader.dataset, SharedGraphDataset)
+
+    indices = []
+    for data_list in data_loader:
+        for data in data_list:
+            indices.extend(data.idx.tolist())
+
+    assert sorted(indices) == list(range(len(data_loader.dataset)))
+
+
+if __name__ == '__main__':
+    test_shared_store()
+    test_shared_store_stale()
+    test_shared_store_concurrent()
+    test_shared_store_loader()
@@ -0,0 +1,110 @@
+import pickle
+
+import numpy as np
+import torch_geometric
+
+from equitrain.data import (
+    Statistics,
+    StatisticsAccumulator,
+    compute_atomic_numbers,
+    compute_average_atomic_energies,
+    compute_statistics,
+    get_atomic_energies,
+)
+from equitrain.data.format_hdf5 import HDF5Dataset, HDF5GraphDataset
+
+
+def test_statistics_accumulator():
+    statistics = Statistics.load('data/statistics.json')
+
+    with HDF5Dataset('data/train.h5') as dataset:
+        accumulator = StatisticsAccumulator.from_dataset(
+            dataset, r_max=statistics.r_max, batch_size=7
+        )
+        atomic_numbers_ref = compute_atomic_numbers(dataset)
+        atomic_energies_ref = compute_average_atomic_energies(
+            dataset, statistics.atomic_numbers
+        )
+
+        # Accumulators of parts of the dataset are combined
+        parts = [StatisticsAccumulator(r_max=statistics.r_max) for _ in range(3)]
+        for i in range(len(dataset)):
+            parts[i % 3].update(dataset.read_record(i))
+
+    merged = pickle.loads(pickle.dumps(parts[0]))
+    for part in parts[1:]:
+        merged.merge(part)
+
+    assert accumulator.num_structures == len(dataset)
+    assert accumulator.atomic_numbers == atomic_numbers_ref
+
+    atomic_energies = accumulator.atomic_energies(statistics.atomic_numbers)
+    for z in statistics.atomic_numbers:
+        assert np.isclose(atomic_energies[z], atomic_energies_ref[z]), z
+
+    with HDF5GraphDataset(
+        'data/train.h5', statistics.r_max, statistics.atomic_numbers
+    ) as graph_dataset:
+        data_loader = torch_geometric.loader.DataLoader(
+            graph_dataset, batch_size=5, shuffle=False, drop_last=False
+        )
+        avg_num_neighbors, mean, rms = compute_statistics(
+            data_loader, atomic_energies, statistics.atomic_numbers
+        )
+
+    for result in [accumulator, merged]:
+        assert np.isclose(result.avg_num_neighbors, avg_num_neighbors)
+        # The mean vanishes for fitted E0s, graphs hold single precision energies
+        assert np.isclose(result.energy_mean(atomic_energies), mean, atol=1e-6)
+        assert np.isclose(result.forces_rms, rms)
+
+
+def test_average_atomic_energies():
+    with HDF5Dataset('data/train.h5') as dataset:
+        z_table = compute_atomic_numbers(dataset)
+        records = dataset.read_records(range(len(dataset)))
+
+        # Dense design matrix of element counts
+        A = np.array(
+            [[np.sum(r['atomic_numbers'] == z) for z in z_table] for r in records],
+            dtype=np.float64,
+        )
+        b = np.array([r['energy'] for r in records])
+
+        E0s_ref = np.linalg.lstsq(A, b, rcond=None)[0]
+        atomic_energies = compute_average_atomic_energies(
+            dataset, z_table, batch_size=7
+        )
+        assert np.allclose([atomic_energies[z] for z in z_table], E0s_ref)
+
+        ridge = 0.1
+        E0s_ref = np.linalg.solve(A.T @ A + ridge * np.identity(len(z_table)), A.T @ b)
+        atomic_energies = compute_average_atomic_energies(dataset, z_table, ridge=ridge)
+        assert np.allclose([atomic_energies[z] for z in z_table], E0s_ref)
+
+        # Subsamples are reproducible
+        atomic_energies = compute_average_atomic_energies(
+            dataset, z_table, max_n=len(dataset) // 2, seed=1
+        )
+        assert atomic_energies == compute_average_atomic_energies(
+            dataset, z_table, max_n=len(dataset) // 2, seed=1
+        )
+
+        # Subsamples take precedence over the sums of all structures
+        accumulator = StatisticsAccumulator.from_dataset(dataset)
+        assert atomic_energies == get_atomic_energies(
+            'average',
+            dataset,
+            z_table,
+            statistics=accumulator,
+            max_n=len(dataset) // 2,
+            seed=1,
+        )
+        assert atomic_energies != get_atomic_energies(
+            'average', dataset, z_table, statistics=accumulator
+        )
+
+
+if __name__ == '__main__':
+    test_statistics_accumulator()
+    test_average_atomic_energies()
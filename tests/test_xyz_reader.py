@@ -0,0 +1,130 @@
+import io
+import os
+from dataclasses import fields
+from pathlib import Path
+
+import ase.io
+import numpy as np
+
+from equitrain.data import Configuration
+from equitrain.data.format_xyz import XYZReader
+from equitrain.data.format_xyz.fast_reader import read_extxyz
+
+
+def assert_configurations_equal(configuration, configuration_ref):
+    for field in fields(Configuration):
+        value = getattr(configuration, field.name)
+        value_ref = getattr(configuration_ref, field.name)
+
+        assert np.array_equal(value, value_ref), field.name
+        assert np.asarray(value).dtype == np.asarray(value_ref).dtype, field.name
+
+
+def read_configurations(text, **keys):
+    """Read configurations with the fast reader and ASE, and the number of
+    frames read by the fast path."""
+    configurations_ref = [
+        Configuration.from_atoms(atoms, **keys)
+        for atoms in ase.io.iread(io.StringIO(text), index=':', format='extxyz')
+    ]
+
+    configurations = list(read_extxyz(text.encode(), **keys))
+    num_fast = sum(isinstance(c, Configuration) for c in configurations)
+    configurations = [
+        c if isinstance(c, Configuration) else Configuration.from_atoms(c, **keys)
+        for c in configurations
+    ]
+
+    assert len(configurations) == len(configurations_ref)
+    for configuration, configuration_ref in zip(configurations, configurations_ref):
+        assert_configurations_equal(configuration, configuration_ref)
+
+    return num_fast
+
+
+def test_fast_reader():
+    text = Path('data.xyz').read_text()
+    num_frames = text.count('config_type=')
+
+    assert read_configurations(text) == num_frames
+    assert (
+        read_configurations(
+            text, energy_key='energy_corrected', stress_key='stress_corrected'
+        )
+        == num_frames
+    )
+
+
+def test_fast_reader_fallback():
+    frame = (
+        '2\n'
+        'energy=-2 virials="1 2 3 4 5 6 7 8 9" info="_JSON [1, 2]" pbc="T F T" '
+        'Lattice="5 0 0 0 5 0 0 0 5" stress="1 2 3 2 4 5 3 5 6" '
+        'Properties=species:S:1:pos:R:3:forces:R:3:tag:I:1:charge:R:1\n'
+        'H 0.0 0.0 0.0 1.0 2.0 3.0 4 0.5\n'
+        'h 0.0 0.0 0.7 1.0 2.0 3.0 4 -0.5\n'
+    )
+    # Keys without values, logical columns and isolated atoms are read by ASE
+    frames_ase = [
+        frame.replace('energy=-2', 'energy=-2 flag'),
+        frame.replace('charge:R:1', 'charge:L:1')
+        .replace(' 0.5\n', ' T\n')
+        .replace(' -0.5\n', ' F\n'),
+        '1\nenergy=-1.5 stress="0 0 0 0 0 0 0 0 0" Properties=species:S:1:pos:R:3:'
+        'forces:R:3\nMg 0.0 0.0 0.0 0.0 0.0 0.0\n',
+    ]
+
+    text = frame + ''.join(frames_ase) + frame + frame
+    assert read_configurations(text) == 3
+    assert read_configurations(text, forces_key='tag', dipole_key='info') == 3
+
+
+def test_xyz_reader():
+    symbols = ['Mg', 'O']
+    text = (
+        ''.join(
+            f'1\nconfig_type=IsolatedAtom energy_corrected=-{i + 1} pbc="F F F"\n{symbol} 0 0 0\n'
+            for i, symbol in enumerate(symbols)
+        )
+        + Path('data.xyz').read_text()
+    )
+
+    Path('test_preprocess').mkdir(exist_ok=True)
+    Path('test_preprocess/reader.xyz').write_text(text)
+
+    readers = [
+        XYZReader(
+            'test_preprocess/reader.xyz',
+            energy_key='energy_corrected',
+            extract_atomic_numbers=True,
+            extract_atomic_energies=True,
+            fast=fast,
+        )
+        for fast in [False, True]
+    ]
+    records_ref, records = [list(reader.records()) for reader in readers]
+
+    assert readers[1].atomic_numbers == readers[0].atomic_numbers
+    assert (
+        readers[1].atomic_energies == readers[0].atomic_energies == {12: -1.0, 8: -2.0}
+    )
+
+    # More ranges than are parsed ahead by the workers
+    records_parallel = list(readers[1].records(workers=2, range_size=1 << 12))
+    assert os.path.getsize('test_preprocess/reader.xyz') > 4 * (1 << 12)
+
+    assert len(records) == len(records_ref) == text.count('config_type=') - 2
+    assert len(records_parallel) == len(records_ref)
+    for record, record_parallel, record_ref in zip(
+        records, records_parallel, records_ref
+    ):
+        assert record.keys() == record_parallel.keys() == record_ref.keys()
+        for key, value in record_ref.items():
+            assert np.array_equal(record[key], value), key
+            assert np.array_equal(record_parallel[key], value), key
+
+
+if __name__ == '__main__':
+    test_fast_reader()
+    test_fast_reader_fallback()
+    test_xyz_reader()